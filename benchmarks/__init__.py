@@ -0,0 +1,3 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
@@ -0,0 +1,235 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+End-to-end benchmark of the evaluation pipeline: `ExperimentSession.run` (what `loader.main` runs) against
+an in-memory `LocalLangSmith` and FAKE chat models with a fixed latency, so the measured time beyond that latency
+is the helper's own overhead.
+
+    python -m benchmarks.bench_pipeline --examples 200 --providers 3 --repetitions 2 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from typing import Any, TypedDict
+
+from benchmarks.fake_langsmith import create_client, use_default_client
+
+from langsmith_evaluation_helper.llm.model import ChatModelName
+from langsmith_evaluation_helper.llm.usage import UsageSummary
+from langsmith_evaluation_helper.loader import ExperimentSession
+from langsmith_evaluation_helper.local_langsmith import LocalLangSmith
+from langsmith_evaluation_helper.metrics import StageStats, percentile, stage_metrics
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+# The FAKE models with a fixed latency and no failures, so the time beyond that latency is the helper's overhead.
+BENCHMARK_PROVIDERS = [ChatModelName.FAKE, ChatModelName.FAKE_FAST, ChatModelName.FAKE_SLOW, ChatModelName.FAKE_FLAKY]
+DATASET_NAME = "benchmark"
+
+
+class BenchmarkReport(TypedDict):
+    examples: int
+    providers: int
+    repetitions: int
+    latency_ms: float
+    runs: int
+    feedback: int
+    wall_seconds: float
+    examples_per_second: float
+    overhead_p50_ms: float
+    overhead_p99_ms: float
+    peak_rss_mb: float
+    peak_traced_mb: float | None
+    stages: list[StageStats]
+    usage: dict[str, UsageSummary]
+
+
+def create_config(
+    providers: int, repetitions: int, latency_ms: float, max_concurrency: int | None, journal: str
+) -> dict[str, Any]:
+    if not 1 <= providers <= len(BENCHMARK_PROVIDERS):
+        raise ValueError(f"Invalid providers: {providers}. Use 1 to {len(BENCHMARK_PROVIDERS)}")
+    return {
+        "description": "Benchmark of the evaluation pipeline",
+        "prompt": {"name": "pipeline/prompt.py", "type": "python", "entry_function": "toxic_example_prompts"},
+        "evaluators_file_path": "pipeline/evaluations.py",
+        "providers": [
+            {
+                "id": name.name,
+                "config": {
+                    "fake": {
+                        "responses": ["Not toxic"],
+                        "latency_ms": latency_ms,
+                        "latency_distribution": "fixed",
+                        "error_rate": 0,
+                        "rate_limit_rate": 0,
+                    }
+                },
+            }
+            for name in BENCHMARK_PROVIDERS[:providers]
+        ],
+        "tests": {
+            "dataset_name": DATASET_NAME,
+            "experiment_prefix": "benchmark",
+            "num_repetitions": repetitions,
+            "max_concurrency": max_concurrency,
+            "journal": journal,
+            "assert": [
+                {"type": "length", "value": "<= 20", "pass_rate": True},
+                {"type": "exact-match", "reference_key": "output_label", "pass_rate": True},
+            ],
+        },
+    }
+
+
+def seed_dataset(backend: LocalLangSmith, examples: int) -> str:
+    return backend.create_dataset(
+        DATASET_NAME,
+        [
+            {
+                "inputs": {"text": f"Benchmark query number {index}"},
+                "outputs": {"output_label": "Toxic" if index % 2 else "Not toxic"},
+            }
+            for index in range(examples)
+        ],
+    )
+
+
+def parse_time(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def target_overheads(backend: LocalLangSmith, latency: float) -> list[float]:
+    """
+    Seconds each target call took beyond the model latency, from the root runs that `evaluate` traced.
+    """
+    experiments = {session["id"] for session in backend.records("sessions") if session.get("reference_dataset_id")}
+    return [
+        (parse_time(run["end_time"]) - parse_time(run["start_time"])).total_seconds() - latency
+        for run in backend.records("runs")
+        if run.get("parent_run_id") is None
+        and run.get("reference_example_id") is not None
+        and str(run.get("session_id")) in experiments
+        and run.get("end_time") is not None
+    ]
+
+
+def experiment_usage(backend: LocalLangSmith) -> dict[str, UsageSummary]:
+    """The token usage recorded in the metadata of each experiment, by experiment name."""
+    return {
+        session["name"]: session["extra"]["metadata"]["usage"]
+        for session in backend.records("sessions")
+        if "usage" in ((session.get("extra") or {}).get("metadata") or {})
+    }
+
+
+def run_benchmark(
+    examples: int = 100,
+    providers: int = 2,
+    repetitions: int = 1,
+    latency_ms: float = 10.0,
+    max_concurrency: int | None = None,
+    trace_memory: bool = False,
+) -> BenchmarkReport:
+    backend = LocalLangSmith(":memory:")
+    seed_dataset(backend, examples)
+    client = create_client(backend)
+    latency = latency_ms / 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = os.path.join(directory, "journal.jsonl")
+        config = create_config(providers, repetitions, latency_ms, max_concurrency, journal)
+        session = ExperimentSession(os.path.join(BENCHMARK_DIR, "config.yml"), config, client=client)
+        with use_default_client(client):
+            if trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            asyncio.run(session.run())
+            wall_seconds = time.perf_counter() - started
+            peak_traced_mb = None
+            if trace_memory:
+                peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+
+    # Traces are uploaded in the background; wait for them before reading the runs.
+    if client.tracing_queue is not None:
+        client.tracing_queue.join()
+    overheads = target_overheads(backend, latency)
+    total = examples * providers * repetitions
+    return {
+        "examples": examples,
+        "providers": providers,
+        "repetitions": repetitions,
+        "latency_ms": latency_ms,
+        "runs": len(overheads),
+        "feedback": len(backend.records("feedback")),
+        "wall_seconds": wall_seconds,
+        "examples_per_second": total / wall_seconds,
+        "overhead_p50_ms": percentile(overheads, 50) * 1000,
+        "overhead_p99_ms": percentile(overheads, 99) * 1000,
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_traced_mb": peak_traced_mb,
+        "stages": stage_metrics.stats(),
+        "usage": experiment_usage(backend),
+    }
+
+
+def format_report(report: BenchmarkReport) -> str:
+    lines = [
+        f"{report['examples']} examples x {report['providers']} providers x {report['repetitions']} repetitions"
+        f" ({report['latency_ms']:g} ms model latency)",
+        f"  runs traced:       {report['runs']} ({report['feedback']} feedback)",
+        f"  wall time:         {report['wall_seconds']:.2f} s",
+        f"  throughput:        {report['examples_per_second']:.1f} examples/s",
+        f"  overhead p50/p99:  {report['overhead_p50_ms']:.2f} / {report['overhead_p99_ms']:.2f} ms per example",
+        f"  peak RSS:          {report['peak_rss_mb']:.1f} MB",
+    ]
+    if report["peak_traced_mb"] is not None:
+        lines.append(f"  peak traced:       {report['peak_traced_mb']:.1f} MB")
+    for name, usage in report["usage"].items():
+        lines.append(
+            f"  usage {name}: {usage['input_tokens']} in / {usage['output_tokens']} out tokens,"
+            f" {usage['output_tokens_per_second'] or 0:.1f} out tokens/s"
+        )
+    lines.append("  stage p50/p99 (ms):")
+    for stage in report["stages"]:
+        lines.append(
+            f"    {stage['stage']:<34} {stage['provider'] or '':<12} {stage['p50'] * 1000:8.2f} / {stage['p99'] * 1000:8.2f}"
+            f" ({stage['count']} calls, {stage['errors']} errors)"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation pipeline with a fake LLM and LangSmith.")
+    parser.add_argument("--examples", type=int, default=100, help="Number of dataset examples (N)")
+    parser.add_argument("--providers", type=int, default=2, help="Number of providers (M)")
+    parser.add_argument("--repetitions", type=int, default=1, help="Number of repetitions (R)")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Latency of each fake model call")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="tests.max_concurrency of the config")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the tracemalloc peak (slower)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        examples=args.examples,
+        providers=args.providers,
+        repetitions=args.repetitions,
+        latency_ms=args.latency_ms,
+        max_concurrency=args.max_concurrency,
+        trace_memory=args.trace_memory,
+    )
+    print(json.dumps(report) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import contextlib
+import json
+from collections.abc import Iterator
+from typing import Any
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from langsmith import Client
+from requests.adapters import BaseAdapter
+
+from langsmith_evaluation_helper.local_langsmith import LocalLangSmith
+
+BENCHMARK_API_URL = "http://langsmith.benchmark"
+
+
+class LocalLangSmithAdapter(BaseAdapter):
+    """
+    `requests` transport adapter that answers LangSmith API calls from a `LocalLangSmith` in the same process,
+    so benchmarks measure the pipeline rather than a local HTTP server.
+    """
+
+    def __init__(self, backend: LocalLangSmith) -> None:
+        super().__init__()
+        self.backend = backend
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:  # type: ignore[override]
+        url = urlsplit(request.url or "")
+        body = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body
+        status, payload = self.backend.handle(
+            request.method or "GET",
+            url.path.rstrip("/"),
+            parse_qs(url.query),
+            json.loads(body) if isinstance(body, str) and body else None,
+        )
+
+        response = requests.Response()
+        response.status_code = status
+        response.url = request.url or ""
+        response.request = request
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(payload).encode("utf-8")
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def create_client(backend: LocalLangSmith) -> Client:
+    """LangSmith `Client` whose requests, including background trace uploads, are served by `backend`."""
+    client = Client(api_url=BENCHMARK_API_URL, api_key="benchmark")
+    client.session.mount(BENCHMARK_API_URL, LocalLangSmithAdapter(backend))
+    return client
+
+
+@contextlib.contextmanager
+def use_default_client(client: Client) -> Iterator[None]:
+    """
+    Make `client` the process-wide default of langsmith and langchain while the context is active.
+    Runs that are not given a client, such as the traces of evaluators, fall back to that default.
+    """
+    with (
+        mock.patch("langsmith.run_trees._CLIENT", client),
+        mock.patch("langchain_core.tracers.langchain._CLIENT", client),
+    ):
+        yield
@@ -0,0 +1,17 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from typing import Any
+
+from langsmith.schemas import Example, Run
+
+
+def correct_label(run: Run, example: Example) -> dict[str, Any]:
+    output = run.outputs.get("output") if run.outputs is not None else None
+    reference = example.outputs.get("output_label") if example.outputs is not None else None
+    return {"score": output == reference}
+
+
+evaluators: list[Any] = [correct_label]
+summary_evaluators: list[Any] = []
@@ -0,0 +1,29 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+import pytest
+
+from benchmarks.bench_pipeline import format_report, run_benchmark
+
+# Generous budget so only real regressions of the per-example overhead fail CI, not noisy runners.
+MAX_OVERHEAD_P99_MS = float(os.getenv("BENCHMARK_MAX_OVERHEAD_P99_MS", "1000"))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("examples,providers,repetitions", [(50, 2, 1), (20, 3, 2)])
+def test_pipeline_overhead(examples: int, providers: int, repetitions: int) -> None:
+    report = run_benchmark(examples=examples, providers=providers, repetitions=repetitions, latency_ms=5)
+    print(format_report(report))
+
+    assert report["runs"] == examples * providers * repetitions
+    # correct_label and the two deterministic asserts score every run, plus the opted-in pass rate per assert and experiment.
+    assert report["feedback"] == report["runs"] * 3 + providers * 2
+    assert report["overhead_p99_ms"] < MAX_OVERHEAD_P99_MS
+    targets = [stage for stage in report["stages"] if stage["stage"] == "target"]
+    assert len(targets) == providers
+    assert all(stage["count"] == examples * repetitions and stage["errors"] == 0 for stage in targets)
+    assert len(report["usage"]) == providers
+    assert all(usage["calls"] == examples * repetitions for usage in report["usage"].values())
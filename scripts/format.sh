@@ -5,7 +5,7 @@ if [ -d 'venv' ] ; then
     export PREFIX="venv/bin/"
 fi
 
-export SOURCE_FILES="src cookbook tests"
+export SOURCE_FILES="src cookbook tests benchmarks"
 
 set -x
 ${PREFIX}ruff check ${SOURCE_FILES} --fix --unsafe-fixes
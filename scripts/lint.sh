@@ -4,7 +4,7 @@ export PREFIX=""
 if [ -d '.venv' ] ; then
     export PREFIX=".venv/bin/"
 fi
-export SOURCE_FILES="src cookbook tests"
+export SOURCE_FILES="src cookbook tests benchmarks"
 set -x
 
 ${PREFIX}mypy ${SOURCE_FILES}
@@ -2,25 +2,41 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import functools
+import json
+import threading
 from collections.abc import Callable
-from typing import Any, Literal, Optional, TypedDict
+from concurrent.futures import Future
+from typing import Any, Literal, NotRequired, Optional, TypedDict
 
+import numpy as np
+import numpy.typing as npt
 from langchain.prompts.prompt import PromptTemplate
+from langchain_core.embeddings import Embeddings
 from langsmith.evaluation import (
     EvaluationResult,
     EvaluationResults,
-    LangChainStringEvaluator,
 )
 from langsmith.schemas import Example, Run
 
-from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName
+from langsmith_evaluation_helper.deterministic_asserts import DETERMINISTIC_ASSERT_TYPES, compile_assert, score_runs
+from langsmith_evaluation_helper.llm.cache import ResponseCache
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName, fake_config_kwargs
+from langsmith_evaluation_helper.llm.rate_limit import get_rate_limiter
+
+# Result key of langchain's "embedding_distance" evaluator, kept so existing experiments stay comparable.
+SIMILAR_KEY = "embedding_cosine_distance"
 
 
 class BuiltinEvaluatorConfig(TypedDict):
-    type: Literal["length", "llm-judge", "similar"]
+    type: Literal[
+        "length", "llm-judge", "similar", "exact-match", "contains", "regex", "json-valid", "numeric-tolerance"
+    ]
     value: str
     label: Optional[str]  # noqa: UP007
     judge_provider: dict[Any, Any] | None
+    reference_key: NotRequired[str]
+    pass_rate: NotRequired[bool]
 
 
 class EvalResult(TypedDict):
@@ -28,52 +44,55 @@ class EvalResult(TypedDict):
     score: float
 
 
-Evaluator = Callable[[Run, Example], EvalResult | EvaluationResult | EvaluationResults]
+class JudgeResults(TypedDict):
+    results: list[EvalResult]
 
 
-def create_length_evaluator(evaluator_config: BuiltinEvaluatorConfig) -> Evaluator:
-    def length_evaluator(run: Run, example: Example) -> EvalResult:
+Evaluator = Callable[[Run, Example], EvalResult | JudgeResults | EvaluationResult | EvaluationResults]
+SummaryEvaluator = Callable[[list[Run], list[Example]], EvaluationResults]
+
+
+def create_deterministic_evaluator(evaluator_config: BuiltinEvaluatorConfig) -> Evaluator:
+    """
+    Evaluator for an assert that needs no model call. The config is parsed here, once, instead of on every run.
+    """
+    compiled = compile_assert(evaluator_config)
+
+    def deterministic_evaluator(run: Run, example: Example) -> EvalResult:
         output = run.outputs.get("output") if run.outputs is not None else None
-        if output is None:
-            return {"key": "length", "score": False}
+        return {"key": compiled.key, "score": compiled.score(output, compiled.get_reference(example))}
 
-        value = evaluator_config["value"]
-        score = False
+    deterministic_evaluator.__name__ = f"{evaluator_config['type'].replace('-', '_')}_evaluator"
+    return deterministic_evaluator
 
-        try:
-            if "<=" in value:
-                score = len(output) <= int(value.replace("<=", "").strip())
-            elif "<" in value:
-                score = len(output) < int(value.replace("<", "").strip())
-            elif ">=" in value:
-                score = len(output) >= int(value.replace(">=", "").strip())
-            elif ">" in value:
-                score = len(output) > int(value.replace(">", "").strip())
-            else:
-                raise ValueError
-        except Exception:
-            print(f"[Warning] Invalid integer value in evaluator_config['value']: {value}")
-            return {"key": "length", "score": False}
 
-        return {"key": "length", "score": score}
+def create_deterministic_summary_evaluator(evaluator_configs: list[BuiltinEvaluatorConfig]) -> SummaryEvaluator:
+    """
+    Summary evaluator reporting the pass rate of each deterministic assert over the whole experiment as
+    `<key>_pass_rate`. All runs are scored at once with the vectorized `score_batch` of the asserts.
+    """
+    compiled_asserts = [compile_assert(evaluator_config) for evaluator_config in evaluator_configs]
 
-    return length_evaluator
+    def deterministic_summary_evaluator(runs: list[Run], examples: list[Example]) -> EvaluationResults:
+        if not runs:
+            return {"results": []}
+        pass_rates = score_runs(compiled_asserts, runs, examples).mean(axis=0)
+        # `evaluate` only accepts `EvaluationResult` objects from summary evaluators.
+        return {
+            "results": [
+                EvaluationResult(key=f"{compiled.key}_pass_rate", score=float(pass_rate))
+                for compiled, pass_rate in zip(compiled_asserts, pass_rates, strict=True)
+            ]
+        }
 
+    return deterministic_summary_evaluator
 
-def create_llm_judge_evaluator(evaluator_config: BuiltinEvaluatorConfig) -> Evaluator:
-    def llm_judge_evaluator(run: Run, example: Example) -> EvalResult:
-        judge_provider = evaluator_config.get("judge_provider")
-        if judge_provider is None or ("id" not in judge_provider) or ("config" not in judge_provider):
-            raise ValueError("Please provide llm-judge judge_provider id and config")
-        judge_model_id = judge_provider["id"]
-        judge_model = getattr(ChatModelName, judge_model_id, None)
-
-        temperature = judge_provider["config"]["temperature"]
-        if judge_model is not None:
-            model = ChatModel(default_model_name=judge_model, temperature=temperature, verbose=True)
-        else:
-            raise ValueError(f"Invalid judge model_id: {judge_model_id}")
-        evaluate_prompt = """Evaluate and give a score between 0 to 1 the following text with the evaluation perspective specified in the prompt.
+
+def create_length_evaluator(evaluator_config: BuiltinEvaluatorConfig) -> Evaluator:
+    return create_deterministic_evaluator(evaluator_config)
+
+
+JUDGE_PROMPT = """Evaluate and give a score between 0 to 1 the following text with the evaluation perspective specified in the prompt.
 
           evaluation perspective: {evaluation_perspective}
           text: {text}
@@ -81,42 +100,378 @@ def create_llm_judge_evaluator(evaluator_config: BuiltinEvaluatorConfig) -> Eval
           only output the score
           """
 
-        prompt = PromptTemplate.from_template(evaluate_prompt)
+FUSED_JUDGE_PROMPT = """Evaluate the following text from each of the numbered evaluation perspectives below and give each a score between 0 to 1.
+
+          evaluation perspectives:
+          {evaluation_perspectives}
+
+          text: {text}
+
+          only output a JSON object mapping each perspective number to its score, for example {{"1": 0.5, "2": 1}}
+          """
+
+
+JUDGE_PROMPT_TEMPLATE = PromptTemplate.from_template(JUDGE_PROMPT)
+FUSED_JUDGE_PROMPT_TEMPLATE = PromptTemplate.from_template(FUSED_JUDGE_PROMPT)
+
+JudgeMode = Literal["single", "fused"]
+JUDGE_PROMPT_TEMPLATES: dict[JudgeMode, PromptTemplate] = {
+    "single": JUDGE_PROMPT_TEMPLATE,
+    "fused": FUSED_JUDGE_PROMPT_TEMPLATE,
+}
+
+
+class JudgeCache:
+    """
+    Judge scores keyed by judge model, temperature, judge mode and prompt, evaluation perspective and output text,
+    so an output that appears again in another repetition or provider is only judged once.
+    With a `ResponseCache`, scores are also stored on disk and reused by later runs.
+    """
+
+    def __init__(self, response_cache: ResponseCache | None = None) -> None:
+        self.response_cache = response_cache
+        self._scores: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(judge_provider: dict[Any, Any], perspective: str, text: Any, mode: JudgeMode = "single") -> str:
+        # The prompt is part of the key, so editing it does not reuse scores that were judged with the old one.
+        return ResponseCache.make_key(
+            judge_provider["id"],
+            {"temperature": judge_provider["config"]["temperature"], "mode": mode},
+            json.dumps([JUDGE_PROMPT_TEMPLATES[mode].template, perspective, text], ensure_ascii=False, default=str),
+        )
+
+    def get(self, key: str) -> float | None:
+        with self._lock:
+            score = self._scores.get(key)
+        if score is None and self.response_cache is not None:
+            cached = self.response_cache.lookup(key)
+            if cached is not None:
+                score = float(cached)
+                with self._lock:
+                    self._scores[key] = score
+        return score
+
+    def put(self, key: str, score: float) -> None:
+        with self._lock:
+            self._scores[key] = score
+        if self.response_cache is not None:
+            self.response_cache.put(key, str(score))
+
+
+def create_judge_model(judge_provider: dict[Any, Any] | None) -> ChatModel:
+    if judge_provider is None or ("id" not in judge_provider) or ("config" not in judge_provider):
+        raise ValueError("Please provide llm-judge judge_provider id and config")
+    judge_model_id = judge_provider["id"]
+    judge_model = getattr(ChatModelName, judge_model_id, None)
+
+    temperature = judge_provider["config"]["temperature"]
+    if judge_model is None:
+        raise ValueError(f"Invalid judge model_id: {judge_model_id}")
+    return ChatModel(
+        default_model_name=judge_model,
+        temperature=temperature,
+        rate_limiter=get_rate_limiter(judge_model_id, judge_provider["config"].get("rate_limit", None)),
+        verbose=True,
+        **fake_config_kwargs(judge_model, judge_provider["config"]),
+    )
+
+
+def get_run_output(run: Run) -> Any:
+    return run.outputs.get("output") if run.outputs is not None else None
+
+
+def create_llm_judge_evaluator(
+    evaluator_config: BuiltinEvaluatorConfig, judge_cache: JudgeCache | None = None
+) -> Evaluator:
+    judge_cache = judge_cache or JudgeCache()
+    # Built on the first run rather than here, so that invalid judge_provider configs fail the evaluation
+    # instead of loading the config.
+    get_model = functools.cache(lambda: create_judge_model(evaluator_config.get("judge_provider")))
+
+    def llm_judge_evaluator(run: Run, example: Example) -> EvalResult:
+        model = get_model()
+        judge_provider: dict[Any, Any] = evaluator_config["judge_provider"]  # type: ignore[assignment]
         inputs = {
             "evaluation_perspective": evaluator_config["value"],
-            "text": run.outputs.get("output") if run.outputs is not None else None,
+            "text": get_run_output(run),
         }
 
         key = evaluator_config.get("label", "llm-judge")
-        score = float(model.invoke(prompt=prompt, **inputs))  # type: ignore[arg-type]
+        cache_key = JudgeCache.make_key(judge_provider, inputs["evaluation_perspective"], inputs["text"])
+        score = judge_cache.get(cache_key)
+        if score is None:
+            score = float(model.invoke(prompt=JUDGE_PROMPT_TEMPLATE, **inputs))
+            judge_cache.put(cache_key, score)
         return {"key": key, "score": score}
 
     return llm_judge_evaluator
 
 
-def create_similar_evaluator() -> Evaluator:
+def parse_fused_judge_scores(response: str, count: int) -> list[float] | None:
+    """
+    Read the scores of a fused judge response, or return None when any perspective is missing.
+    """
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        scores = json.loads(response[start : end + 1])
+        return [float(scores[str(index)]) for index in range(1, count + 1)]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def create_fused_llm_judge_evaluator(
+    evaluator_configs: list[BuiltinEvaluatorConfig], judge_cache: JudgeCache | None = None
+) -> Evaluator:
+    """
+    Score every perspective of `evaluator_configs`, which share one judge_provider, with a single judge call.
+    Each perspective is still reported as its own result. If the judge does not answer with a score for
+    every perspective, they are judged one by one instead.
+    """
+    judge_cache = judge_cache or JudgeCache()
+    get_model = functools.cache(lambda: create_judge_model(evaluator_configs[0].get("judge_provider")))
+
+    def fused_llm_judge_evaluator(run: Run, example: Example) -> JudgeResults:
+        model = get_model()
+        judge_provider: dict[Any, Any] = evaluator_configs[0]["judge_provider"]  # type: ignore[assignment]
+        text = get_run_output(run)
+        cache_keys = [
+            JudgeCache.make_key(judge_provider, evaluator_config["value"], text, "fused")
+            for evaluator_config in evaluator_configs
+        ]
+        scores = [judge_cache.get(cache_key) for cache_key in cache_keys]
+        # Only the perspectives without a cached score are sent to the judge.
+        missing = [index for index, score in enumerate(scores) if score is None]
+
+        if missing:
+            perspectives = "\n".join(
+                f"{number}. {evaluator_configs[index]['value']}" for number, index in enumerate(missing, 1)
+            )
+            response = model.invoke(prompt=FUSED_JUDGE_PROMPT_TEMPLATE, evaluation_perspectives=perspectives, text=text)
+
+            judged = parse_fused_judge_scores(response, len(missing))
+            if judged is not None:
+                for index, score in zip(missing, judged, strict=True):
+                    scores[index] = score
+                    judge_cache.put(cache_keys[index], score)
+            else:
+                print(
+                    f"[Warning] Could not parse fused llm-judge response, judging each perspective separately: {response}"
+                )
+                for index in missing:
+                    # Judged with the single perspective prompt, so cached as such.
+                    single_key = JudgeCache.make_key(judge_provider, evaluator_configs[index]["value"], text)
+                    single_score = judge_cache.get(single_key)
+                    if single_score is None:
+                        single_score = float(
+                            model.invoke(
+                                prompt=JUDGE_PROMPT_TEMPLATE,
+                                evaluation_perspective=evaluator_configs[index]["value"],
+                                text=text,
+                            )
+                        )
+                        judge_cache.put(single_key, single_score)
+                    scores[index] = single_score
+
+        return {
+            "results": [
+                {"key": evaluator_config.get("label", "llm-judge"), "score": score}  # type: ignore[typeddict-item]
+                for evaluator_config, score in zip(evaluator_configs, scores, strict=True)
+            ]
+        }
+
+    return fused_llm_judge_evaluator
+
+
+def create_default_embeddings() -> Embeddings:
+    # Same model as langchain's "embedding_distance" evaluator, imported lazily like the chat model providers.
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings()
+
+
+# A text to compare, its reference key and reference text, and the future of their cosine distance.
+PendingDistance = tuple[str, str, str, Future[float]]
+
+
+class EmbeddingBatcher:
+    """
+    Computes the cosine distances requested by concurrent evaluator threads together. The texts of every
+    pending pair are embedded in as few requests as possible and the distances of the whole batch are computed
+    in one vectorized call. The first caller waits until `max_batch_size` texts are pending or `max_wait_seconds`
+    have passed, then flushes the batch for everyone. Reference embeddings are kept per reference key.
+    """
+
+    def __init__(
+        self,
+        get_embeddings: Callable[[], Embeddings],
+        max_batch_size: int = 256,
+        max_wait_seconds: float = 0.01,
+    ) -> None:
+        self.get_embeddings = get_embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.batch_count = 0
+        self._pending: list[PendingDistance] = []
+        self._pending_texts = 0
+        self._reference_vectors: dict[str, npt.NDArray[np.float64]] = {}
+        self._flush_scheduled = False
+        self._condition = threading.Condition()
+
+    def distance(self, text: str, reference_key: str, reference: str) -> float:
+        """Cosine distance between the embeddings of `text` and `reference`."""
+        future: Future[float] = Future()
+        with self._condition:
+            self._pending.append((text, reference_key, reference, future))
+            self._pending_texts += 1 if reference_key in self._reference_vectors else 2
+            is_leader = not self._flush_scheduled
+            self._flush_scheduled = True
+            self._condition.notify_all()
+            if is_leader:
+                self._condition.wait_for(
+                    lambda: self._pending_texts >= self.max_batch_size, timeout=self.max_wait_seconds
+                )
+
+        if is_leader:
+            self.flush()
+        return future.result()
+
+    def flush(self) -> None:
+        """Embed the pending texts and resolve the distances of every pending pair."""
+        with self._condition:
+            pending, self._pending = self._pending, []
+            self._pending_texts = 0
+            self._flush_scheduled = False
+            reference_vectors = dict(self._reference_vectors)
+        if not pending:
+            return
+
+        # Each missing reference is embedded once, even when several pending pairs share it.
+        new_references: dict[str, str] = {}
+        for _, reference_key, reference, _ in pending:
+            if reference_key not in reference_vectors:
+                new_references.setdefault(reference_key, reference)
+        try:
+            vectors = self._embed([text for text, _, _, _ in pending] + list(new_references.values()))
+        except Exception as error:
+            for *_, future in pending:
+                future.set_exception(error)
+            return
+
+        computed_references = dict(zip(new_references, vectors[len(pending) :], strict=True))
+        with self._condition:
+            self._reference_vectors.update(computed_references)
+        reference_vectors.update(computed_references)
+
+        distances = cosine_distances(
+            vectors[: len(pending)], np.array([reference_vectors[key] for _, key, _, _ in pending], dtype=np.float64)
+        )
+        for (*_, future), distance in zip(pending, distances, strict=True):
+            future.set_result(float(distance))
+
+    def _embed(self, texts: list[str]) -> npt.NDArray[np.float64]:
+        vectors: list[list[float]] = []
+        for start in range(0, len(texts), self.max_batch_size):
+            vectors.extend(self.get_embeddings().embed_documents(texts[start : start + self.max_batch_size]))
+            with self._condition:
+                self.batch_count += 1
+        return np.array(vectors, dtype=np.float64)
+
+
+def cosine_distances(
+    predictions: npt.NDArray[np.float64], references: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    """Row-wise cosine distance between two matrices of embeddings."""
+    norms = np.linalg.norm(predictions, axis=1) * np.linalg.norm(references, axis=1)
+    similarities = np.einsum("ij,ij->i", predictions, references) / np.where(norms == 0, 1, norms)
+    return 1.0 - similarities
+
+
+def get_output_text(outputs: dict[str, Any] | None) -> Any:
+    if not outputs:
+        return None
+    if "output" in outputs:
+        return outputs["output"]
+    return next(iter(outputs.values())) if len(outputs) == 1 else None
+
+
+def create_similar_evaluator(batcher: EmbeddingBatcher | None = None) -> Evaluator:
+    """
+    Cosine distance between the embeddings of the run output and the reference output.
+    Distances of concurrent runs are computed in batches, and reference embeddings are cached per example id,
+    since every provider and repetition compares against them.
+    """
+    batcher = batcher or EmbeddingBatcher(functools.cache(create_default_embeddings))
+
     def similar_evaluator(run: Run, example: Example) -> EvaluationResult | EvaluationResults:
-        evaluator = LangChainStringEvaluator("embedding_distance")
-        run_evaluator = evaluator.as_run_evaluator()
-        evaluation_result = run_evaluator.evaluate_run(run, example)
-        return evaluation_result
+        prediction = get_output_text(run.outputs)
+        reference = get_output_text(example.outputs)
+        if prediction is None or reference is None:
+            return EvaluationResult(key=SIMILAR_KEY, score=None, comment="Missing output or reference output")
+
+        distance = batcher.distance(str(prediction), str(example.id), str(reference))
+        return EvaluationResult(key=SIMILAR_KEY, score=distance)
 
     return similar_evaluator
 
 
+def judge_provider_key(evaluator_config: BuiltinEvaluatorConfig) -> str:
+    return json.dumps(evaluator_config.get("judge_provider"), sort_keys=True, default=str)
+
+
 def generate_builtin_evaluator_functions(
     evaluator_configs: list[BuiltinEvaluatorConfig],
+    judge_fusion: bool = False,
+    judge_response_cache: ResponseCache | None = None,
 ) -> list[Evaluator]:
+    """
+    Create the evaluators for the `assert` configs.
+    With `judge_fusion`, llm-judge asserts sharing a judge_provider are scored by one evaluator
+    placed where the first of them appears.
+    """
     evaluators = []
+    # Shared by every llm-judge evaluator, so identical outputs are judged once per perspective.
+    judge_cache = JudgeCache(judge_response_cache)
+    embedding_batcher: EmbeddingBatcher | None = None
+
+    judge_groups: dict[str, list[BuiltinEvaluatorConfig]] = {}
+    if judge_fusion:
+        for evaluator_config in evaluator_configs:
+            if evaluator_config["type"] == "llm-judge":
+                judge_groups.setdefault(judge_provider_key(evaluator_config), []).append(evaluator_config)
 
     for evaluator_config in evaluator_configs:
-        if evaluator_config["type"] == "length":
-            evaluators.append(create_length_evaluator(evaluator_config))
+        if evaluator_config["type"] in DETERMINISTIC_ASSERT_TYPES:
+            evaluators.append(create_deterministic_evaluator(evaluator_config))
         elif evaluator_config["type"] == "llm-judge":
-            evaluators.append(create_llm_judge_evaluator(evaluator_config))
+            group = judge_groups.get(judge_provider_key(evaluator_config), [evaluator_config])
+            if len(group) == 1:
+                evaluators.append(create_llm_judge_evaluator(evaluator_config, judge_cache))
+            elif group[0] is evaluator_config:
+                evaluators.append(create_fused_llm_judge_evaluator(group, judge_cache))
         elif evaluator_config["type"] == "similar":
-            evaluators.append(create_similar_evaluator())
+            # One batcher for every similar assert, so their embeddings share requests.
+            embedding_batcher = embedding_batcher or EmbeddingBatcher(functools.cache(create_default_embeddings))
+            evaluators.append(create_similar_evaluator(embedding_batcher))
         else:
             print(f"[Warning] Unknown evaluator type: {evaluator_config['type']}")
 
     return evaluators
+
+
+def generate_builtin_summary_evaluator_functions(
+    evaluator_configs: list[BuiltinEvaluatorConfig],
+) -> list[SummaryEvaluator]:
+    """
+    Create the summary evaluators for the `assert` configs: one pass-rate evaluator for the deterministic asserts
+    that set `pass_rate: true`. It is opt-in, since it adds feedback keys and scores those asserts a second time.
+    """
+    deterministic_configs = [
+        evaluator_config
+        for evaluator_config in evaluator_configs
+        if evaluator_config["type"] in DETERMINISTIC_ASSERT_TYPES and evaluator_config.get("pass_rate", False)
+    ]
+    return [create_deterministic_summary_evaluator(deterministic_configs)] if deterministic_configs else []
@@ -2,43 +2,156 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-import os
-import subprocess
-import sys
+import argparse
 
 from dotenv import load_dotenv
 
+from langsmith_evaluation_helper.profiling import DEFAULT_STALL_THRESHOLD_MS
+
 load_dotenv()
 
 
-def evaluate(config_path: str) -> None:
-    # Determine the absolute path of loader.py within the package
-    package_dir = os.path.dirname(os.path.realpath(__file__))
-    loader_path = os.path.join(package_dir, "loader.py")
+def evaluate(
+    config_path: str,
+    refresh_dataset: bool = False,
+    shard: str | None = None,
+    resume: bool = False,
+    profile: str | None = None,
+    stall_threshold_ms: float = DEFAULT_STALL_THRESHOLD_MS,
+    shard_run_id: str | None = None,
+) -> None:
+    # Imported here so that `--help` and argument errors do not pay for importing langchain.
+    from langsmith_evaluation_helper.loader import run_experiment
+
+    run_experiment(
+        config_path,
+        refresh_dataset=refresh_dataset,
+        shard=shard,
+        resume=resume,
+        profile=profile,
+        stall_threshold_ms=stall_threshold_ms,
+        shard_run_id=shard_run_id,
+    )
+
+
+def finalize(config_path: str, shard_count: int | None = None, shard_run_id: str | None = None) -> None:
+    from langsmith_evaluation_helper.loader import finalize_shards
+
+    finalize_shards(config_path, shard_count=shard_count, shard_run_id=shard_run_id)
+
+
+def reevaluate(config_path: str, experiments: list[str]) -> None:
+    from langsmith_evaluation_helper.loader import reevaluate_experiments
+
+    reevaluate_experiments(config_path, experiments)
+
 
-    if not os.path.isfile(loader_path):
-        print(f"Error: loader.py not found at {loader_path}")
-        sys.exit(1)
+def serve(path: str | None = None, host: str | None = None, port: int | None = None, verbose: bool = False) -> None:
+    from langsmith_evaluation_helper import local_langsmith
 
-    subprocess.run([sys.executable, loader_path, config_path])
+    local_langsmith.serve(
+        path or local_langsmith.DEFAULT_LOCAL_LANGSMITH_PATH,
+        host or local_langsmith.DEFAULT_LOCAL_LANGSMITH_HOST,
+        port if port is not None else local_langsmith.DEFAULT_LOCAL_LANGSMITH_PORT,
+        verbose=verbose,
+    )
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="langsmith-evaluation-helper")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Run the evaluation described by a config file.")
+    evaluate_parser.add_argument("config_path", help="Path to config.yml")
+    evaluate_parser.add_argument(
+        "--refresh-dataset",
+        action="store_true",
+        help="Download the dataset again even if a local snapshot of the same version exists.",
+    )
+    evaluate_parser.add_argument(
+        "--shard",
+        metavar="INDEX/COUNT",
+        help="Run only the examples of one deterministic shard, e.g. 0/4. Overrides tests.shard.",
+    )
+    evaluate_parser.add_argument(
+        "--shard-run-id",
+        metavar="ID",
+        help="Name of the sharded run, the same in every shard and new for every run. Overrides tests.shard_run_id.",
+    )
+    evaluate_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the experiments of the previous run of this config, running only the examples it did not complete.",
+    )
+    evaluate_parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Write CPU profiles (cpu.pstats, cpu.folded), tracemalloc snapshots and event loop stalls of the run to DIR.",
+    )
+    evaluate_parser.add_argument(
+        "--stall-threshold-ms",
+        type=float,
+        metavar="MS",
+        help=f"With --profile, report the event loop being blocked for longer than MS (default: {DEFAULT_STALL_THRESHOLD_MS:g}).",
+    )
+
+    finalize_parser = subparsers.add_parser(
+        "finalize",
+        help="Compute the summary evaluators and the usage of a sharded run once every shard has finished.",
+    )
+    finalize_parser.add_argument("config_path", help="Path to config.yml")
+    finalize_parser.add_argument(
+        "--shard-count", type=int, metavar="COUNT", help="Number of shards of the run. Defaults to that of tests.shard."
+    )
+    finalize_parser.add_argument(
+        "--shard-run-id", metavar="ID", help="The --shard-run-id of the run. Overrides tests.shard_run_id."
+    )
+
+    reevaluate_parser = subparsers.add_parser(
+        "reevaluate",
+        help="Apply the evaluators of a config file to existing experiments without calling the targets again.",
+    )
+    reevaluate_parser.add_argument("config_path", help="Path to config.yml")
+    reevaluate_parser.add_argument("experiments", nargs="+", metavar="experiment", help="Experiment name or id")
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run a local LangSmith API stand-in backed by SQLite, for offline runs (set LANGCHAIN_ENDPOINT to its URL).",
+    )
+    serve_parser.add_argument(
+        "--db", help="Path to the SQLite database (default: .langsmith_evaluation_helper/langsmith.sqlite3)"
+    )
+    serve_parser.add_argument("--host", help="Host to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, help="Port to listen on (default: 1984)")
+    serve_parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    return parser
 
 
 def main() -> None:
-    if len(sys.argv) < 2:
-        print("Usage: langsmith-evaluation-helper evaluate /path/to/config")
-        sys.exit(1)
-
-    command = sys.argv[1]
-
-    if command == "evaluate":
-        if len(sys.argv) != 3:
-            print("Usage: langsmith-evaluation-helper evaluate /path/to/config")
-            sys.exit(1)
-        config_path = sys.argv[2]
-        evaluate(config_path)
-    else:
-        print(f"Unknown command: {command}")
-        sys.exit(1)
+    parser = create_parser()
+    args = parser.parse_args()
+
+    if args.command == "evaluate":
+        if args.stall_threshold_ms is not None and args.profile is None:
+            parser.error("--stall-threshold-ms requires --profile")
+        evaluate(
+            args.config_path,
+            refresh_dataset=args.refresh_dataset,
+            shard=args.shard,
+            resume=args.resume,
+            profile=args.profile,
+            stall_threshold_ms=(
+                args.stall_threshold_ms if args.stall_threshold_ms is not None else DEFAULT_STALL_THRESHOLD_MS
+            ),
+            shard_run_id=args.shard_run_id,
+        )
+    elif args.command == "finalize":
+        finalize(args.config_path, shard_count=args.shard_count, shard_run_id=args.shard_run_id)
+    elif args.command == "reevaluate":
+        reevaluate(args.config_path, args.experiments)
+    elif args.command == "serve":
+        serve(args.db, args.host, args.port, verbose=args.verbose)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import uuid
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from langsmith import Client
+from langsmith.schemas import Dataset, Example
+
+DEFAULT_DATASET_CACHE_DIR = os.path.join(".langsmith_evaluation_helper", "datasets")
+
+EXAMPLES_FILE_NAME = "examples.jsonl"
+INDEX_FILE_NAME = "index.json"
+# Directories of snapshots being written or replaced, owned by the process that created them.
+TEMP_PREFIX = ".tmp-"
+OLD_PREFIX = ".old-"
+
+
+def dataset_version(dataset: Dataset) -> str:
+    """
+    Version of a dataset as seen by the snapshot cache.
+    Adding, editing or deleting examples updates `modified_at` and/or `example_count`.
+    """
+    modified_at = dataset.modified_at.isoformat() if dataset.modified_at is not None else ""
+    payload = f"{modified_at}:{dataset.example_count}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DatasetSnapshotCache:
+    """
+    On-disk snapshots of LangSmith datasets keyed by dataset id and version.
+
+    A snapshot is a JSONL file of examples plus an index of byte offsets. Reads memory-map the file
+    and parse examples lazily, so taking the first few examples of a large snapshot stays cheap.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DATASET_CACHE_DIR) -> None:
+        self.directory = directory
+
+    def snapshot_path(self, dataset_id: Any, version: str) -> str:
+        return os.path.join(self.directory, str(dataset_id), version)
+
+    def has(self, dataset_id: Any, version: str) -> bool:
+        return os.path.isfile(os.path.join(self.snapshot_path(dataset_id, version), INDEX_FILE_NAME))
+
+    def write(self, dataset_id: Any, version: str, examples: Iterable[Example]) -> int:
+        """Store a snapshot, replacing older versions of the same dataset. Returns the number of examples."""
+        dataset_path = os.path.join(self.directory, str(dataset_id))
+        snapshot_path = self.snapshot_path(dataset_id, version)
+        os.makedirs(dataset_path, exist_ok=True)
+        # Unique per writer, so concurrent processes never write into or delete each other's snapshot.
+        temp_path = tempfile.mkdtemp(prefix=f"{TEMP_PREFIX}{version}-", dir=dataset_path)
+
+        try:
+            offsets: list[tuple[int, int]] = []
+            example_ids: list[str] = []
+            with open(os.path.join(temp_path, EXAMPLES_FILE_NAME), "wb") as file:
+                for example in examples:
+                    start = file.tell()
+                    file.write(example.json().encode("utf-8"))
+                    offsets.append((start, file.tell()))
+                    file.write(b"\n")
+                    example_ids.append(str(example.id))
+
+            with open(os.path.join(temp_path, INDEX_FILE_NAME), "w") as file:
+                json.dump({"count": len(offsets), "ids": example_ids, "offsets": offsets}, file)
+
+            self._install(temp_path, snapshot_path)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+        self._remove_older_versions(dataset_path, version)
+        return len(offsets)
+
+    @staticmethod
+    def _install(temp_path: str, snapshot_path: str) -> None:
+        try:
+            os.replace(temp_path, snapshot_path)
+            return
+        except OSError:
+            if not os.path.isdir(snapshot_path):
+                raise
+        # A directory cannot replace a non-empty one, so the existing snapshot of this version (refreshed,
+        # or installed meanwhile by another process) is renamed away first, then deleted.
+        old_path = os.path.join(
+            os.path.dirname(snapshot_path), f"{OLD_PREFIX}{os.path.basename(snapshot_path)}-{uuid.uuid4().hex}"
+        )
+        with contextlib.suppress(FileNotFoundError):
+            os.replace(snapshot_path, old_path)
+        os.replace(temp_path, snapshot_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def _remove_older_versions(self, dataset_path: str, version: str) -> None:
+        """
+        Delete the snapshots of other versions installed before this one. Snapshots installed since by other
+        processes, and directories that other writers are still filling in, are left alone.
+        """
+        try:
+            installed_at = os.stat(os.path.join(dataset_path, version, INDEX_FILE_NAME)).st_mtime_ns
+        except OSError:
+            # Being replaced by another writer of the same version, which cleans up after itself.
+            return
+        for name in os.listdir(dataset_path):
+            if name == version or name.startswith((TEMP_PREFIX, OLD_PREFIX)):
+                continue
+            try:
+                other_installed_at = os.stat(os.path.join(dataset_path, name, INDEX_FILE_NAME)).st_mtime_ns
+            except OSError:
+                continue
+            if other_installed_at <= installed_at:
+                shutil.rmtree(os.path.join(dataset_path, name), ignore_errors=True)
+
+    def read(self, dataset_id: Any, version: str) -> Iterator[Example] | None:
+        """Lazily iterate over a stored snapshot, or return None if there is no snapshot for this version."""
+        if not self.has(dataset_id, version):
+            return None
+
+        snapshot_path = self.snapshot_path(dataset_id, version)
+        with open(os.path.join(snapshot_path, INDEX_FILE_NAME)) as file:
+            index = json.load(file)
+
+        return self._iter_examples(os.path.join(snapshot_path, EXAMPLES_FILE_NAME), index["offsets"])
+
+    @staticmethod
+    def _iter_examples(examples_path: str, offsets: list[tuple[int, int]]) -> Iterator[Example]:
+        if not offsets:
+            return
+        with open(examples_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start, end in offsets:
+                yield Example.parse_raw(mapped[start:end])
+
+
+def load_dataset_cache(cache_config: bool | dict[str, Any] | None) -> DatasetSnapshotCache | None:
+    """
+    Build the snapshot cache described by `tests.dataset_cache`, which is either `true` or `{path: ...}`.
+    """
+    if not cache_config:
+        return None
+    if isinstance(cache_config, dict):
+        if not cache_config.get("enabled", True):
+            return None
+        return DatasetSnapshotCache(cache_config.get("path", DEFAULT_DATASET_CACHE_DIR))
+    return DatasetSnapshotCache(DEFAULT_DATASET_CACHE_DIR)
+
+
+def iter_dataset_snapshot(
+    client: Client, dataset_name: str, cache: DatasetSnapshotCache, refresh: bool = False
+) -> Iterator[Example]:
+    """
+    Iterate over every example of the dataset, reading from the local snapshot when the dataset has not
+    changed since it was taken. A missing or stale snapshot (or `refresh`) downloads the dataset once.
+    """
+    dataset = client.read_dataset(dataset_name=dataset_name)
+    version = dataset_version(dataset)
+
+    if not refresh:
+        examples = cache.read(dataset.id, version)
+        if examples is not None:
+            return examples
+
+    cache.write(dataset.id, version, client.list_examples(dataset_id=dataset.id))
+    examples = cache.read(dataset.id, version)
+    if examples is None:
+        raise RuntimeError(f"Failed to read the snapshot of dataset {dataset_name} after writing it")
+    return examples
@@ -0,0 +1,214 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import operator
+import re
+from collections.abc import Callable, Sequence
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from langsmith.schemas import Example, Run
+
+DETERMINISTIC_ASSERT_TYPES = ("length", "exact-match", "contains", "regex", "json-valid", "numeric-tolerance")
+
+LENGTH_OPERATORS: dict[str, Callable[[Any, Any], Any]] = {
+    "<=": operator.le,
+    "<": operator.lt,
+    ">=": operator.ge,
+    ">": operator.gt,
+}
+LENGTH_PATTERN = re.compile(r"^\s*(<=|>=|<|>)\s*(-?\d+)\s*$")
+
+ScoreFunction = Callable[[Any, Any], bool]
+BatchScoreFunction = Callable[[pd.Series, pd.Series], npt.NDArray[np.bool_]]
+
+
+class CompiledAssert:
+    """
+    A deterministic assert whose config is parsed once.
+    `score` checks one output against its reference output and `score_batch` checks whole columns at once.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        score: ScoreFunction,
+        score_batch: BatchScoreFunction,
+        reference_key: str = "output",
+    ) -> None:
+        self.key = key
+        self.score = score
+        self.score_batch = score_batch
+        self.reference_key = reference_key
+
+    def get_reference(self, example: Example | None) -> Any:
+        if example is None or example.outputs is None:
+            return None
+        return example.outputs.get(self.reference_key)
+
+
+def is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def map_pairs(func: ScoreFunction) -> BatchScoreFunction:
+    """Batch version of a check that has no vectorized pandas equivalent."""
+
+    def score_batch(outputs: pd.Series, references: pd.Series) -> npt.NDArray[np.bool_]:
+        return np.fromiter(
+            (func(output, reference) for output, reference in zip(outputs, references, strict=True)),
+            dtype=bool,
+            count=len(outputs),
+        )
+
+    return score_batch
+
+
+def as_text(values: pd.Series) -> pd.Series:
+    return values.where(values.notna(), None).map(lambda value: None if value is None else str(value).strip())
+
+
+def compile_length(value: str) -> tuple[ScoreFunction, BatchScoreFunction]:
+    match = LENGTH_PATTERN.match(value or "")
+    if match is None:
+        print(f"[Warning] Invalid integer value in evaluator_config['value']: {value}")
+        return (lambda output, reference: False), (lambda outputs, references: np.zeros(len(outputs), dtype=bool))
+
+    compare, limit = LENGTH_OPERATORS[match.group(1)], int(match.group(2))
+
+    def score(output: Any, reference: Any) -> bool:
+        try:
+            return not is_missing(output) and bool(compare(len(output), limit))
+        except TypeError:
+            return False
+
+    def score_batch(outputs: pd.Series, references: pd.Series) -> npt.NDArray[np.bool_]:
+        # NaN lengths of missing outputs compare as False.
+        return compare(outputs.str.len(), limit).to_numpy(dtype=bool)
+
+    return score, score_batch
+
+
+def compile_exact_match(value: str | None) -> tuple[ScoreFunction, BatchScoreFunction]:
+    expected = None if value is None else str(value).strip()
+
+    def score(output: Any, reference: Any) -> bool:
+        target = expected if expected is not None else reference
+        return not is_missing(output) and not is_missing(target) and str(output).strip() == str(target).strip()
+
+    def score_batch(outputs: pd.Series, references: pd.Series) -> npt.NDArray[np.bool_]:
+        texts = as_text(outputs)
+        targets = pd.Series(expected, index=outputs.index) if expected is not None else as_text(references)
+        return (texts.notna() & targets.notna() & (texts == targets)).to_numpy(dtype=bool)
+
+    return score, score_batch
+
+
+def compile_contains(value: str | None) -> tuple[ScoreFunction, BatchScoreFunction]:
+    def score(output: Any, reference: Any) -> bool:
+        target = value if value is not None else reference
+        return not is_missing(output) and not is_missing(target) and str(target) in str(output)
+
+    if value is None:
+        return score, map_pairs(score)
+
+    def score_batch(outputs: pd.Series, references: pd.Series) -> npt.NDArray[np.bool_]:
+        return outputs.astype("string").str.contains(str(value), regex=False).fillna(False).to_numpy(dtype=bool)
+
+    return score, score_batch
+
+
+def compile_regex(value: str) -> tuple[ScoreFunction, BatchScoreFunction]:
+    try:
+        pattern = re.compile(value)
+    except re.error as error:
+        raise ValueError(f"Invalid regex in evaluator_config['value']: {value} ({error})") from error
+
+    def score(output: Any, reference: Any) -> bool:
+        return not is_missing(output) and pattern.search(str(output)) is not None
+
+    def score_batch(outputs: pd.Series, references: pd.Series) -> npt.NDArray[np.bool_]:
+        return outputs.astype("string").str.contains(pattern, regex=True).fillna(False).to_numpy(dtype=bool)
+
+    return score, score_batch
+
+
+def compile_json_valid(value: str | None) -> tuple[ScoreFunction, BatchScoreFunction]:
+    def score(output: Any, reference: Any) -> bool:
+        if is_missing(output):
+            return False
+        if not isinstance(output, str):
+            # Structured outputs are already parsed.
+            return isinstance(output, dict | list)
+        try:
+            json.loads(output)
+        except ValueError:
+            return False
+        return True
+
+    return score, map_pairs(score)
+
+
+def compile_numeric_tolerance(value: str | None) -> tuple[ScoreFunction, BatchScoreFunction]:
+    try:
+        tolerance = float(value) if value is not None else 0.0
+    except ValueError as error:
+        raise ValueError(f"Invalid tolerance in evaluator_config['value']: {value}") from error
+
+    def score(output: Any, reference: Any) -> bool:
+        try:
+            return abs(float(output) - float(reference)) <= tolerance
+        except (TypeError, ValueError):
+            return False
+
+    def score_batch(outputs: pd.Series, references: pd.Series) -> npt.NDArray[np.bool_]:
+        difference = pd.to_numeric(outputs, errors="coerce") - pd.to_numeric(references, errors="coerce")
+        # NaN differences of non-numeric values compare as False.
+        return (difference.abs() <= tolerance).to_numpy(dtype=bool)
+
+    return score, score_batch
+
+
+ASSERT_COMPILERS: dict[str, Callable[[Any], tuple[ScoreFunction, BatchScoreFunction]]] = {
+    "length": compile_length,
+    "exact-match": compile_exact_match,
+    "contains": compile_contains,
+    "regex": compile_regex,
+    "json-valid": compile_json_valid,
+    "numeric-tolerance": compile_numeric_tolerance,
+}
+
+
+def compile_assert(evaluator_config: Any) -> CompiledAssert:
+    assert_type = evaluator_config["type"]
+    compiler = ASSERT_COMPILERS.get(assert_type)
+    if compiler is None:
+        raise ValueError(f"Not a deterministic assert type: {assert_type}")
+
+    score, score_batch = compiler(evaluator_config.get("value"))
+    # length results keep their historical key.
+    key = assert_type if assert_type == "length" else (evaluator_config.get("label") or assert_type)
+    return CompiledAssert(key, score, score_batch, evaluator_config.get("reference_key") or "output")
+
+
+def score_runs(
+    compiled_asserts: Sequence[CompiledAssert], runs: Sequence[Run], examples: Sequence[Example | None]
+) -> pd.DataFrame:
+    """
+    Score many runs with every assert at once. Returns one boolean column per assert, named by its key,
+    and one row per run.
+    """
+    outputs = pd.Series([run.outputs.get("output") if run.outputs is not None else None for run in runs], dtype=object)
+    columns = []
+    for compiled in compiled_asserts:
+        references = pd.Series([compiled.get_reference(example) for example in examples], dtype=object)
+        columns.append(pd.Series(compiled.score_batch(outputs, references), name=compiled.key))
+    index = [str(run.id) for run in runs]
+    if not columns:
+        return pd.DataFrame(index=index)
+    # Concatenated rather than built from a dict, so asserts sharing a key keep their own column.
+    return pd.concat(columns, axis=1).set_axis(index)
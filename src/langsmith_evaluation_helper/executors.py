@@ -0,0 +1,81 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from langsmith_evaluation_helper.utils import load_function
+
+# This module is imported by every worker process, so it only depends on the standard library and `utils`.
+
+_worker_function: Callable[..., Any] | None = None
+
+# Keyed by the absolute script path, its file stamp (mtime, size), the function name and the pool size.
+_process_pools: dict[tuple[str, tuple[int, int], str, int | None], ProcessPoolExecutor] = {}
+_process_pools_lock = threading.Lock()
+
+
+def initialize_worker(script_path: str, function_name: str) -> None:
+    global _worker_function
+    _worker_function = load_function(script_path, function_name)
+
+
+def call_worker_function(kwargs: dict[str, Any]) -> Any:
+    if _worker_function is None:
+        raise RuntimeError("Process pool worker was not initialized")
+    return _worker_function(**kwargs)
+
+
+def get_process_pool(script_path: str, function_name: str, max_workers: int | None = None) -> ProcessPoolExecutor:
+    """
+    Return the process pool that runs `function_name` from `script_path`, creating it on first use.
+    Each worker imports the user module once when it starts, and pools are shared by every provider.
+    When the script changes, a new pool is started so its workers import the new version. The pool of the old
+    version is kept until `shutdown_process_pools`, since other providers of the run may still submit to it.
+    """
+    path = os.path.abspath(script_path)
+    file_stat = os.stat(path)
+    stamp = (file_stat.st_mtime_ns, file_stat.st_size)
+    key = (path, stamp, function_name, max_workers)
+    with _process_pools_lock:
+        pool = _process_pools.get(key)
+        if pool is not None:
+            return pool
+        pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            # "spawn" avoids forking a process that already runs the evaluation threads.
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initialize_worker,
+            initargs=(path, function_name),
+        )
+        _process_pools[key] = pool
+    return pool
+
+
+def create_process_pool_function(
+    script_path: str, function_name: str, max_workers: int | None = None
+) -> Callable[[dict[str, Any]], Any]:
+    """
+    Wrap a synchronous function so that each call runs in a worker process.
+    Only the keyword arguments are sent to the worker and only the return value is sent back, so both must be picklable.
+    """
+    pool = get_process_pool(script_path, function_name, max_workers)
+
+    def call(kwargs: dict[str, Any]) -> Any:
+        return pool.submit(call_worker_function, kwargs).result()
+
+    return call
+
+
+def shutdown_process_pools() -> None:
+    """Stop the workers of every pool. Called at the end of each run; later calls start new pools."""
+    with _process_pools_lock:
+        pools = list(_process_pools.values())
+        _process_pools.clear()
+    for pool in pools:
+        pool.shutdown()
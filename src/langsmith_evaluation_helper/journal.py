@@ -0,0 +1,110 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from typing import Any
+
+from langsmith.evaluation import EvaluationResults, RunEvaluator
+from langsmith.schemas import Example, Run
+
+DEFAULT_JOURNAL_DIR = os.path.join(".langsmith_evaluation_helper", "journals")
+
+
+def default_journal_path(config_path: str, shard: str | None = None) -> str:
+    """One journal per config file (and shard), so runs of different configs never resume each other."""
+    digest = hashlib.sha256(f"{os.path.abspath(config_path)}:{shard}".encode()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(config_path))[0]
+    return os.path.join(DEFAULT_JOURNAL_DIR, f"{stem}-{digest}.jsonl")
+
+
+class ExperimentJournal:
+    """
+    Append-only JSON Lines record of a run: the experiment of each provider and one line per completed
+    example run (example, provider), i.e. a successful target call whose evaluator feedback was logged.
+    With `resume`, the existing journal is read first and appended to; otherwise it is started over.
+    """
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        self._experiments: dict[str, dict[str, Any]] = {}
+        self._completed: dict[str, Counter[str]] = {}
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")  # noqa: SIM115
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line can be cut short by a crash.
+                    continue
+                if record["type"] == "experiment":
+                    self._experiments[record["provider"]] = record
+                elif record["type"] == "result":
+                    self._completed.setdefault(record["provider"], Counter())[record["example_id"]] += 1
+
+    def _append(self, record: dict[str, Any]) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def experiment(self, provider_id: str) -> dict[str, Any] | None:
+        return self._experiments.get(provider_id)
+
+    def completed(self, provider_id: str) -> Counter[str]:
+        with self._lock:
+            return Counter(self._completed.get(provider_id, Counter()))
+
+    def record_result(self, provider_id: str, experiment_name: str, example_id: str) -> None:
+        with self._lock:
+            if provider_id not in self._experiments:
+                record = {"type": "experiment", "provider": provider_id, "experiment_name": experiment_name}
+                self._experiments[provider_id] = record
+                self._append(record)
+            self._completed.setdefault(provider_id, Counter())[example_id] += 1
+            self._append({"type": "result", "provider": provider_id, "example_id": example_id})
+
+    def remaining_examples(self, provider_id: str, examples: Iterable[Example], num_repetitions: int) -> list[Example]:
+        """Each example repeated by the number of repetitions not completed yet."""
+        completed = self.completed(provider_id)
+        return [example for example in examples for _ in range(max(0, num_repetitions - completed[str(example.id)]))]
+
+    def evaluator(self, provider_id: str) -> "JournalEvaluator":
+        return JournalEvaluator(self, provider_id)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class JournalEvaluator(RunEvaluator):
+    """
+    Records each successful run of a provider in the journal. `evaluate` calls the evaluators of a run
+    in order and logs the feedback of each before calling the next, so placed last, this records the example
+    only once its evaluator results are stored. Failed target calls are not recorded and run again on resume.
+    """
+
+    def __init__(self, journal: ExperimentJournal, provider_id: str) -> None:
+        self.journal = journal
+        self.provider_id = provider_id
+
+    def evaluate_run(self, run: Run, example: Example | None = None) -> EvaluationResults:
+        # The experiment is read from the run tree that `evaluate` traces the target under.
+        experiment_name = getattr(run, "session_name", None)
+        if run.error is None and run.reference_example_id is not None and experiment_name is not None:
+            self.journal.record_result(self.provider_id, experiment_name, str(run.reference_example_id))
+        return {"results": []}
+
+    async def aevaluate_run(self, run: Run, example: Example | None = None) -> EvaluationResults:
+        return self.evaluate_run(run, example)
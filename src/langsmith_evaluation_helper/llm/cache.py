@@ -0,0 +1,171 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Literal, TypedDict
+
+CacheMode = Literal["read_write", "replay"]
+
+DEFAULT_CACHE_PATH = os.path.join(".langsmith_evaluation_helper", "llm_cache.sqlite3")
+
+
+class ResponseCacheConfig(TypedDict, total=False):
+    enabled: bool
+    path: str
+    mode: CacheMode
+    ttl_seconds: float | None
+    max_entries: int | None
+
+
+class ResponseCacheMissError(LookupError):
+    """Raised in replay mode when a response is not found in the cache."""
+
+
+class ResponseCache:
+    """SQLite backed cache of LLM responses keyed by model, model settings and rendered prompt.
+
+    In `read_write` mode misses are filled by calling the provider. In `replay` mode the cache is
+    read-only and a miss raises `ResponseCacheMissError` instead of calling the provider.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        mode: CacheMode = "read_write",
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+    ) -> None:
+        if mode not in ("read_write", "replay"):
+            raise ValueError(f"Invalid cache mode: {mode}")
+        if path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.commit()
+
+    @property
+    def read_only(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(model_name: str, model_kwargs: dict[str, Any], prompt: str) -> str:
+        payload = json.dumps(
+            {"model": model_name, "kwargs": model_kwargs, "prompt": prompt},
+            sort_keys=True,
+            default=str,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                if not self.read_only:
+                    self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._connection.commit()
+                return None
+            if not self.read_only:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._connection.commit()
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        if self.read_only:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._evict(now)
+            self._connection.commit()
+
+    def lookup(self, key: str) -> str | None:
+        """Return the cached response, raising in replay mode when there is none."""
+        response = self.get(key)
+        if response is None and self.read_only:
+            raise ResponseCacheMissError(f"No cached response for key {key} in replay mode ({self.path})")
+        return response
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self._connection.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+
+_caches: dict[tuple[str, str, float | None, int | None], ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def load_response_cache(cache_config: ResponseCacheConfig | None) -> ResponseCache | None:
+    """
+    Build the response cache described by the `cache:` block of the config file.
+    Caches are shared per (path, mode, ttl_seconds, max_entries) so every provider and evaluator in the process
+    with the same settings reuses one connection, and a config never gets the eviction settings of another.
+    """
+    if not cache_config or not cache_config.get("enabled", True):
+        return None
+
+    path = cache_config.get("path", DEFAULT_CACHE_PATH)
+    mode = cache_config.get("mode", "read_write")
+    ttl_seconds = cache_config.get("ttl_seconds")
+    max_entries = cache_config.get("max_entries")
+    key = (path, mode, ttl_seconds, max_entries)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ResponseCache(path=path, mode=mode, ttl_seconds=ttl_seconds, max_entries=max_entries)
+            _caches[key] = cache
+    return cache
@@ -0,0 +1,225 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Iterator
+from types import SimpleNamespace
+from typing import Any, Literal, TypedDict
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from langsmith_evaluation_helper.llm.rate_limit import estimate_tokens
+
+LatencyDistribution = Literal["fixed", "uniform", "normal", "lognormal"]
+
+
+class FakeChatModelConfig(TypedDict, total=False):
+    responses: list[str]
+    latency_ms: float
+    latency_jitter_ms: float
+    latency_distribution: LatencyDistribution
+    input_tokens: int
+    output_tokens: int
+    error_rate: float
+    rate_limit_rate: float
+    retry_after_seconds: float
+    chunk_size: int
+    seed: int
+
+
+class FakeProviderError(Exception):
+    """Simulated provider failure, shaped like the HTTP errors of provider SDKs (`status_code`, `response`)."""
+
+    def __init__(self, message: str, status_code: int = 500, headers: dict[str, str] | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class FakeRateLimitError(FakeProviderError):
+    def __init__(self, message: str, retry_after_seconds: float | None = None) -> None:
+        headers = {"retry-after": str(retry_after_seconds)} if retry_after_seconds is not None else None
+        super().__init__(message, status_code=429, headers=headers)
+
+
+def prompt_text(messages: list[BaseMessage]) -> str:
+    return "\n".join(
+        message.content if isinstance(message.content, str) else str(message.content) for message in messages
+    )
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that never leaves the process: it echoes the prompt, or answers with one of `responses`
+    chosen by the prompt, after a sampled latency, and fails at the configured error and rate limit rates.
+
+    Random draws are seeded by `seed`, the prompt and how many times that prompt was sent before, so a run
+    behaves the same whatever order concurrent calls happen in, and a retried call gets a fresh draw.
+    """
+
+    model_name: str = "fake"
+    responses: list[str] | None = None
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    latency_distribution: LatencyDistribution = "fixed"
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: float | None = None
+    chunk_size: int = 0
+    seed: int = 0
+
+    _attempts: Counter[str] = PrivateAttr(default_factory=Counter)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _random(self, prompt: str) -> random.Random:
+        key = digest(prompt)
+        with self._lock:
+            attempt = self._attempts[key]
+            self._attempts[key] += 1
+        return random.Random(f"{self.seed}:{key}:{attempt}")
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        latency, jitter = self.latency_ms, self.latency_jitter_ms
+        if self.latency_distribution == "uniform":
+            latency = rng.uniform(latency - jitter, latency + jitter)
+        elif self.latency_distribution == "normal":
+            latency = rng.gauss(latency, jitter)
+        elif self.latency_distribution == "lognormal" and latency > 0:
+            # `latency_ms` is the median and the jitter relative to it is the spread of the long tail.
+            latency = rng.lognormvariate(math.log(latency), jitter / latency)
+        return max(latency, 0.0) / 1000
+
+    def _plan(self, messages: list[BaseMessage]) -> tuple[str, float, FakeProviderError | None]:
+        """The prompt, the latency of this call and the error it fails with, if any."""
+        prompt = prompt_text(messages)
+        rng = self._random(prompt)
+        latency = self._sample_latency(rng)
+        failure = rng.random()
+        if failure < self.rate_limit_rate:
+            # Rate limit responses come back without waiting for a generation.
+            return prompt, 0.0, FakeRateLimitError("Fake rate limit exceeded (429)", self.retry_after_seconds)
+        if failure < self.rate_limit_rate + self.error_rate:
+            return prompt, latency, FakeProviderError("Fake provider error (500)")
+        return prompt, latency, None
+
+    def _respond(self, prompt: str) -> str:
+        if self.responses:
+            return self.responses[int(digest(prompt), 16) % len(self.responses)]
+        return prompt
+
+    def _usage(self, prompt: str, text: str) -> dict[str, int]:
+        input_tokens = self.input_tokens if self.input_tokens is not None else estimate_tokens(prompt)
+        output_tokens = self.output_tokens if self.output_tokens is not None else estimate_tokens(text)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _chunks(self, text: str) -> list[str]:
+        if self.chunk_size <= 0 or not text:
+            return [text]
+        return [text[index : index + self.chunk_size] for index in range(0, len(text), self.chunk_size)]
+
+    def _message(self, prompt: str, text: str) -> AIMessage:
+        return AIMessage(
+            content=text,
+            usage_metadata=self._usage(prompt, text),  # type: ignore[arg-type]
+            response_metadata={"model_name": self.model_name},
+        )
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt, latency, error = self._plan(messages)
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, self._respond(prompt)))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt, latency, error = self._plan(messages)
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, self._respond(prompt)))])
+
+    def _stream_chunks(self, prompt: str) -> Iterator[ChatGenerationChunk]:
+        text = self._respond(prompt)
+        chunks = self._chunks(text)
+        for index, chunk in enumerate(chunks):
+            # Token usage is reported once, on the last chunk, like the provider SDKs do.
+            usage = self._usage(prompt, text) if index == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage))  # type: ignore[arg-type]
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt, latency, error = self._plan(messages)
+        chunks = list(self._stream_chunks(prompt))
+        if error is not None:
+            time.sleep(latency)
+            raise error
+        # The latency is spread evenly over the chunks.
+        for chunk in chunks:
+            time.sleep(latency / len(chunks))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt, latency, error = self._plan(messages)
+        chunks = list(self._stream_chunks(prompt))
+        if error is not None:
+            await asyncio.sleep(latency)
+            raise error
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
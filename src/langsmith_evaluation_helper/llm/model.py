@@ -2,19 +2,23 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import json
 import os
+import threading
 import warnings
+from collections.abc import Callable, Iterable
 from enum import Enum
 from typing import Any
 
-from langchain.chat_models.base import BaseChatModel
-from langchain.schema.output_parser import StrOutputParser
-from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_core.pydantic_v1 import SecretStr
 from langchain_core.runnables import RunnableConfig
-from langchain_google_vertexai import ChatVertexAI
-from langchain_openai import AzureChatOpenAI, ChatOpenAI
+
+from langsmith_evaluation_helper.llm.cache import ResponseCache
+from langsmith_evaluation_helper.llm.fake import FakeChatModel, FakeChatModelConfig
+from langsmith_evaluation_helper.llm.rate_limit import RateLimiter, estimate_tokens
+from langsmith_evaluation_helper.llm.usage import UsageCallbackHandler, UsageTracker, add_usage_to_current_run
 
 
 class ChatModelName(Enum):
@@ -34,6 +38,10 @@ class ChatModelName(Enum):
     CLAUDE_OPUS_5 = "claude-opus-5"
     CLAUDE_SONNET_5 = "claude-sonnet-5"
     CLAUDE_HAIKU_4_5 = "claude-haiku-4-5-20251001"
+    FAKE = "fake"
+    FAKE_FAST = "fake-fast"
+    FAKE_SLOW = "fake-slow"
+    FAKE_FLAKY = "fake-flaky"
 
 
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "")
@@ -53,53 +61,194 @@ CLAUDE_MODELS = LEGACY_CLAUDE_MODELS | {
     ChatModelName.CLAUDE_HAIKU_4_5,
 }
 
+# In-process models for offline runs and benchmarks. Each preset is a default profile; the `fake` block of
+# the provider config overrides any of its settings.
+FAKE_PRESETS: dict[ChatModelName, FakeChatModelConfig] = {
+    ChatModelName.FAKE: {},
+    ChatModelName.FAKE_FAST: {"latency_ms": 50, "latency_jitter_ms": 25, "latency_distribution": "lognormal"},
+    ChatModelName.FAKE_SLOW: {"latency_ms": 2000, "latency_jitter_ms": 500, "latency_distribution": "normal"},
+    ChatModelName.FAKE_FLAKY: {
+        "latency_ms": 200,
+        "latency_jitter_ms": 100,
+        "latency_distribution": "uniform",
+        "error_rate": 0.02,
+        "rate_limit_rate": 0.1,
+    },
+}
+
+FAKE_MODELS = set(FAKE_PRESETS)
 
-def get_chat_model(name: ChatModelName, **kwargs: Any) -> BaseChatModel:
-    azure_deployment = kwargs.pop("azure_deployment") if "azure_deployment" in kwargs else None
-    api_version = kwargs.pop("api_version") if "api_version" in kwargs else None
-    if (
-        name == ChatModelName.TURBO
-        or name == ChatModelName.GPT4
-        or name == ChatModelName.GPT4_32K
-        or name == ChatModelName.GPT4O
-    ):
-        return ChatOpenAI(model=name.value, **kwargs)
-    elif (
-        name == ChatModelName.AZURE_GPT35_16K_TURBO
-        and ((azure_deployment is not None) and (api_version is not None))
-        or name == ChatModelName.AZURE_GPT4_32K
-        and ((azure_deployment is not None) and (api_version is not None))
-    ):
-        return AzureChatOpenAI(
-            api_key=SecretStr(AZURE_OPENAI_API_KEY),
-            azure_endpoint=AZURE_OPENAI_API_BASE,
-            api_version=api_version,
-            azure_deployment=azure_deployment,
-            **kwargs,
+
+def fake_config_kwargs(name: ChatModelName, provider_config: dict[str, Any]) -> dict[str, Any]:
+    """The `fake` block of a provider config as factory kwargs. Only FAKE models take it."""
+    return {"fake": provider_config.get("fake") or {}} if name in FAKE_MODELS else {}
+
+
+# Provider integrations are imported inside their factories so that a run only pays the import cost
+# (often seconds for the Google/Vertex libraries) of the providers it actually uses.
+ChatModelFactory = Callable[..., BaseChatModel]
+
+_chat_model_factories: dict[ChatModelName, ChatModelFactory] = {}
+
+
+def register_chat_model_provider(names: Iterable[ChatModelName], factory: ChatModelFactory) -> None:
+    """
+    Register the factory that builds the chat model for each of `names`.
+    The factory is called as `factory(name, azure_deployment=..., api_version=..., **kwargs)`.
+    """
+    for name in names:
+        _chat_model_factories[name] = factory
+
+
+def create_openai_chat_model(
+    name: ChatModelName, azure_deployment: str | None = None, api_version: str | None = None, **kwargs: Any
+) -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=name.value, **kwargs)
+
+
+def create_azure_openai_chat_model(
+    name: ChatModelName, azure_deployment: str | None = None, api_version: str | None = None, **kwargs: Any
+) -> BaseChatModel:
+    if azure_deployment is None or api_version is None:
+        raise ValueError(f"Invalid model name. {name}")
+
+    from langchain_core.pydantic_v1 import SecretStr
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        api_key=SecretStr(AZURE_OPENAI_API_KEY),
+        azure_endpoint=AZURE_OPENAI_API_BASE,
+        api_version=api_version,
+        azure_deployment=azure_deployment,
+        **kwargs,
+    )
+
+
+def create_vertexai_chat_model(
+    name: ChatModelName, azure_deployment: str | None = None, api_version: str | None = None, **kwargs: Any
+) -> BaseChatModel:
+    if name == ChatModelName.GEMINI_PRO or name == ChatModelName.GEMINI_FLASH:
+        warnings.warn(
+            "gemini 1.0 will be deprecated 2025-04-09 and gemini 1.5 flash will be deprecated 2025-09-24. Use GEMINI_2_FLASH instead. see details: https://cloud.google.com/vertex-ai/generative-ai/docs/learn/model-versions#discontinued_models",
+            DeprecationWarning,
+            stacklevel=3,
         )
-    elif name == ChatModelName.GEMINI_PRO or name == ChatModelName.GEMINI_FLASH:
-        if name == ChatModelName.GEMINI_PRO or name == ChatModelName.GEMINI_FLASH:
-            warnings.warn(
-                "gemini 1.0 will be deprecated 2025-04-09 and gemini 1.5 flash will be deprecated 2025-09-24. Use GEMINI_2_FLASH instead. see details: https://cloud.google.com/vertex-ai/generative-ai/docs/learn/model-versions#discontinued_models",
-                DeprecationWarning,
-                stacklevel=2,
-            )
-        return ChatVertexAI(
-            model_name=name.value,
-            **kwargs,
+
+    from langchain_google_vertexai import ChatVertexAI
+
+    return ChatVertexAI(
+        model_name=name.value,
+        **kwargs,
+    )
+
+
+def create_anthropic_chat_model(
+    name: ChatModelName, azure_deployment: str | None = None, api_version: str | None = None, **kwargs: Any
+) -> BaseChatModel:
+    if name in LEGACY_CLAUDE_MODELS:
+        warnings.warn(
+            f"{name.name} has reached end of life and the Anthropic API no longer serves it. "
+            "Use CLAUDE_OPUS_5, CLAUDE_SONNET_5 or CLAUDE_HAIKU_4_5 instead. "
+            "see details: https://docs.claude.com/en/docs/about-claude/model-deprecations",
+            DeprecationWarning,
+            stacklevel=3,
         )
-    elif name in CLAUDE_MODELS:
-        if name in LEGACY_CLAUDE_MODELS:
-            warnings.warn(
-                f"{name.name} has reached end of life and the Anthropic API no longer serves it. "
-                "Use CLAUDE_OPUS_5, CLAUDE_SONNET_5 or CLAUDE_HAIKU_4_5 instead. "
-                "see details: https://docs.claude.com/en/docs/about-claude/model-deprecations",
-                DeprecationWarning,
-                stacklevel=2,
-            )
-        return ChatAnthropic(model_name=name.value, **kwargs)
-    else:
+
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(model_name=name.value, **kwargs)
+
+
+def create_fake_chat_model(
+    name: ChatModelName,
+    azure_deployment: str | None = None,
+    api_version: str | None = None,
+    fake: FakeChatModelConfig | None = None,
+    **kwargs: Any,
+) -> BaseChatModel:
+    fake = fake or {}
+    unknown = set(fake) - set(FakeChatModelConfig.__annotations__)
+    if unknown:
+        raise ValueError(f"Invalid fake config keys for {name.name}: {sorted(unknown)}")
+    # Sampling settings such as temperature do not apply to the fake models.
+    return FakeChatModel(model_name=name.value, **{**FAKE_PRESETS[name], **fake})
+
+
+register_chat_model_provider(
+    [ChatModelName.TURBO, ChatModelName.GPT4, ChatModelName.GPT4_32K, ChatModelName.GPT4O],
+    create_openai_chat_model,
+)
+register_chat_model_provider(
+    [ChatModelName.AZURE_GPT35_16K_TURBO, ChatModelName.AZURE_GPT4_32K],
+    create_azure_openai_chat_model,
+)
+register_chat_model_provider(
+    [ChatModelName.GEMINI_PRO, ChatModelName.GEMINI_FLASH, ChatModelName.GEMINI_2_FLASH],
+    create_vertexai_chat_model,
+)
+register_chat_model_provider(CLAUDE_MODELS, create_anthropic_chat_model)
+register_chat_model_provider(FAKE_MODELS, create_fake_chat_model)
+
+
+def get_chat_model(name: ChatModelName, **kwargs: Any) -> BaseChatModel:
+    factory = _chat_model_factories.get(name)
+    if factory is None:
         raise ValueError(f"Invalid model name. {name}")
+    return factory(name, **kwargs)
+
+
+class ChatModelPool:
+    """Pool of the chat model clients of the current run, keyed by model name and client settings.
+
+    Provider clients hold their own HTTP connection pools, so handing out one shared client per
+    (model, settings) keeps connections alive across examples instead of rebuilding them per call.
+    Async clients are bound to the event loop of the run, so `ExperimentSession.run` clears the pool
+    before each run.
+    """
+
+    def __init__(self) -> None:
+        self._models: dict[str, BaseChatModel] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(name: ChatModelName, **kwargs: Any) -> str:
+        return json.dumps({"name": name.value, "kwargs": kwargs}, sort_keys=True, default=repr)
+
+    def get(self, name: ChatModelName, **kwargs: Any) -> BaseChatModel:
+        key = self.make_key(name, **kwargs)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+        # Clients are built outside the lock, since building one can be slow (credentials, HTTP clients).
+        # When two threads build the same client, the first one inserted is kept.
+        built = get_chat_model(name, **kwargs)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+            self.misses += 1
+            self._models[key] = built
+        return built
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._models)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+chat_model_pool = ChatModelPool()
 
 
 class ChatModel:
@@ -109,23 +258,58 @@ class ChatModel:
     default_model_name: ChatModelName
     verbose: bool = True
     kwargs: Any
+    client_kwargs: Any
+    cache: ResponseCache | None
+    rate_limiter: RateLimiter | None
+    usage_tracker: UsageTracker | None
 
     def __init__(
         self,
         default_model_name: ChatModelName = ChatModelName.CLAUDE3_SONNET,
+        cache: ResponseCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        usage_tracker: UsageTracker | None = None,
         **kwargs: Any,
     ) -> None:
-        self.default_model = get_chat_model(default_model_name, **kwargs)
+        # With a rate limiter, rate limit errors are retried by the limiter alone rather than by the provider SDK too.
+        # The response cache key is built from `kwargs`, so the client settings are kept apart.
+        self.client_kwargs = {**kwargs, "max_retries": 0} if rate_limiter is not None else kwargs
+        self.default_model = chat_model_pool.get(default_model_name, **self.client_kwargs)
         self.default_model_name = default_model_name
         self.kwargs = kwargs
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.usage_tracker = usage_tracker
 
     def get_model(self, model_name: ChatModelName | None = None) -> BaseChatModel:
         model = self.default_model
         if model_name:
-            model = get_chat_model(model_name, **self.kwargs)
+            model = chat_model_pool.get(model_name, **self.client_kwargs)
 
         return model
 
+    def _cache_key(self, prompt: PromptTemplate, model_name: ChatModelName | None, inputs: dict[str, Any]) -> str:
+        name = model_name or self.default_model_name
+        return ResponseCache.make_key(name.value, self.kwargs, prompt.format(**inputs))
+
+    def _create_config(
+        self, tags: list[str] | None, metadata: dict[str, Any] | None
+    ) -> tuple[RunnableConfig, UsageCallbackHandler | None]:
+        # The chain returns only the text, so the token usage is read from the model calls by a callback.
+        usage_handler = UsageCallbackHandler() if self.usage_tracker is not None else None
+        config = RunnableConfig(
+            tags=tags or [],
+            metadata=metadata or {},
+            callbacks=[usage_handler] if usage_handler is not None else None,
+        )
+        return config, usage_handler
+
+    def _record_usage(self, usage_handler: UsageCallbackHandler | None) -> None:
+        if self.usage_tracker is None or usage_handler is None or usage_handler.usage is None:
+            return
+        self.usage_tracker.record(usage_handler.usage, usage_handler.seconds)
+        add_usage_to_current_run(usage_handler.usage, usage_handler.seconds)
+
     def invoke(
         self,
         prompt: PromptTemplate,
@@ -134,13 +318,27 @@ class ChatModel:
         metadata: dict[str, Any] | None = None,
         **kwargs: Any,
     ) -> str:
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(prompt, model_name, kwargs)
+            cached = self.cache.lookup(cache_key)
+            if cached is not None:
+                return cached
+
         chain = (prompt | self.get_model(model_name)) | StrOutputParser()
-        config = RunnableConfig(
-            tags=tags or [],
-            metadata=metadata or {},
-        )
+        config, usage_handler = self._create_config(tags, metadata)
 
-        return chain.invoke(input=kwargs, config=config)
+        if self.rate_limiter is not None:
+            result = self.rate_limiter.call(
+                lambda: chain.invoke(input=kwargs, config=config),
+                tokens=estimate_tokens(prompt.format(**kwargs)),
+            )
+        else:
+            result = chain.invoke(input=kwargs, config=config)
+        self._record_usage(usage_handler)
+        if self.cache is not None and cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
 
     async def async_invoke(
         self,
@@ -150,10 +348,24 @@ class ChatModel:
         metadata: dict[str, Any] | None = None,
         **kwargs: Any,
     ) -> str:
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(prompt, model_name, kwargs)
+            cached = self.cache.lookup(cache_key)
+            if cached is not None:
+                return cached
+
         chain = prompt | self.get_model(model_name) | StrOutputParser()
-        config = RunnableConfig(
-            tags=tags or [],
-            metadata=metadata or {},
-        )
+        config, usage_handler = self._create_config(tags, metadata)
 
-        return await chain.ainvoke(input=kwargs, config=config)
+        if self.rate_limiter is not None:
+            result = await self.rate_limiter.acall(
+                lambda: chain.ainvoke(input=kwargs, config=config),
+                tokens=estimate_tokens(prompt.format(**kwargs)),
+            )
+        else:
+            result = await chain.ainvoke(input=kwargs, config=config)
+        self._record_usage(usage_handler)
+        if self.cache is not None and cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
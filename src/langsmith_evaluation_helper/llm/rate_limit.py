@@ -0,0 +1,320 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import contextlib
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypedDict, TypeVar
+
+T = TypeVar("T")
+
+RATE_LIMIT_STATUS_CODES = {429, 503, 529}
+
+
+class RateLimitConfig(TypedDict, total=False):
+    requests_per_minute: float
+    tokens_per_minute: float
+    initial_concurrency: int
+    min_concurrency: int
+    max_concurrency: int
+    max_retries: int
+    initial_backoff: float
+    max_backoff: float
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute` up to `capacity`.
+    `try_acquire` never blocks; it returns how long to wait before trying again.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if rate_per_minute <= 0:
+            raise ValueError(f"Invalid rate: {rate_per_minute}")
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        with self._lock:
+            self._refill()
+            # Requests larger than the bucket are let through once it is full instead of waiting forever.
+            required = min(amount, self.capacity)
+            if self._tokens >= required:
+                self._tokens -= amount
+                return 0.0
+            return (required - self._tokens) / self.rate_per_second
+
+    def consume(self, amount: float) -> None:
+        """Take tokens without waiting, e.g. to account for output tokens once they are known."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: grows by one slot per `limit` successful calls and halves on overload.
+    Callers waiting for a slot, from any thread or event loop, are woken when a slot is released.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        if not 1 <= minimum <= maximum:
+            raise ValueError(f"Invalid concurrency bounds: min={minimum}, max={maximum}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._slot_released = threading.Condition(self._lock)
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]] = []
+
+    def _try_acquire_locked(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            return self._try_acquire_locked()
+
+    def acquire(self) -> None:
+        with self._slot_released:
+            self._slot_released.wait_for(self._try_acquire_locked)
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire_locked():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, overloaded: bool = False, succeeded: bool = True) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+            elif succeeded:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._slot_released.notify_all()
+            async_waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in async_waiters:
+            with contextlib.suppress(RuntimeError):
+                # The loop of a finished run is closed and has no waiter left to wake.
+                loop.call_soon_threadsafe(wake_waiter, waiter)
+
+
+def wake_waiter(waiter: asyncio.Future[None]) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    Whether `error` is a provider rate limit or overload response (HTTP 429/503/529), judged by its status code
+    or its type. The message is not used, since it can quote anything, such as a prompt containing "429".
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code in RATE_LIMIT_STATUS_CODES:
+        return True
+
+    return any(
+        "RateLimit" in error_type.__name__
+        or "Overloaded" in error_type.__name__
+        or error_type.__name__ == "ResourceExhausted"
+        for error_type in type(error).__mro__
+    )
+
+
+def retry_after(error: BaseException) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English text; only used to pace requests.
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Per-provider pacing for chat model calls: requests-per-minute and tokens-per-minute buckets plus an
+    adaptive concurrency limit, which starts at `max_concurrency` unless `initial_concurrency` is given.
+    Calls that fail with a rate limit error shrink the concurrency limit and are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        initial_concurrency: int | None = None,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        max_retries: int = 6,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial_concurrency if initial_concurrency is not None else max_concurrency,
+            min_concurrency,
+            max_concurrency,
+        )
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.rate_limited_count = 0
+
+    @classmethod
+    def from_config(cls, config: RateLimitConfig) -> "RateLimiter":
+        return cls(**config)
+
+    def _try_acquire_budget(self, tokens: int) -> float:
+        """Take one request and `tokens` tokens, or return how long to wait."""
+        if self.request_bucket is not None:
+            wait = self.request_bucket.try_acquire(1)
+            if wait > 0:
+                return wait
+        if self.token_bucket is not None:
+            wait = self.token_bucket.try_acquire(tokens)
+            if wait > 0:
+                # Give the request back so that waiting for tokens does not also consume request budget.
+                if self.request_bucket is not None:
+                    self.request_bucket.consume(-1)
+                return wait
+        return 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Take a concurrency slot, waiting until one is released, then the request and token budget."""
+        self.concurrency.acquire()
+        try:
+            while (wait := self._try_acquire_budget(tokens)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self.concurrency.release(succeeded=False)
+            raise
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        await self.concurrency.acquire_async()
+        try:
+            while (wait := self._try_acquire_budget(tokens)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.concurrency.release(succeeded=False)
+            raise
+
+    def release(self, result: Any = None, error: BaseException | None = None) -> None:
+        overloaded = error is not None and is_rate_limit_error(error)
+        if overloaded:
+            self.rate_limited_count += 1
+        if self.token_bucket is not None and isinstance(result, str):
+            self.token_bucket.consume(estimate_tokens(result))
+        self.concurrency.release(overloaded=overloaded, succeeded=error is None)
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.initial_backoff * 2**attempt))
+        return delay
+
+    def call(self, func: Callable[[], T], tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                result = func()
+            except Exception as error:
+                self.release(error=error)
+                if not is_rate_limit_error(error) or attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt, error))
+                attempt += 1
+                continue
+            except BaseException as error:
+                # Cancellation, timeouts and interrupts are not retried, but their slot is given back.
+                self.release(error=error)
+                raise
+            self.release(result)
+            return result
+
+    async def acall(self, func: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            await self.acquire_async(tokens)
+            try:
+                result = await func()
+            except Exception as error:
+                self.release(error=error)
+                if not is_rate_limit_error(error) or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff(attempt, error))
+                attempt += 1
+                continue
+            except BaseException as error:
+                # Cancellation, timeouts and interrupts are not retried, but their slot is given back.
+                self.release(error=error)
+                raise
+            self.release(result)
+            return result
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider_id: str, rate_limit_config: RateLimitConfig | None) -> RateLimiter | None:
+    """
+    Return the rate limiter shared by every call to `provider_id` in this process.
+    The first config seen for a provider id wins, so targets and judges using the same model share one budget.
+    """
+    if not rate_limit_config:
+        return None
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(provider_id)
+        if rate_limiter is None:
+            rate_limiter = RateLimiter.from_config(rate_limit_config)
+            _rate_limiters[provider_id] = rate_limiter
+    return rate_limiter
@@ -0,0 +1,219 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+from collections.abc import Iterable, Mapping
+from typing import Any, TypedDict
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langsmith.run_helpers import get_current_run_tree
+
+# Keys of the token counts in the usage reported by the provider SDKs, as (input, output).
+USAGE_KEYS = (("input_tokens", "output_tokens"), ("prompt_tokens", "completion_tokens"))
+
+
+class TokenUsage(TypedDict):
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+
+
+class ModelPricing(TypedDict, total=False):
+    """USD per million tokens."""
+
+    input: float
+    output: float
+
+
+class UsageSummary(TypedDict):
+    calls: int
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    model_seconds: float
+    output_tokens_per_second: float | None
+    total_tokens_per_second: float | None
+    estimated_cost: float | None
+
+
+def add_usage(usage: TokenUsage, other: TokenUsage) -> TokenUsage:
+    return {
+        "input_tokens": usage["input_tokens"] + other["input_tokens"],
+        "output_tokens": usage["output_tokens"] + other["output_tokens"],
+        "total_tokens": usage["total_tokens"] + other["total_tokens"],
+    }
+
+
+def parse_usage(usage: Any) -> TokenUsage | None:
+    if not isinstance(usage, Mapping):
+        return None
+    for input_key, output_key in USAGE_KEYS:
+        if input_key in usage or output_key in usage:
+            input_tokens, output_tokens = int(usage.get(input_key) or 0), int(usage.get(output_key) or 0)
+            return {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": int(usage.get("total_tokens") or input_tokens + output_tokens),
+            }
+    return None
+
+
+def message_usage(message: BaseMessage) -> TokenUsage | None:
+    """`usage_metadata` of the message, or the usage in its `response_metadata` for older integrations."""
+    usage = parse_usage(getattr(message, "usage_metadata", None))
+    if usage is not None:
+        return usage
+    for key in ("token_usage", "usage"):
+        usage = parse_usage(message.response_metadata.get(key))
+        if usage is not None:
+            return usage
+    return None
+
+
+def result_usage(response: LLMResult) -> TokenUsage | None:
+    usages = [
+        usage
+        for generations in response.generations
+        for generation in generations
+        if isinstance(generation, ChatGeneration) and (usage := message_usage(generation.message)) is not None
+    ]
+    if not usages and response.llm_output:
+        usage = parse_usage(response.llm_output.get("token_usage") or response.llm_output.get("usage"))
+        usages = [usage] if usage is not None else []
+    if not usages:
+        return None
+    total = usages[0]
+    for usage in usages[1:]:
+        total = add_usage(total, usage)
+    return total
+
+
+def add_usage_to_current_run(usage: TokenUsage, seconds: float = 0.0) -> None:
+    """
+    Add `usage` to the `usage` metadata of the root of the current trace, i.e. the target run that
+    `evaluate` passes to evaluators, summed over the model calls of the target. The number of calls and
+    their generation time are kept next to it, so the usage of an experiment can be summed from its runs.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is None:
+        return
+    while run_tree.parent_run is not None:
+        run_tree = run_tree.parent_run
+    metadata = (run_tree.extra or {}).get("metadata") or {}
+    previous = metadata.get("usage")
+    run_tree.add_metadata({
+        "usage": add_usage(previous, usage) if previous else usage,
+        "model_calls": int(metadata.get("model_calls") or 0) + 1,
+        "model_seconds": float(metadata.get("model_seconds") or 0.0) + seconds,
+    })
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Collects the token usage and generation time of the model calls of one `ChatModel` invocation,
+    retries included, so the usage is kept even though the chain returns only the text.
+    """
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.usage: TokenUsage | None = None
+        self.seconds = 0.0
+        self._started: dict[UUID, float] = {}
+
+    def on_chat_model_start(
+        self, serialized: dict[str, Any], messages: list[list[BaseMessage]], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.seconds += time.perf_counter() - started
+        usage = result_usage(response)
+        if usage is None:
+            return
+        self.usage = add_usage(self.usage, usage) if self.usage is not None else usage
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Failed attempts are not billed as output and would skew the tokens per second.
+        self._started.pop(run_id, None)
+
+
+class UsageTracker:
+    """Token usage of the target calls of one provider, with the generation time and the estimated cost."""
+
+    def __init__(self, pricing: ModelPricing | None = None) -> None:
+        self.pricing = pricing
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = 0
+        self.model_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, usage: TokenUsage, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            self.calls += calls
+            self.input_tokens += usage["input_tokens"]
+            self.output_tokens += usage["output_tokens"]
+            self.total_tokens += usage["total_tokens"]
+            self.model_seconds += seconds
+
+    def estimated_cost(self) -> float | None:
+        if not self.pricing:
+            return None
+        return (
+            self.input_tokens * self.pricing.get("input", 0.0) + self.output_tokens * self.pricing.get("output", 0.0)
+        ) / 1_000_000
+
+    def summary(self) -> UsageSummary:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.total_tokens,
+                "model_seconds": self.model_seconds,
+                # Per second of model time: the speed of a call, not the throughput of the concurrent run.
+                "output_tokens_per_second": self.output_tokens / self.model_seconds if self.model_seconds else None,
+                "total_tokens_per_second": self.total_tokens / self.model_seconds if self.model_seconds else None,
+                "estimated_cost": self.estimated_cost(),
+            }
+
+
+def runs_usage(runs: Iterable[Any], pricing: ModelPricing | None = None) -> UsageSummary:
+    """Usage summed over the `usage` metadata of target runs, e.g. of the runs every shard added to an experiment."""
+    tracker = UsageTracker(pricing)
+    for run in runs:
+        metadata = (run.extra or {}).get("metadata") or {}
+        usage = parse_usage(metadata.get("usage"))
+        if usage is not None:
+            tracker.record(
+                usage, float(metadata.get("model_seconds") or 0.0), calls=int(metadata.get("model_calls") or 1)
+            )
+    return tracker.summary()
+
+
+_usage_trackers: dict[str, UsageTracker] = {}
+_usage_trackers_lock = threading.Lock()
+
+
+def get_usage_tracker(provider_id: str, pricing: ModelPricing | None = None) -> UsageTracker:
+    """Return the usage tracker of `provider_id` for the current run."""
+    with _usage_trackers_lock:
+        tracker = _usage_trackers.get(provider_id)
+        if tracker is None:
+            tracker = UsageTracker(pricing)
+            _usage_trackers[provider_id] = tracker
+    return tracker
+
+
+def reset_usage_trackers() -> None:
+    with _usage_trackers_lock:
+        _usage_trackers.clear()
@@ -2,18 +2,26 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import functools
 import inspect
 import os
+import threading
 from collections.abc import Awaitable, Callable, Coroutine
 from typing import Any
 
 from langchain.prompts import PromptTemplate
 from langsmith import traceable
 
-from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName
+from langsmith_evaluation_helper.executors import create_process_pool_function
+from langsmith_evaluation_helper.llm.cache import ResponseCache, load_response_cache
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName, fake_config_kwargs
 from langsmith_evaluation_helper.llm.prompt_template_wrapper import (
     InputTypedPromptTemplate,
 )
+from langsmith_evaluation_helper.llm.rate_limit import get_rate_limiter
+from langsmith_evaluation_helper.llm.usage import get_usage_tracker
+from langsmith_evaluation_helper.metrics import stage_metrics
 from langsmith_evaluation_helper.utils import is_async_function, load_function
 
 
@@ -36,10 +44,19 @@ def has_inputs_argument(func: Callable[..., Any]) -> bool:
     return "inputs" in parameters
 
 
+# Maximum number of parsed templates kept for prompt functions that build a different template per example.
+PROMPT_TEMPLATE_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=PROMPT_TEMPLATE_CACHE_SIZE)
+def compile_prompt_template(template: str) -> PromptTemplate:
+    return PromptTemplate.from_template(template)
+
+
 def get_prompt_template_and_kwargs_from_input_typed_prompt_template(
     prompt: InputTypedPromptTemplate,
 ) -> tuple[PromptTemplate, dict[str, Any]]:
-    return PromptTemplate.from_template(prompt.template), prompt.input.model_dump()
+    return compile_prompt_template(prompt.template), prompt.input.model_dump()
 
 
 def get_prompt_template_and_kwargs_from_inputs(
@@ -49,26 +66,25 @@ def get_prompt_template_and_kwargs_from_inputs(
     for key, _ in inputs.items():
         kwargs[key] = inputs.get(key, "Unknown")
 
-    return PromptTemplate.from_template(prompt), kwargs
+    return compile_prompt_template(prompt), kwargs
 
 
 def has_input_typed_prompt_template_properties(obj: Any) -> bool:
     return hasattr(obj, "template") and hasattr(obj, "input")
 
 
-@traceable
-def execute_prompt(
-    inputs: dict[Any, Any],
-    prompt: str | InputTypedPromptTemplate,
-    provider: dict[Any, Any],
-) -> str:
+def get_prompt_template_and_kwargs(
+    inputs: dict[Any, Any], prompt: str | InputTypedPromptTemplate
+) -> tuple[PromptTemplate, dict[str, Any]]:
     if isinstance(prompt, str):
-        _prompt_template, kwargs = get_prompt_template_and_kwargs_from_inputs(prompt, inputs)
+        return get_prompt_template_and_kwargs_from_inputs(prompt, inputs)
     elif has_input_typed_prompt_template_properties(prompt):
-        _prompt_template, kwargs = get_prompt_template_and_kwargs_from_input_typed_prompt_template(prompt)
+        return get_prompt_template_and_kwargs_from_input_typed_prompt_template(prompt)
     else:
         raise ValueError(f"Invalid prompt type: {type(prompt)}")
 
+
+def create_chat_model(provider: dict[Any, Any], cache: ResponseCache | None = None) -> ChatModel:
     model_id = provider["id"]
     model = getattr(ChatModelName, model_id, None)
     provider_config = provider.get("config", {})
@@ -77,37 +93,111 @@ def execute_prompt(
     azure_api_version = provider_config.get("azure_api_version", None)
     if ("AZURE" in model_id) and (azure_deployment is None or azure_api_version is None):
         raise ValueError("Add azure_deployment and azure_api_version to config for Azure GPT models")
-    if model is not None:
-        llm = ChatModel(
-            default_model_name=model,
-            temperature=temperature,
-            azure_deployment=azure_deployment,
-            api_version=azure_api_version,
-            verbose=True,
-        )
-    else:
+    if model is None:
         raise ValueError(f"Invalid model_id: {model_id}")
 
-    result = llm.invoke(_prompt_template, **kwargs)
+    return ChatModel(
+        default_model_name=model,
+        temperature=temperature,
+        azure_deployment=azure_deployment,
+        api_version=azure_api_version,
+        cache=cache,
+        rate_limiter=get_rate_limiter(model_id, provider_config.get("rate_limit", None)),
+        usage_tracker=get_usage_tracker(model_id, provider_config.get("pricing", None)),
+        verbose=True,
+        **fake_config_kwargs(model, provider_config),
+    )
+
+
+@traceable
+def execute_prompt(
+    inputs: dict[Any, Any],
+    prompt: str | InputTypedPromptTemplate,
+    provider: dict[Any, Any],
+    cache: ResponseCache | None = None,
+) -> str:
+    with stage_metrics.timer("render_prompt", provider["id"]):
+        _prompt_template, kwargs = get_prompt_template_and_kwargs(inputs, prompt)
+    llm = create_chat_model(provider, cache)
+
+    with stage_metrics.timer("model_call", provider["id"]):
+        result = llm.invoke(_prompt_template, **kwargs)
+    return result
+
+
+@traceable
+async def async_execute_prompt(
+    inputs: dict[Any, Any],
+    prompt: str | InputTypedPromptTemplate,
+    provider: dict[Any, Any],
+    cache: ResponseCache | None = None,
+) -> str:
+    with stage_metrics.timer("render_prompt", provider["id"]):
+        _prompt_template, kwargs = get_prompt_template_and_kwargs(inputs, prompt)
+    llm = create_chat_model(provider, cache)
+
+    with stage_metrics.timer("model_call", provider["id"]):
+        result = await llm.async_invoke(_prompt_template, **kwargs)
     return result
 
 
 def load_prompt_template(
     config_path: str, prompt_config: dict[Any, Any], provider: dict[Any, Any]
 ) -> Callable[[dict[str, Any]], str] | Callable[[dict[str, Any]], Awaitable[str]]:
+    """
+    Build the run function for a `prompt` config.
+    The model is called asynchronously when the prompt function is async or `prompt.async` is set,
+    so `aevaluate` can keep many requests in flight on one event loop.
+    A prompt function without an `inputs` parameter returns the same prompt for every example,
+    so it is only called on the first run.
+    """
     prompt_func = load_prompt(config_path, prompt_config)
     is_async = is_async_function(prompt_func)
     has_inputs = has_inputs_argument(prompt_func)
+    use_async = is_async or bool(prompt_config["prompt"].get("async", False))
+    cache = load_response_cache(prompt_config.get("cache"))
+
+    constant_prompt: list[Any] = []
+    constant_prompt_lock = threading.Lock()
+    constant_prompt_task: asyncio.Future[Any] | None = None
+
+    async def get_prompt_async(inputs: dict[str, Any]) -> Any:
+        nonlocal constant_prompt_task
+        if has_inputs:
+            return await prompt_func(inputs) if is_async else prompt_func(inputs)
+        if constant_prompt_task is None:
+            # Concurrent first runs await the same call.
+            constant_prompt_task = asyncio.ensure_future(prompt_func() if is_async else asyncio.to_thread(prompt_func))
+            constant_prompt_task.add_done_callback(forget_failed_prompt)
+        return await constant_prompt_task
+
+    def forget_failed_prompt(task: asyncio.Future[Any]) -> None:
+        nonlocal constant_prompt_task
+        # A failed call is not kept, so the next run calls the prompt function again, as the sync path does.
+        if (task.cancelled() or task.exception() is not None) and constant_prompt_task is task:
+            constant_prompt_task = None
+
+    def get_prompt(inputs: dict[str, Any]) -> Any:
+        if has_inputs:
+            return prompt_func(inputs)
+        with constant_prompt_lock:
+            if not constant_prompt:
+                constant_prompt.append(prompt_func())
+        return constant_prompt[0]
 
     async def run_async(inputs: dict[str, Any]) -> str:
-        prompt = await prompt_func(inputs) if has_inputs else await prompt_func()
-        return execute_prompt(inputs, prompt, provider)
+        with stage_metrics.timer("prompt_function", provider["id"]):
+            prompt = await get_prompt_async(inputs)
+        with stage_metrics.timer("execute_prompt", provider["id"]):
+            return await async_execute_prompt(inputs, prompt, provider, cache)
 
     def run_sync(inputs: dict[str, Any]) -> str:
-        prompt = prompt_func(inputs) if has_inputs else prompt_func()
-        return execute_prompt(inputs, prompt, provider)
+        with stage_metrics.timer("prompt_function", provider["id"]):
+            prompt = get_prompt(inputs)
+        with stage_metrics.timer("execute_prompt", provider["id"]):
+            return execute_prompt(inputs, prompt, provider, cache)
 
-    return run_async if is_async else run_sync
+    return run_async if use_async else run_sync
 
 
 def load_prompt_function(
@@ -115,7 +205,12 @@ def load_prompt_function(
     prompt_file_name: str,
     entry_function_name: str,
     provider: dict[Any, Any],
+    executor: str = "thread",
+    max_workers: int | None = None,
 ) -> Callable[[dict[str, Any]], Any] | Callable[[dict[str, Any]], Coroutine[Any, Any, Any]]:
+    if executor not in ("thread", "process"):
+        raise ValueError(f"Invalid custom_run executor: {executor}")
+
     script_path = os.path.join(os.path.dirname(config_path), prompt_file_name)
     function_name = entry_function_name
     prompt_func = load_function(script_path, function_name)
@@ -135,8 +230,19 @@ def load_prompt_function(
         async def arun(inputs: dict[Any, Any]) -> Any:
             return await prompt_func(**create_kwargs(inputs))
 
+        if executor == "process":
+            raise ValueError("custom_run executor 'process' requires a synchronous entry_function")
+
         return arun
 
+    if executor == "process":
+        call_in_process = create_process_pool_function(script_path, function_name, max_workers)
+
+        def run_in_process(inputs: dict[Any, Any]) -> Any:
+            return call_in_process(create_kwargs(inputs))
+
+        return run_in_process
+
     def run(inputs: dict[Any, Any]) -> Any:
         return prompt_func(**create_kwargs(inputs))
 
@@ -158,6 +264,8 @@ def load_run_function(
             custom_run_config["file_path"],
             custom_run_config["entry_function"],
             provider,
+            executor=custom_run_config.get("executor", "thread"),
+            max_workers=custom_run_config.get("max_workers", None),
         )
     else:
         return load_prompt_template(config_path, config, provider)
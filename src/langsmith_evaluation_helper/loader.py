@@ -3,21 +3,47 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import contextlib
+import hashlib
+import itertools
+import json
 import os
 import sys
-from typing import Any
+from collections.abc import Iterable, Iterator
+from typing import Any, TypedDict
 
 import yaml
 from langsmith import Client, aevaluate, evaluate
+from langsmith.evaluation import evaluate_existing
+from langsmith.evaluation._arunner import _aevaluate
+from langsmith.evaluation._runner import _evaluate
+from langsmith.schemas import Example, Run, TracerSession
+from langsmith.utils import LangSmithConflictError, LangSmithNotFoundError
 
 from langsmith_evaluation_helper.builtin_evaluators import (
     generate_builtin_evaluator_functions,
+    generate_builtin_summary_evaluator_functions,
 )
+from langsmith_evaluation_helper.dataset_cache import iter_dataset_snapshot, load_dataset_cache
+from langsmith_evaluation_helper.executors import shutdown_process_pools
+from langsmith_evaluation_helper.journal import ExperimentJournal, default_journal_path
+from langsmith_evaluation_helper.llm.cache import load_response_cache
+from langsmith_evaluation_helper.llm.model import chat_model_pool
+from langsmith_evaluation_helper.llm.usage import UsageSummary, get_usage_tracker, reset_usage_trackers, runs_usage
 from langsmith_evaluation_helper.load_run_function import load_run_function
+from langsmith_evaluation_helper.metrics import DEFAULT_METRICS_HOST, load_metrics_config, serve_metrics, stage_metrics
+from langsmith_evaluation_helper.profiling import DEFAULT_STALL_THRESHOLD_MS, RunProfiler
+from langsmith_evaluation_helper.scheduler import ConcurrencyScheduler
 from langsmith_evaluation_helper.utils import is_async_function, load_function
 
 LANGCHAIN_TENANT_ID = os.getenv("LANGCHAIN_TENANT_ID", None)
 MAX_EXAMPLES_COUNT = 1000
+DEFAULT_CONFIG_PATH = "config.yml"
+
+
+class ExperimentSummary(TypedDict):
+    dataset_id: Any
+    experiment_ids: list[str | None]
 
 
 def load_config(config_path: Any) -> dict[str, Any]:
@@ -29,7 +55,103 @@ def load_config(config_path: Any) -> dict[str, Any]:
     return config
 
 
-def load_dataset(config: dict[Any, Any]) -> tuple[Any, Any, Any, list[str]]:
+def has_dataset_split(example: Example, splits: set[str]) -> bool:
+    return (
+        example.metadata is not None
+        and example.metadata.get("dataset_split", None) is not None
+        and bool(splits & set(example.metadata["dataset_split"]))
+    )
+
+
+def filter_examples(examples: Iterable[Example], splits: set[str] | None, limit: int | None) -> Iterator[Example]:
+    if splits:
+        examples = (example for example in examples if has_dataset_split(example, splits))
+    return iter(examples) if limit is None else itertools.islice(examples, limit)
+
+
+def iter_examples(client: Client, dataset_name: str, splits: set[str] | None, limit: int | None) -> Iterator[Example]:
+    """
+    Lazily yield up to `limit` examples of the dataset, restricted to `splits` when given.
+    The split and limit filters are pushed down to `list_examples`, and paging stops as soon as enough
+    matching examples have been read.
+    """
+    if splits:
+        # Filtered again locally in case the backend ignores the `splits` parameter.
+        examples = client.list_examples(dataset_name=dataset_name, splits=sorted(splits))
+    else:
+        examples = client.list_examples(dataset_name=dataset_name, limit=limit)
+
+    return filter_examples(examples, splits, limit)
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parse a shard specification such as "0/4" into (index, count).
+    """
+    try:
+        index_string, count_string = str(shard).split("/")
+        index, count = int(index_string), int(count_string)
+    except ValueError as error:
+        raise ValueError(f"Invalid shard: {shard}. Use INDEX/COUNT, e.g. 0/4") from error
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard: {shard}. INDEX must be between 0 and COUNT - 1")
+    return index, count
+
+
+def example_shard(example: Example, count: int) -> int:
+    # A stable hash (unlike `hash()`) so every process and machine assigns an example to the same shard.
+    digest = hashlib.sha256(str(example.id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def shard_examples(examples: Iterable[Example], index: int, count: int) -> list[Example]:
+    return [example for example in examples if example_shard(example, count) == index]
+
+
+def shard_run_digest(examples: Iterable[Example], shard_count: int, shard_run_id: Any = None) -> str:
+    """
+    Digest of the unsharded examples, the shard count and the `shard_run_id`. It is the same
+    in every shard process of a run, so they all name their experiments alike.
+    """
+    payload = json.dumps([str(shard_run_id or ""), shard_count, sorted(str(example.id) for example in examples)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:8]
+
+
+def shard_experiment_prefix(
+    experiment_prefix: str, examples: Iterable[Example], shard_count: int, shard_run_id: Any
+) -> str:
+    """Prefix of the experiments shared by every shard of one sharded run."""
+    if shard_run_id is None or str(shard_run_id) == "":
+        # Without it, running the same shards again would append duplicate runs to the experiments of the last run.
+        raise ValueError("Sharded runs need a shard_run_id (tests.shard_run_id or --shard-run-id), unique per run")
+    return f"{experiment_prefix}-{shard_count}shards-{shard_run_digest(examples, shard_count, shard_run_id)}-"
+
+
+def select_examples(test_info: dict[Any, Any], client: Client, refresh_dataset: bool = False) -> list[Example]:
+    """The examples of the `tests` config after `split` and `limit`, from the dataset snapshot when enabled."""
+    split_string = test_info.get("split")
+    limit = test_info.get("limit")
+    dataset_cache = load_dataset_cache(test_info.get("dataset_cache"))
+    filtered = split_string is not None or limit is not None or len(test_info.get("metadata_keys", [])) > 0
+    limit = int(limit) if limit is not None else (MAX_EXAMPLES_COUNT if filtered else None)
+    splits = set(split_string.split(" ")) if split_string is not None else None
+
+    if dataset_cache is not None:
+        snapshot = iter_dataset_snapshot(client, test_info["dataset_name"], dataset_cache, refresh=refresh_dataset)
+        selected_examples = filter_examples(snapshot, splits, limit)
+    else:
+        selected_examples = iter_examples(client, test_info["dataset_name"], splits, limit)
+    # The bounded examples are materialized once because every provider and repetition iterates over them.
+    return list(selected_examples)
+
+
+def load_dataset(
+    config: dict[Any, Any],
+    client: Client | None = None,
+    refresh_dataset: bool = False,
+    shard: str | None = None,
+    shard_run_id: Any = None,
+) -> tuple[Any, Any, Any, list[str]]:
     test_info = config["tests"]
 
     dataset_name = test_info["dataset_name"]
@@ -37,43 +159,39 @@ def load_dataset(config: dict[Any, Any]) -> tuple[Any, Any, Any, list[str]]:
     num_repetitions = test_info.get("num_repetitions", 1)
     metadata_keys = test_info.get("metadata_keys", [])
     split_string = test_info.get("split", None)
-    limit = test_info.get("limit", None)
+    shard = shard if shard is not None else test_info.get("shard", None)
+    shard_run_id = shard_run_id if shard_run_id is not None else test_info.get("shard_run_id", None)
 
-    if split_string is None and limit is None and len(metadata_keys) == 0:
+    filtered = split_string is not None or test_info.get("limit", None) is not None or len(metadata_keys) > 0
+    if not filtered and test_info.get("dataset_cache", None) is None and shard is None:
         return dataset_name, experiment_prefix, num_repetitions, metadata_keys
-    limit = int(limit) if limit is not None else MAX_EXAMPLES_COUNT
-
-    client = Client()
-    examples = list(client.list_examples(dataset_name=dataset_name))
 
-    if split_string is None and limit > 0:
-        return examples[:limit], experiment_prefix, num_repetitions, metadata_keys
-
-    splits = set(split_string.split(" "))
-
-    test_examples = [
-        example
-        for example in examples
-        if example.metadata is not None
-        and example.metadata.get("dataset_split", None) is not None
-        and bool(splits & set(example.metadata["dataset_split"]))
-    ]
+    examples = select_examples(test_info, client if client is not None else Client(), refresh_dataset)
 
-    test_examples = test_examples[:limit]
+    if shard is not None:
+        # Sharding is applied after split and limit, so the shards together cover exactly the unsharded run.
+        shard_index, shard_count = parse_shard(shard)
+        experiment_prefix = shard_experiment_prefix(experiment_prefix, examples, shard_count, shard_run_id)
+        examples = shard_examples(examples, shard_index, shard_count)
 
-    if len(test_examples) > 0:
-        return (test_examples, experiment_prefix, num_repetitions, metadata_keys)
+    if split_string is None or len(examples) > 0:
+        return examples, experiment_prefix, num_repetitions, metadata_keys
     else:
         raise ValueError(f"No examples found for the dataset split: {split_string}")
 
 
-def load_evaluators(config: dict[Any, Any]) -> tuple[Any, Any]:
+def load_evaluators(config: dict[Any, Any], config_path: str) -> tuple[Any, Any]:
     builtin_evaluators_config = config["tests"].get("assert", [])
-    builtin_evaluators = generate_builtin_evaluator_functions(builtin_evaluators_config)
+    builtin_evaluators = generate_builtin_evaluator_functions(
+        builtin_evaluators_config,
+        judge_fusion=config["tests"].get("judge_fusion", False),
+        judge_response_cache=load_response_cache(config["tests"].get("judge_cache")),
+    )
+    builtin_summary_evaluators = generate_builtin_summary_evaluator_functions(builtin_evaluators_config)
 
     evaluators_file_path = os.path.join(os.path.dirname(config_path), config["evaluators_file_path"])
     evaluators = load_function(evaluators_file_path, "evaluators") + builtin_evaluators
-    summary_evaluators = load_function(evaluators_file_path, "summary_evaluators")
+    summary_evaluators = load_function(evaluators_file_path, "summary_evaluators") + builtin_summary_evaluators
 
     return evaluators, summary_evaluators
 
@@ -83,10 +201,16 @@ async def run_evaluate(
     experiment_prefix: str,
     num_repetitions: int,
     metadatas: dict[str, Any] | None,
+    session: "ExperimentSession",
+    scheduler: ConcurrencyScheduler | None = None,
     **kwargs: dict[str, Any],
 ) -> tuple[Any, Any]:
     experiment_prefix_provider = experiment_prefix + provider["id"]
-    prompt_func = load_run_function(config_path, config_file, provider)
+    prompt_func = stage_metrics.wrap(
+        "target", provider["id"], load_run_function(session.config_path, session.config, provider)
+    )
+    if scheduler is not None:
+        prompt_func = scheduler.wrap(provider["id"], prompt_func)
 
     is_async = is_async_function(prompt_func)
 
@@ -98,22 +222,136 @@ async def run_evaluate(
         "experiment_prefix": experiment_prefix_provider,
         "num_repetitions": num_repetitions,
         "metadata": metadata,
+        "client": session.client,
         **kwargs,
     }
 
+    experiment = None
+    summary_evaluators = None
+    journal = session.journal
+    journal_record = journal.experiment(provider["id"]) if journal is not None and session.resume else None
+    if journal is not None:
+        # Last, so an example is journaled only after the other evaluators logged their feedback for it.
+        common_args["evaluators"] = [*(common_args.get("evaluators") or []), journal.evaluator(provider["id"])]
+    if journal is not None and journal_record is not None:
+        # Continue the experiment of the interrupted run with only the example repetitions it did not complete.
+        experiment = session.client.read_project(project_name=journal_record["experiment_name"])
+        data = common_args["data"]
+        if isinstance(data, str):
+            data = session.client.list_examples(dataset_name=data)
+        remaining = journal.remaining_examples(provider["id"], data, num_repetitions)
+        print(f"Resuming experiment {experiment.name}: {len(remaining)} runs left")
+        # The resumed call sees only the remaining examples, so the summaries are computed over every run after it.
+        summary_evaluators = common_args.pop("summary_evaluators", None)
+        if not remaining:
+            await asyncio.to_thread(
+                evaluate_experiment_summaries, session.client, str(experiment.id), summary_evaluators
+            )
+            return str(experiment.reference_dataset_id), str(experiment.id)
+        common_args.update(data=remaining, num_repetitions=1)
+    elif session.shard is not None:
+        # A shard sees only its slice of the examples: summaries and usage are left to `finalize_shards`.
+        common_args.pop("summary_evaluators", None)
+        # Every shard process writes into the one experiment of the provider, named without a random suffix.
+        experiment = read_or_create_experiment(
+            session.client,
+            experiment_prefix_provider,
+            session.config["tests"]["dataset_name"],
+            metadata,
+            common_args.get("description"),
+        )
+
+    experiment_id = None
     if is_async:
-        result = await aevaluate(prompt_func, **common_args)
-        dataset_id = await result._manager.get_dataset_id()
+        if experiment is not None:
+            async_result = await _aevaluate(prompt_func, experiment=experiment, **common_args)
+        else:
+            async_result = await aevaluate(prompt_func, **common_args)
+        dataset_id = await async_result._manager.get_dataset_id()
+        async_experiment = async_result._manager._experiment
+        if async_experiment is not None and async_experiment.id is not None:
+            experiment_id = str(async_experiment.id)
     else:
-        result = evaluate(prompt_func, **common_args)
+        # Sync evaluations run in a worker thread so they do not block the other providers on the event loop.
+        if experiment is not None:
+            result = await asyncio.to_thread(_evaluate, prompt_func, experiment=experiment, **common_args)
+        else:
+            result = await asyncio.to_thread(evaluate, prompt_func, **common_args)
         dataset_id = result._manager.dataset_id
-    experiment_id = None
-    if result._manager and result._manager._experiment and result._manager._experiment.id is not None:
-        experiment_id = result._manager._experiment.id.__str__()
+        sync_experiment = result._manager._experiment
+        if sync_experiment is not None and sync_experiment.id is not None:
+            experiment_id = str(sync_experiment.id)
+
+    if experiment_id is not None and summary_evaluators:
+        await asyncio.to_thread(evaluate_experiment_summaries, session.client, experiment_id, summary_evaluators)
+
+    usage = get_usage_tracker(provider["id"]).summary()
+    if experiment_id is not None and usage["calls"] > 0 and session.shard is None:
+        await asyncio.to_thread(record_experiment_usage, session.client, experiment_id, usage)
 
     return dataset_id, experiment_id
 
 
+def read_or_create_experiment(
+    client: Client, experiment_name: str, dataset_name: str, metadata: dict[str, Any], description: Any = None
+) -> TracerSession:
+    """The experiment named `experiment_name`, created unless another shard process already did."""
+    try:
+        return client.read_project(project_name=experiment_name)
+    except LangSmithNotFoundError:
+        pass
+    try:
+        return client.create_project(
+            experiment_name,
+            description=description,
+            metadata=metadata,
+            reference_dataset_id=client.read_dataset(dataset_name=dataset_name).id,
+        )
+    except LangSmithConflictError:
+        # Created meanwhile by another shard.
+        return client.read_project(project_name=experiment_name)
+
+
+def evaluate_experiment_summaries(
+    client: Client, experiment_id: str, summary_evaluators: Any, runs: list[Run] | None = None
+) -> None:
+    """
+    Apply `summary_evaluators` to every root run of the experiment, e.g. once a resumed run completed it.
+    This is `evaluate_existing` with summary evaluators only, except that each run is paired with its own example:
+    `evaluate_existing` pairs the sorted runs with the distinct examples, which misaligns them with repetitions.
+    """
+    if not summary_evaluators:
+        return
+    if runs is None:
+        runs = list(client.list_runs(project_id=experiment_id, is_root=True))
+    runs = [run for run in runs if run.reference_example_id]
+    if not runs:
+        return
+    example_ids = sorted({str(run.reference_example_id) for run in runs})
+    examples = {str(example.id): example for example in client.list_examples(example_ids=example_ids)}
+    runs = [run for run in runs if str(run.reference_example_id) in examples]
+    _evaluate(
+        runs,
+        data=[examples[str(run.reference_example_id)] for run in runs],
+        summary_evaluators=summary_evaluators,
+        client=client,
+    )
+
+
+def record_experiment_usage(client: Client, experiment_id: str, usage: UsageSummary) -> None:
+    """Add the token usage of the provider to the metadata of its experiment."""
+    experiment = client.read_project(project_id=experiment_id)
+    # `update_project` sends every field and replaces `extra` as a whole, so the current values are sent back.
+    extra = experiment.extra or {}
+    client.update_project(
+        experiment_id,
+        description=experiment.description,
+        metadata={**(extra.get("metadata") or {}), "usage": usage},
+        project_extra=extra,
+        end_time=experiment.end_time,
+    )
+
+
 def extract_metadata(dataset_examples: str | list[Any], metadata_keys: list[str]) -> dict[str, Any] | None:
     if (
         len(metadata_keys) == 0
@@ -131,53 +369,270 @@ def extract_metadata(dataset_examples: str | list[Any], metadata_keys: list[str]
     return metadatas if len(metadatas) > 0 else None
 
 
-async def main(config_file: dict[Any, Any]) -> None:
-    dataset_examples, experiment_prefix, num_repetitions, metadata_keys = load_dataset(config_file)
-    metadatas = extract_metadata(dataset_examples, metadata_keys)
-    evaluators, summary_evaluators = load_evaluators(config_file)
-    max_concurrency = config_file["tests"].get("max_concurrency", None)
-    providers = config_file["providers"]
-    description = config_file["description"]
-
-    dataset_id = None
-    experiment_ids = []
-
-    tasks = [
-        run_evaluate(
-            provider,
-            experiment_prefix,
-            data=dataset_examples,
-            evaluators=evaluators,
-            summary_evaluators=summary_evaluators,
-            max_concurrency=max_concurrency,
-            num_repetitions=num_repetitions,
-            metadatas=metadatas,
-            description=description,
-        )
-        for provider in providers
-    ]
+def format_usage(provider_id: str, usage: UsageSummary) -> str:
+    line = (
+        f"{provider_id} usage: {usage['calls']} calls, {usage['input_tokens']} input tokens, "
+        f"{usage['output_tokens']} output tokens"
+    )
+    if usage["output_tokens_per_second"] is not None:
+        line += f", {usage['output_tokens_per_second']:.1f} output tokens/s"
+    if usage["estimated_cost"] is not None:
+        line += f", ${usage['estimated_cost']:.4f}"
+    return line
 
-    # Run all tasks concurrently using asyncio.gather
-    results = await asyncio.gather(*tasks)
 
-    # Unpack results and collect dataset and experiment IDs
-    for _dataset_id, experiment_id in results:
-        dataset_id = _dataset_id
-        experiment_ids.append(experiment_id)
-
-    # Print the final comparison URL if there are multiple providers
-    if len(providers) > 1:
-        seed_url = "https://smith.langchain.com/o/"
-        experiment_id_query_str = "%2C".join(experiment_ids)
+class ExperimentSession:
+    """
+    State shared by every provider run of one config: the loaded config, the LangSmith client and the dataset.
+    A session can be run repeatedly without reloading the config or re-fetching the dataset.
+    """
 
-        url = (
-            f"{seed_url}{LANGCHAIN_TENANT_ID}/datasets/{dataset_id}/compare?selectedSessions={experiment_id_query_str}"
+    def __init__(
+        self,
+        config_path: str,
+        config: dict[Any, Any] | None = None,
+        client: Client | None = None,
+        refresh_dataset: bool = False,
+        shard: str | None = None,
+        resume: bool = False,
+        shard_run_id: str | None = None,
+    ) -> None:
+        self.config_path = config_path
+        self.config = config if config is not None else load_config(config_path)
+        self.refresh_dataset = refresh_dataset
+        self.shard = shard if shard is not None else self.config["tests"].get("shard", None)
+        self.shard_run_id = shard_run_id
+        self.resume = resume
+        self.journal: ExperimentJournal | None = None
+        self._client = client
+        self._dataset: tuple[Any, Any, Any, list[str]] | None = None
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            self._client = Client()
+        return self._client
+
+    @property
+    def dataset(self) -> tuple[Any, Any, Any, list[str]]:
+        if self._dataset is None:
+            with stage_metrics.timer("load_dataset"):
+                self._dataset = load_dataset(
+                    self.config,
+                    client=self.client,
+                    refresh_dataset=self.refresh_dataset,
+                    shard=self.shard,
+                    shard_run_id=self.shard_run_id,
+                )
+        return self._dataset
+
+    async def run(self) -> ExperimentSummary:
+        stage_metrics.reset()
+        reset_usage_trackers()
+        # Pooled async clients are bound to the event loop of the previous run.
+        chat_model_pool.clear()
+        dataset_examples, experiment_prefix, num_repetitions, metadata_keys = self.dataset
+        metadatas = extract_metadata(dataset_examples, metadata_keys)
+        if self.shard is not None:
+            # The experiments are shared by every shard, so only the shard count describes them.
+            metadatas = {**(metadatas or {}), "shard_count": parse_shard(self.shard)[1]}
+        evaluators, summary_evaluators = load_evaluators(self.config, self.config_path)
+        max_concurrency = self.config["tests"].get("max_concurrency", None)
+        providers = self.config["providers"]
+        description = self.config["description"]
+        scheduler = ConcurrencyScheduler.from_config(self.config, asyncio.get_running_loop())
+        journal_path = self.config["tests"].get("journal") or default_journal_path(self.config_path, self.shard)
+        metrics_config = load_metrics_config(self.config["tests"].get("metrics", None))
+        self.journal = ExperimentJournal(journal_path, resume=self.resume)
+
+        dataset_id = None
+        experiment_ids = []
+
+        tasks = [
+            stage_metrics.wrap("run_evaluate", provider["id"], run_evaluate)(
+                provider,
+                experiment_prefix,
+                data=dataset_examples,
+                evaluators=stage_metrics.wrap_evaluators(evaluators, provider["id"]),
+                summary_evaluators=stage_metrics.wrap_evaluators(
+                    summary_evaluators, provider["id"], stage="summary_evaluator"
+                ),
+                max_concurrency=scheduler.provider_limits.get(provider["id"]) or max_concurrency,
+                num_repetitions=num_repetitions,
+                metadatas=metadatas,
+                description=description,
+                session=self,
+                scheduler=scheduler,
+            )
+            for provider in providers
+        ]
+
+        # Run all tasks concurrently using asyncio.gather
+        try:
+            with contextlib.ExitStack() as stack:
+                if metrics_config is not None and metrics_config.get("port") is not None:
+                    server = stack.enter_context(
+                        serve_metrics(
+                            stage_metrics, metrics_config.get("host", DEFAULT_METRICS_HOST), metrics_config["port"]
+                        )
+                    )
+                    print(f"Serving stage metrics at {server.endpoint}")
+                results = await asyncio.gather(*tasks)
+        finally:
+            self.journal.close()
+            shutdown_process_pools()
+            # Written for failed runs too, since those are the ones worth diagnosing.
+            if metrics_config is not None and metrics_config.get("path"):
+                stage_metrics.write(metrics_config["path"])
+                print(f"Stage metrics written to {metrics_config['path']}")
+
+        # Unpack results and collect dataset and experiment IDs
+        for _dataset_id, experiment_id in results:
+            dataset_id = _dataset_id
+            experiment_ids.append(experiment_id)
+
+        pool_stats = chat_model_pool.stats()
+        print(
+            f"Chat model pool: {pool_stats['hits']} hits, {pool_stats['misses']} misses, {pool_stats['size']} clients"
         )
-        print(url)
+        for provider in providers:
+            usage = get_usage_tracker(provider["id"]).summary()
+            if usage["calls"] > 0:
+                print(format_usage(provider["id"], usage))
+
+        # Print the final comparison URL if there are multiple providers
+        if len(providers) > 1:
+            seed_url = "https://smith.langchain.com/o/"
+            experiment_id_query_str = "%2C".join(str(experiment_id) for experiment_id in experiment_ids)
+
+            url = f"{seed_url}{LANGCHAIN_TENANT_ID}/datasets/{dataset_id}/compare?selectedSessions={experiment_id_query_str}"
+            print(url)
+
+        if self.shard is not None:
+            print(
+                "Once every shard has finished, run `langsmith-evaluation-helper finalize` for the summaries and usage"
+            )
+
+        return {"dataset_id": dataset_id, "experiment_ids": experiment_ids}
+
+    def finalize_shards(self, shard_count: int | None = None) -> ExperimentSummary:
+        """
+        Apply the summary evaluators to the experiments of a sharded run and record the token usage of every shard,
+        once all shards have finished. Neither is done by the shards themselves, which see only their own examples.
+        """
+        if shard_count is None:
+            if self.shard is None:
+                raise ValueError("Finalizing needs the shard count: pass --shard-count or set tests.shard")
+            shard_count = parse_shard(self.shard)[1]
+        test_info = self.config["tests"]
+        shard_run_id = self.shard_run_id if self.shard_run_id is not None else test_info.get("shard_run_id", None)
+        examples = select_examples(test_info, self.client, self.refresh_dataset)
+        experiment_prefix = shard_experiment_prefix(test_info["experiment_prefix"], examples, shard_count, shard_run_id)
+        expected_runs = len(examples) * test_info.get("num_repetitions", 1)
+        _, summary_evaluators = load_evaluators(self.config, self.config_path)
+
+        dataset_id = None
+        experiment_ids: list[str | None] = []
+        for provider in self.config["providers"]:
+            experiment_name = experiment_prefix + provider["id"]
+            try:
+                experiment = self.client.read_project(project_name=experiment_name)
+            except LangSmithNotFoundError:
+                print(f"[Warning] Experiment {experiment_name} not found. Has any shard of this run finished?")
+                experiment_ids.append(None)
+                continue
+            runs = list(self.client.list_runs(project_id=experiment.id, is_root=True))
+            if len(runs) < expected_runs:
+                print(
+                    f"[Warning] Experiment {experiment_name} has {len(runs)} of {expected_runs} runs. "
+                    "Summaries and usage cover only the shards that finished"
+                )
+            evaluate_experiment_summaries(self.client, str(experiment.id), summary_evaluators, runs=runs)
+            usage = runs_usage(runs, provider.get("config", {}).get("pricing", None))
+            if usage["calls"] > 0:
+                record_experiment_usage(self.client, str(experiment.id), usage)
+                print(format_usage(provider["id"], usage))
+            dataset_id = str(experiment.reference_dataset_id)
+            experiment_ids.append(str(experiment.id))
+
+        return {"dataset_id": dataset_id, "experiment_ids": experiment_ids}
+
+    async def reevaluate(self, experiments: list[str]) -> list[str | None]:
+        """
+        Apply the current evaluators and asserts of the config to the runs of existing experiments.
+        Feedback is added to the same experiments and the targets are not called again.
+        """
+        evaluators, summary_evaluators = load_evaluators(self.config, self.config_path)
+        max_concurrency = self.config["tests"].get("max_concurrency", None)
+
+        tasks = [
+            asyncio.to_thread(
+                evaluate_existing,
+                experiment,
+                evaluators=evaluators,
+                summary_evaluators=summary_evaluators,
+                max_concurrency=max_concurrency,
+                client=self.client,
+            )
+            for experiment in experiments
+        ]
+        results = await asyncio.gather(*tasks)
+
+        experiment_ids: list[str | None] = []
+        for result in results:
+            experiment = result._manager._experiment if result._manager else None
+            experiment_ids.append(str(experiment.id) if experiment is not None and experiment.id is not None else None)
+        return experiment_ids
+
+
+async def main(config_file: dict[Any, Any], config_path: str = DEFAULT_CONFIG_PATH) -> ExperimentSummary:
+    return await ExperimentSession(config_path, config_file).run()
+
+
+def run_experiment(
+    config_path: str,
+    refresh_dataset: bool = False,
+    shard: str | None = None,
+    resume: bool = False,
+    profile: str | None = None,
+    stall_threshold_ms: float = DEFAULT_STALL_THRESHOLD_MS,
+    shard_run_id: str | None = None,
+) -> ExperimentSummary:
+    """
+    Run every provider of the config file at `config_path` in the current process.
+    With `shard` ("INDEX/COUNT") only the examples of that shard are run, into experiments shared by every shard
+    of the run `shard_run_id`.
+    With `resume`, the experiments of the previous run of the same config continue where it stopped.
+    With `profile`, CPU and memory profiles and event loop stalls longer than `stall_threshold_ms`
+    are written to that directory.
+    """
+    session = ExperimentSession(
+        config_path, refresh_dataset=refresh_dataset, shard=shard, resume=resume, shard_run_id=shard_run_id
+    )
+    if profile is None:
+        return asyncio.run(session.run())
+    with RunProfiler(profile, stall_threshold_ms=stall_threshold_ms) as profiler:
+        return asyncio.run(profiler.watch(session.run()))
+
+
+def finalize_shards(
+    config_path: str, shard_count: int | None = None, shard_run_id: str | None = None
+) -> ExperimentSummary:
+    """
+    Compute the summaries and the usage of the experiments of a sharded run of the config file at `config_path`
+    over the runs of every shard.
+    """
+    session = ExperimentSession(config_path, shard_run_id=shard_run_id)
+    return session.finalize_shards(shard_count)
 
 
-if __name__ == "__main__":
-    config_path = sys.argv[1] if len(sys.argv) > 1 else "config.yml"
-    config_file = load_config(config_path)
+def reevaluate_experiments(config_path: str, experiments: list[str]) -> list[str | None]:
+    """
+    Re-run the evaluators of the config file at `config_path` on existing experiments, given by name or id.
+    """
+    session = ExperimentSession(config_path)
+    return asyncio.run(session.reevaluate(experiments))
+
 
-    asyncio.run(main(config_file))
+if __name__ == "__main__":
+    run_experiment(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CONFIG_PATH)
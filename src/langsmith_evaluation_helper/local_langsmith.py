@@ -0,0 +1,445 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from collections.abc import Callable, Iterable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_LOCAL_LANGSMITH_PATH = os.path.join(".langsmith_evaluation_helper", "langsmith.sqlite3")
+DEFAULT_LOCAL_LANGSMITH_HOST = "127.0.0.1"
+DEFAULT_LOCAL_LANGSMITH_PORT = 1984
+
+TENANT_ID = "00000000-0000-0000-0000-000000000000"
+TABLES = ("datasets", "examples", "sessions", "runs", "feedback")
+RUNS_PAGE_SIZE = 100
+# Filters of `POST /runs/query` written in the LangSmith query language, which the stand-in does not evaluate.
+UNSUPPORTED_RUN_FILTERS = ("query", "filter", "trace_filter", "tree_filter")
+
+INFO = {
+    "version": "local",
+    "batch_ingest_config": {
+        "size_limit": 100,
+        "size_limit_bytes": 20_971_520,
+        "scale_up_nthreads_limit": 16,
+        "scale_up_qsize_trigger": 1000,
+        "scale_down_nempty_trigger": 4,
+    },
+}
+
+Query = dict[str, list[str]]
+Response = tuple[int, Any]
+Handler = Callable[..., Response]
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
+def not_found(kind: str) -> Response:
+    return 404, {"detail": f"{kind} not found"}
+
+
+class LocalLangSmith:
+    """
+    SQLite backed stand-in for the part of the LangSmith API that the helper and `evaluate`/`aevaluate` use:
+    datasets, examples, sessions (projects and experiments), batch ingest and queries of runs, and feedback.
+
+    Every resource is stored as its JSON body plus the few columns that requests filter on. `handle` maps a
+    request to a response, so the same store can be served over HTTP (`serve`) or called in-process.
+    """
+
+    def __init__(self, path: str = DEFAULT_LOCAL_LANGSMITH_PATH) -> None:
+        if path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+        for table in TABLES:
+            self._connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    parent_id TEXT,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_name ON {table} (name)")
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_parent_id ON {table} (parent_id)")
+        self._connection.commit()
+
+        self._routes: list[tuple[str, re.Pattern[str], Handler]] = [
+            ("GET", re.compile(r"/info"), self.get_info),
+            ("GET", re.compile(r"/datasets"), self.list_datasets),
+            ("POST", re.compile(r"/datasets"), self.create_dataset_record),
+            ("GET", re.compile(r"/datasets/(?P<id>[^/]+)"), self.get_dataset),
+            ("GET", re.compile(r"/examples"), self.list_examples),
+            ("POST", re.compile(r"/examples"), self.create_example),
+            ("POST", re.compile(r"/examples/bulk"), self.create_examples),
+            ("GET", re.compile(r"/examples/(?P<id>[^/]+)"), self.get_example),
+            ("GET", re.compile(r"/sessions"), self.list_sessions),
+            ("POST", re.compile(r"/sessions"), self.create_session),
+            ("GET", re.compile(r"/sessions/(?P<id>[^/]+)"), self.get_session),
+            ("PATCH", re.compile(r"/sessions/(?P<id>[^/]+)"), self.update_session),
+            ("POST", re.compile(r"/runs/batch"), self.ingest_runs),
+            ("POST", re.compile(r"/runs/query"), self.query_runs),
+            ("POST", re.compile(r"/runs"), self.create_run),
+            ("GET", re.compile(r"/runs/(?P<id>[^/]+)"), self.get_run),
+            ("PATCH", re.compile(r"/runs/(?P<id>[^/]+)"), self.update_run),
+            ("GET", re.compile(r"/feedback"), self.list_feedback),
+            ("POST", re.compile(r"/feedback"), self.create_feedback),
+        ]
+
+    def handle(self, method: str, path: str, query: Query, body: Any) -> Response:
+        """Answer one API request. `path` is relative to the API root and `body` is the decoded JSON body."""
+        for route_method, pattern, handler in self._routes:
+            match = pattern.fullmatch(path.rstrip("/"))
+            if route_method == method and match is not None:
+                with self._lock:
+                    response = handler(query, body, **match.groupdict())
+                    self._connection.commit()
+                return response
+        return 404, {"detail": f"Not found: {method} {path}"}
+
+    def create_dataset(self, name: str, examples: Iterable[dict[str, Any]]) -> str:
+        """
+        Seed a dataset and return its id. Each example is a dict with `inputs` and optionally `outputs` and `metadata`.
+        """
+        with self._lock:
+            _, dataset = self.create_dataset_record({}, {"name": name})
+            self.create_examples({}, [{**example, "dataset_id": dataset["id"]} for example in examples])
+            self._connection.commit()
+        return dataset["id"]
+
+    def records(self, table: str) -> list[dict[str, Any]]:
+        """Every stored record of `table`, in insertion order."""
+        if table not in TABLES:
+            raise ValueError(f"Invalid table: {table}")
+        with self._lock:
+            return [
+                json.loads(data) for (data,) in self._connection.execute(f"SELECT data FROM {table} ORDER BY rowid")
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _get(self, table: str, record_id: str) -> dict[str, Any] | None:
+        row = self._connection.execute(f"SELECT data FROM {table} WHERE id = ?", (record_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _put(self, table: str, record: dict[str, Any], name: str | None = None, parent_id: Any = None) -> None:
+        self._connection.execute(
+            # An upsert rather than INSERT OR REPLACE keeps the rowid, so updated records keep their list order.
+            f"""
+            INSERT INTO {table} (id, name, parent_id, data) VALUES (?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET name = excluded.name, parent_id = excluded.parent_id, data = excluded.data
+            """,
+            (
+                record["id"],
+                name,
+                str(parent_id) if parent_id is not None else None,
+                json.dumps(record, default=str),
+            ),
+        )
+
+    def _list(self, table: str, query: Query, filters: dict[str, str], paginate: bool = True) -> list[dict[str, Any]]:
+        """Records matching every `filters` query parameter (mapped to its column), paged by `offset`/`limit`."""
+        conditions = []
+        parameters: list[Any] = []
+        for parameter, column in filters.items():
+            values = query.get(parameter)
+            if values:
+                conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                parameters.extend(values)
+        sql = f"SELECT data FROM {table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY rowid"
+        if paginate:
+            sql += " LIMIT ? OFFSET ?"
+            parameters += [int(query.get("limit", ["100"])[0]), int(query.get("offset", ["0"])[0])]
+        return [json.loads(data) for (data,) in self._connection.execute(sql, parameters)]
+
+    def get_info(self, query: Query, body: Any) -> Response:
+        return 200, INFO
+
+    def _with_example_count(self, dataset: dict[str, Any]) -> dict[str, Any]:
+        (count,) = self._connection.execute(
+            "SELECT COUNT(*) FROM examples WHERE parent_id = ?", (dataset["id"],)
+        ).fetchone()
+        return {**dataset, "example_count": count}
+
+    def list_datasets(self, query: Query, body: Any) -> Response:
+        datasets = self._list("datasets", query, {"name": "name", "id": "id"})
+        return 200, [self._with_example_count(dataset) for dataset in datasets]
+
+    def create_dataset_record(self, query: Query, body: Any) -> Response:
+        if self._connection.execute("SELECT 1 FROM datasets WHERE name = ?", (body.get("name"),)).fetchone():
+            return 409, {"detail": "Dataset already exists"}
+        dataset: dict[str, Any] = {
+            "data_type": "kv",
+            "description": None,
+            **body,
+            "id": str(body.get("id") or uuid.uuid4()),
+            "tenant_id": TENANT_ID,
+            "created_at": now(),
+            "modified_at": now(),
+        }
+        self._put("datasets", dataset, name=dataset["name"])
+        return 200, self._with_example_count(dataset)
+
+    def get_dataset(self, query: Query, body: Any, id: str) -> Response:
+        dataset = self._get("datasets", id)
+        return (200, self._with_example_count(dataset)) if dataset is not None else not_found("Dataset")
+
+    def list_examples(self, query: Query, body: Any) -> Response:
+        splits = set(query.get("splits", []))
+        if not splits:
+            return 200, self._list("examples", query, {"dataset": "parent_id", "id": "id"})
+
+        examples = [
+            example
+            for example in self._list("examples", query, {"dataset": "parent_id", "id": "id"}, paginate=False)
+            if splits & set((example.get("metadata") or {}).get("dataset_split", []))
+        ]
+        offset, limit = int(query.get("offset", ["0"])[0]), int(query.get("limit", ["100"])[0])
+        return 200, examples[offset : offset + limit]
+
+    def create_example(self, query: Query, body: Any) -> Response:
+        dataset = self._get("datasets", str(body.get("dataset_id")))
+        if dataset is None:
+            return not_found("Dataset")
+        example: dict[str, Any] = {
+            "outputs": None,
+            "metadata": None,
+            **body,
+            "id": str(body.get("id") or uuid.uuid4()),
+            "created_at": now(),
+            "modified_at": now(),
+        }
+        self._put("examples", example, parent_id=example["dataset_id"])
+        # Keeps dataset versions (modified_at and example_count) meaningful for the dataset snapshot cache.
+        self._put("datasets", {**dataset, "modified_at": example["modified_at"]}, name=dataset["name"])
+        return 200, example
+
+    def create_examples(self, query: Query, body: Any) -> Response:
+        examples = []
+        for example in body:
+            status, response = self.create_example(query, example)
+            if status != 200:
+                return status, response
+            examples.append(response)
+        return 200, examples
+
+    def get_example(self, query: Query, body: Any, id: str) -> Response:
+        example = self._get("examples", id)
+        return (200, example) if example is not None else not_found("Example")
+
+    def list_sessions(self, query: Query, body: Any) -> Response:
+        return 200, self._list("sessions", query, {"name": "name", "id": "id", "reference_dataset": "parent_id"})
+
+    def create_session(self, query: Query, body: Any) -> Response:
+        if self._connection.execute("SELECT 1 FROM sessions WHERE name = ?", (body.get("name"),)).fetchone():
+            return 409, {"detail": "Session already exists"}
+        session: dict[str, Any] = {
+            "start_time": now(),
+            **body,
+            "id": str(body.get("id") or uuid.uuid4()),
+            "tenant_id": TENANT_ID,
+        }
+        self._put("sessions", session, name=session.get("name"), parent_id=session.get("reference_dataset_id"))
+        return 200, session
+
+    def get_session(self, query: Query, body: Any, id: str) -> Response:
+        session = self._get("sessions", id)
+        return (200, session) if session is not None else not_found("Session")
+
+    def update_session(self, query: Query, body: Any, id: str) -> Response:
+        session = self._get("sessions", id)
+        if session is None:
+            return not_found("Session")
+        session.update({key: value for key, value in body.items() if value is not None})
+        self._put("sessions", session, name=session.get("name"), parent_id=session.get("reference_dataset_id"))
+        return 200, session
+
+    def _session_id(self, name: str) -> str:
+        """Id of the session named `name`. Like LangSmith, tracing to an unknown project creates it."""
+        row = self._connection.execute("SELECT id FROM sessions WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.create_session({}, {"name": name})[1]["id"]
+
+    def _upsert_run(self, run: dict[str, Any]) -> None:
+        run_id = str(run["id"])
+        stored = self._get("runs", run_id) or {}
+        merged = {**stored, **run, "id": run_id}
+        if merged.get("session_id") is None and merged.get("session_name") is not None:
+            merged["session_id"] = self._session_id(merged["session_name"])
+        # Runs created without tracing context are their own trace, as in LangSmith.
+        if merged.get("trace_id") is None:
+            merged["trace_id"] = run_id
+        if merged.get("dotted_order") is None:
+            start_time = datetime.datetime.fromisoformat(str(merged.get("start_time") or now()))
+            merged["dotted_order"] = f"{start_time:%Y%m%dT%H%M%S%fZ}{run_id}"
+        self._put("runs", merged, name=merged.get("name"), parent_id=merged.get("session_id"))
+
+    def ingest_runs(self, query: Query, body: Any) -> Response:
+        # The whole batch is written in one transaction, committed by `handle`.
+        for run in body.get("post", []) + body.get("patch", []):
+            self._upsert_run(run)
+        return 202, {}
+
+    def create_run(self, query: Query, body: Any) -> Response:
+        self._upsert_run(body)
+        return 202, {}
+
+    def get_run(self, query: Query, body: Any, id: str) -> Response:
+        run = self._get("runs", id)
+        return (200, run) if run is not None else not_found("Run")
+
+    def update_run(self, query: Query, body: Any, id: str) -> Response:
+        self._upsert_run({**body, "id": id})
+        return 202, {}
+
+    def query_runs(self, query: Query, body: Any) -> Response:
+        """
+        `Client.list_runs`: runs filtered by session, id, trace, parent, reference example, run type, error and
+        root (`is_root`, or `execution_order: 1` of older clients), paged by an offset cursor.
+        """
+        body = body or {}
+        unsupported = [key for key in UNSUPPORTED_RUN_FILTERS if body.get(key)]
+        if unsupported:
+            return 400, {"detail": f"Run filters not supported by the local LangSmith: {unsupported}"}
+        sessions = [str(session) for session in body.get("session") or []]
+        runs = self._list("runs", {"session": sessions} if sessions else {}, {"session": "parent_id"}, paginate=False)
+
+        def matches(run: dict[str, Any], key: str, field: str) -> bool:
+            values = body.get(key)
+            if values is None:
+                return True
+            values = values if isinstance(values, list) else [values]
+            return str(run.get(field)) in {str(value) for value in values}
+
+        root_only = body.get("is_root") or body.get("execution_order") == 1
+        runs = [
+            run
+            for run in runs
+            if matches(run, "id", "id")
+            and matches(run, "trace", "trace_id")
+            and matches(run, "parent_run", "parent_run_id")
+            and matches(run, "reference_example", "reference_example_id")
+            and matches(run, "run_type", "run_type")
+            and (not root_only or run.get("parent_run_id") is None)
+            and (body.get("error") is None or bool(run.get("error")) == body["error"])
+        ]
+        offset = int(body.get("cursor") or 0)
+        next_offset = offset + RUNS_PAGE_SIZE
+        return 200, {
+            "runs": runs[offset:next_offset],
+            "cursors": {"next": str(next_offset) if next_offset < len(runs) else None},
+        }
+
+    def list_feedback(self, query: Query, body: Any) -> Response:
+        return 200, self._list("feedback", query, {"run": "parent_id", "key": "name", "id": "id"})
+
+    def create_feedback(self, query: Query, body: Any) -> Response:
+        feedback: dict[str, Any] = {
+            **body,
+            "id": str(body.get("id") or uuid.uuid4()),
+            "created_at": now(),
+            "modified_at": now(),
+        }
+        self._put("feedback", feedback, name=feedback.get("key"), parent_id=feedback.get("run_id"))
+        return 200, feedback
+
+
+class LocalLangSmithRequestHandler(BaseHTTPRequestHandler):
+    server: "LocalLangSmithServer"
+
+    def _dispatch(self) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            status, response = 400, {"detail": "Invalid JSON body"}
+        else:
+            try:
+                status, response = self.server.store.handle(self.command, url.path, parse_qs(url.query), body)
+            except Exception as error:
+                status, response = 500, {"detail": repr(error)}
+
+        payload = json.dumps(response, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch  # noqa: N815
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class LocalLangSmithServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], store: LocalLangSmith, verbose: bool = False) -> None:
+        super().__init__(address, LocalLangSmithRequestHandler)
+        self.store = store
+        self.verbose = verbose
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+
+def create_server(
+    path: str = DEFAULT_LOCAL_LANGSMITH_PATH,
+    host: str = DEFAULT_LOCAL_LANGSMITH_HOST,
+    port: int = DEFAULT_LOCAL_LANGSMITH_PORT,
+    verbose: bool = False,
+) -> LocalLangSmithServer:
+    """HTTP server of a `LocalLangSmith` stored at `path`. Port 0 picks a free port."""
+    return LocalLangSmithServer((host, port), LocalLangSmith(path), verbose=verbose)
+
+
+def serve(
+    path: str = DEFAULT_LOCAL_LANGSMITH_PATH,
+    host: str = DEFAULT_LOCAL_LANGSMITH_HOST,
+    port: int = DEFAULT_LOCAL_LANGSMITH_PORT,
+    verbose: bool = False,
+) -> None:
+    """
+    Serve the local LangSmith stand-in until interrupted.
+    """
+    server = create_server(path, host, port, verbose=verbose)
+    print(f"Local LangSmith at {server.endpoint} (data in {path})")
+    print(f"Point the helper at it with: export LANGCHAIN_ENDPOINT={server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.close()
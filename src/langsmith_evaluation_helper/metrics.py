@@ -0,0 +1,248 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import contextlib
+import inspect
+import json
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, TypedDict
+
+from langsmith_evaluation_helper.utils import is_async_function
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+METRIC_PREFIX = "langsmith_evaluation_helper_stage"
+QUANTILES = (50, 95, 99)
+
+StageListener = Callable[[str, str | None, float, bool], None]
+
+
+class MetricsConfig(TypedDict, total=False):
+    path: str
+    host: str
+    port: int
+
+
+class StageStats(TypedDict):
+    stage: str
+    provider: str | None
+    count: int
+    errors: int
+    sum: float
+    max: float
+    p50: float
+    p95: float
+    p99: float
+
+
+def percentile(values: list[float], percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class StageMetrics:
+    """
+    Durations of the stages of a run (dataset fetch, target, prompt function, model call, evaluators, ...),
+    kept per stage and provider. Every call is kept, so the quantiles are exact; a run has at most a few
+    thousand calls per stage.
+    """
+
+    def __init__(self) -> None:
+        self._durations: dict[tuple[str, str | None], list[float]] = {}
+        self._errors: Counter[tuple[str, str | None]] = Counter()
+        self._listeners: list[StageListener] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: StageListener) -> None:
+        """Call `listener(stage, provider, seconds, error)` after each recorded stage."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: StageListener) -> None:
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def record(self, stage: str, provider: str | None, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._durations.setdefault((stage, provider), []).append(seconds)
+            if error:
+                self._errors[(stage, provider)] += 1
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(stage, provider, seconds, error)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, provider: str | None = None) -> Iterator[None]:
+        """Record the duration of the block; a block that raises counts as an error."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(stage, provider, time.perf_counter() - start, error=True)
+            raise
+        self.record(stage, provider, time.perf_counter() - start)
+
+    def wrap(self, stage: str, provider: str | None, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Return `func` (sync or async) timed under `stage`."""
+        if is_async_function(func):
+
+            async def run_async(*args: Any, **kwargs: Any) -> Any:
+                with self.timer(stage, provider):
+                    return await func(*args, **kwargs)
+
+            run_async.__name__ = func.__name__
+            return run_async
+
+        def run_sync(*args: Any, **kwargs: Any) -> Any:
+            with self.timer(stage, provider):
+                return func(*args, **kwargs)
+
+        run_sync.__name__ = func.__name__
+        return run_sync
+
+    def wrap_evaluators(
+        self, evaluators: Iterable[Any] | None, provider: str | None, stage: str = "evaluator"
+    ) -> list[Any]:
+        """
+        Time each evaluator function as `<stage>:<name>`. `RunEvaluator` objects are passed through untimed,
+        since `evaluate` calls their methods rather than the object.
+        """
+        return [
+            self.wrap(f"{stage}:{evaluator.__name__}", provider, evaluator)
+            if inspect.isfunction(evaluator) or inspect.ismethod(evaluator)
+            else evaluator
+            for evaluator in evaluators or []
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations.clear()
+            self._errors.clear()
+
+    def stats(self) -> list[StageStats]:
+        with self._lock:
+            durations = {key: sorted(values) for key, values in self._durations.items()}
+            errors = Counter(self._errors)
+        return [
+            {
+                "stage": stage,
+                "provider": provider,
+                "count": len(values),
+                "errors": errors[(stage, provider)],
+                "sum": sum(values),
+                "max": values[-1],
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+            for (stage, provider), values in sorted(durations.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps({"stages": self.stats()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition: a summary of durations in seconds and a counter of errors."""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_duration_seconds Duration of the stages of the evaluation run.",
+            f"# TYPE {METRIC_PREFIX}_duration_seconds summary",
+        ]
+        stats = self.stats()
+        for item in stats:
+            labels = prometheus_labels(item)
+            for quantile in QUANTILES:
+                quantile_labels = prometheus_labels(item, quantile=str(quantile / 100))
+                lines.append(f"{METRIC_PREFIX}_duration_seconds{quantile_labels} {item[f'p{quantile}']}")  # type: ignore[literal-required]
+            lines.append(f"{METRIC_PREFIX}_duration_seconds_sum{labels} {item['sum']}")
+            lines.append(f"{METRIC_PREFIX}_duration_seconds_count{labels} {item['count']}")
+        lines.append(f"# HELP {METRIC_PREFIX}_errors_total Stage calls that raised an exception.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_errors_total counter")
+        for item in stats:
+            lines.append(f"{METRIC_PREFIX}_errors_total{prometheus_labels(item)} {item['errors']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write the metrics to `path`, as JSON for a `.json` file and as Prometheus text otherwise."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        content = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_labels(item: StageStats, **extra: str) -> str:
+    labels = {"stage": item["stage"], **({"provider": item["provider"]} if item["provider"] else {}), **extra}
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+# Stage durations of the current run, reset by `ExperimentSession.run`.
+stage_metrics = StageMetrics()
+
+
+def load_metrics_config(config: str | MetricsConfig | None) -> MetricsConfig | None:
+    """`tests.metrics` is either the output path or `{path, host, port}`."""
+    if config is None:
+        return None
+    if isinstance(config, str):
+        return {"path": config}
+    if not isinstance(config, dict) or not set(config) <= set(MetricsConfig.__annotations__):
+        raise ValueError(f"Invalid metrics config: {config}. Use a path or {{path, host, port}}")
+    return config
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    server: "MetricsServer"
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            body, content_type = self.server.metrics.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = self.server.metrics.to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, metrics: StageMetrics, host: str, port: int) -> None:
+        super().__init__((host, port), MetricsRequestHandler)
+        self.metrics = metrics
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}/metrics"
+
+
+@contextlib.contextmanager
+def serve_metrics(metrics: StageMetrics, host: str, port: int) -> Iterator[MetricsServer]:
+    """Serve `/metrics` (Prometheus text) and `/metrics.json` from a background thread while the block runs."""
+    server = MetricsServer(metrics, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
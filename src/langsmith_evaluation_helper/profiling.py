@@ -0,0 +1,269 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Coroutine
+from types import FrameType, TracebackType
+from typing import Any, TypedDict, TypeVar
+
+from langsmith_evaluation_helper.metrics import stage_metrics
+
+DEFAULT_STALL_THRESHOLD_MS = 100.0
+DEFAULT_SAMPLE_INTERVAL_MS = 5.0
+# Stages that end with a tracemalloc snapshot. Per-call stages are far too frequent to snapshot.
+SNAPSHOT_STAGES = ("load_dataset", "run_evaluate")
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 20
+# Threads of the profiler itself, which are neither profiled nor sampled.
+THREAD_NAME_PREFIX = "langsmith-evaluation-helper-profiler-"
+
+T = TypeVar("T")
+
+
+class LoopStall(TypedDict):
+    started_at: float
+    duration_ms: float
+    stack: list[str]
+
+
+def frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def frame_stack(frame: FrameType | None) -> list[str]:
+    """Labels of `frame` and its callers, outermost first."""
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    return stack[::-1]
+
+
+class StackSampler:
+    """
+    Statistical CPU profile: samples the stack of every thread each `interval` seconds and counts them
+    in the folded format of flamegraph.pl and speedscope (`outer;inner count`). Idle worker threads waiting
+    on a lock or queue are sampled too, so their waiting frames show where the time is spent.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL_MS / 1000) -> None:
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{THREAD_NAME_PREFIX}sampler", daemon=True)
+
+    def _run(self) -> None:
+        names: dict[int | None, str] = {}
+        while not self._stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names.setdefault(thread.ident, thread.name)
+            for thread_id, frame in sys._current_frames().items():
+                if names.get(thread_id, "").startswith(THREAD_NAME_PREFIX):
+                    continue
+                thread_name = re.sub(r"[;\s]", "_", names.get(thread_id, str(thread_id)))
+                self.samples[";".join([thread_name, *(label.replace(";", ",") for label in frame_stack(frame))])] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class LoopStallDetector:
+    """
+    Reports the event loop being blocked for longer than `threshold` seconds. A watchdog thread posts a
+    heartbeat to the loop; when the loop does not run it in time, the stack of the loop thread at that moment
+    is what is blocking it.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float, loop_thread_id: int) -> None:
+        self.loop = loop
+        self.threshold = threshold
+        self.loop_thread_id = loop_thread_id
+        self.stalls: list[LoopStall] = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{THREAD_NAME_PREFIX}stalls", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            heartbeat = threading.Event()
+            started_at, sent = time.time(), time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(heartbeat.set)
+            except RuntimeError:
+                # The loop was closed.
+                return
+            if heartbeat.wait(self.threshold):
+                self._stopped.wait(self.threshold / 2)
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = frame_stack(frame)
+            while not heartbeat.wait(self.threshold) and not self._stopped.is_set():
+                pass
+            self.stalls.append({
+                "started_at": started_at,
+                "duration_ms": (time.perf_counter() - sent) * 1000,
+                "stack": stack,
+            })
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+class ThreadProfilers:
+    """
+    cProfile only profiles the thread that enables it. This enables one profiler in each thread started
+    while it is installed, such as the `evaluate` workers that run sync targets and evaluators.
+    """
+
+    def __init__(self) -> None:
+        self.profilers: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _enable(self, *args: Any) -> None:
+        # Called on the first profiling event of a new thread; the C profiler replaces this hook.
+        sys.setprofile(None)
+        if threading.current_thread().name.startswith(THREAD_NAME_PREFIX):
+            return
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        profiler.enable()
+
+    def install(self) -> None:
+        threading.setprofile(self._enable)
+
+    def uninstall(self) -> None:
+        threading.setprofile(None)  # type: ignore[arg-type]
+
+
+class RunProfiler:
+    """
+    Profile of one evaluation run, written to `directory`:
+    - `cpu.pstats`: cProfile of the main thread and every thread started during the run (snakeviz, flameprof)
+    - `cpu.folded`: sampled stacks of all threads in the folded format (flamegraph.pl, speedscope)
+    - `memory/`: a tracemalloc snapshot at the end of each dataset load and provider experiment, and of the run,
+      with `memory.txt` listing the top allocations and their growth since the previous snapshot. Taking a
+      snapshot pauses the process, so it can show up in `stalls.json` under `take_snapshot`.
+    - `stalls.json`: each time the event loop was blocked for more than `stall_threshold_ms`, with the blocking stack
+    - `stages.json`: the stage timings of the run
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        stall_threshold_ms: float = DEFAULT_STALL_THRESHOLD_MS,
+        sample_interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS,
+    ) -> None:
+        self.directory = directory
+        self.stall_threshold_ms = stall_threshold_ms
+        self.profiler = cProfile.Profile()
+        self.thread_profilers = ThreadProfilers()
+        self.sampler = StackSampler(sample_interval_ms / 1000)
+        self.stalls: list[LoopStall] = []
+        self.snapshots: list[tuple[str, tracemalloc.Snapshot]] = []
+        self._snapshots_lock = threading.Lock()
+
+    def _on_stage(self, stage: str, provider: str | None, seconds: float, error: bool) -> None:
+        if stage in SNAPSHOT_STAGES:
+            self.take_snapshot(f"{stage}-{provider}" if provider else stage)
+
+    def take_snapshot(self, name: str) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        with self._snapshots_lock:
+            self.snapshots.append((name, snapshot))
+
+    def __enter__(self) -> "RunProfiler":
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        stage_metrics.add_listener(self._on_stage)
+        self.sampler.start()
+        self.thread_profilers.install()
+        self.profiler.enable()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.profiler.disable()
+        self.thread_profilers.uninstall()
+        self.sampler.stop()
+        stage_metrics.remove_listener(self._on_stage)
+        self.take_snapshot("end")
+        tracemalloc.stop()
+        self.write()
+        print(f"Profile written to {self.directory}")
+
+    async def watch(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """Await `coroutine` on the running loop while detecting stalls of the loop."""
+        detector = LoopStallDetector(asyncio.get_running_loop(), self.stall_threshold_ms / 1000, threading.get_ident())
+        detector.start()
+        try:
+            return await coroutine
+        finally:
+            detector.stop()
+            self.stalls.extend(detector.stalls)
+
+    def write(self) -> None:
+        stats = pstats.Stats(self.profiler)
+        for profiler in self.thread_profilers.profilers:
+            # Threads of the run have finished, so their profilers no longer record.
+            stats.add(profiler)  # type: ignore[arg-type]
+        stats.dump_stats(os.path.join(self.directory, "cpu.pstats"))
+
+        with open(os.path.join(self.directory, "cpu.folded"), "w", encoding="utf-8") as file:
+            file.write(self.sampler.folded())
+
+        with open(os.path.join(self.directory, "stalls.json"), "w", encoding="utf-8") as file:
+            json.dump(self.stalls, file, indent=2)
+
+        stage_metrics.write(os.path.join(self.directory, "stages.json"))
+        self.write_memory()
+
+    def write_memory(self) -> None:
+        memory_directory = os.path.join(self.directory, "memory")
+        os.makedirs(memory_directory, exist_ok=True)
+        lines = []
+        previous: tracemalloc.Snapshot | None = None
+        for index, (name, snapshot) in enumerate(self.snapshots):
+            # Allocations of tracemalloc and of the profiler itself are not the run's.
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            file_name = re.sub(r"[^\w.-]", "_", name)
+            snapshot.dump(os.path.join(memory_directory, f"{index:02d}-{file_name}.snapshot"))
+            total = sum(stat.size for stat in snapshot.statistics("filename"))
+            lines.append(f"## {index:02d} {name}: {total / 2**20:.1f} MB traced")
+            lines.extend(f"  {stat}" for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS])
+            if previous is not None:
+                lines.append("  growth since the previous snapshot:")
+                lines.extend(f"  {stat}" for stat in snapshot.compare_to(previous, "lineno")[:TOP_ALLOCATIONS])
+            lines.append("")
+            previous = snapshot
+        with open(os.path.join(self.directory, "memory.txt"), "w", encoding="utf-8") as file:
+            file.write("\n".join(lines))
@@ -0,0 +1,94 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from langsmith_evaluation_helper.utils import is_async_function
+
+
+class ConcurrencyScheduler:
+    """
+    Shared in-flight budget for the target calls of every provider in one run.
+
+    `max_concurrency` caps the calls in flight across all providers and `provider_limits` caps each provider.
+    Async targets acquire slots on the event loop directly. Sync targets run on `evaluate` worker threads and
+    acquire the same slots through the loop, so one budget governs both.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        max_concurrency: int | None = None,
+        provider_limits: dict[str, int | None] | None = None,
+    ) -> None:
+        self.loop = loop
+        self.max_concurrency = max_concurrency
+        self.provider_limits = provider_limits or {}
+        self._global_semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._provider_semaphores = {
+            provider_id: asyncio.Semaphore(limit) for provider_id, limit in self.provider_limits.items() if limit
+        }
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @classmethod
+    def from_config(cls, config: dict[Any, Any], loop: asyncio.AbstractEventLoop) -> "ConcurrencyScheduler":
+        provider_limits = {
+            provider["id"]: (provider.get("config") or {}).get("max_concurrency", None)
+            for provider in config["providers"]
+        }
+        return cls(loop, config["tests"].get("max_total_concurrency", None), provider_limits)
+
+    async def acquire(self, provider_id: str) -> None:
+        provider_semaphore = self._provider_semaphores.get(provider_id)
+        # The provider slot is taken first so that waiting on it never holds a slot of the global budget.
+        if provider_semaphore is not None:
+            await provider_semaphore.acquire()
+        if self._global_semaphore is not None:
+            try:
+                await self._global_semaphore.acquire()
+            except BaseException:
+                if provider_semaphore is not None:
+                    provider_semaphore.release()
+                raise
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self, provider_id: str) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if self._global_semaphore is not None:
+            self._global_semaphore.release()
+        provider_semaphore = self._provider_semaphores.get(provider_id)
+        if provider_semaphore is not None:
+            provider_semaphore.release()
+
+    def wrap(self, provider_id: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Return `func` (sync or async) guarded by the provider's and the global budget."""
+        if is_async_function(func):
+
+            async def run_async(*args: Any, **kwargs: Any) -> Any:
+                await self.acquire(provider_id)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.release(provider_id)
+
+            run_async.__name__ = func.__name__
+            return run_async
+
+        def run_sync(*args: Any, **kwargs: Any) -> Any:
+            asyncio.run_coroutine_threadsafe(self.acquire(provider_id), self.loop).result()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.loop.call_soon_threadsafe(self.release, provider_id)
+
+        run_sync.__name__ = func.__name__
+        return run_sync
@@ -2,9 +2,15 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
 import importlib.util
 import inspect
+import os
+import re
+import sys
+import threading
 from collections.abc import Callable
+from types import ModuleType
 from typing import Any
 
 
@@ -12,6 +18,55 @@ def is_async_function(func: Callable[..., Any]) -> bool:
     return inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
 
 
+# Modules loaded from user files, keyed by absolute path. Each entry keeps the file stamp it was loaded from.
+_loaded_modules: dict[str, tuple[tuple[int, int], ModuleType]] = {}
+# Reentrant so that a user module can itself call `load_function` while it is being executed.
+_loaded_modules_lock = threading.RLock()
+
+
+def module_name_for(module_path: str, stamp: tuple[int, int]) -> str:
+    """Unique module name per file version, so user modules never replace each other in `sys.modules`."""
+    digest = hashlib.sha256(f"{module_path}:{stamp}".encode()).hexdigest()[:16]
+    stem = re.sub(r"\W", "_", os.path.splitext(os.path.basename(module_path))[0])
+    return f"langsmith_evaluation_helper_user_{stem}_{digest}"
+
+
+def load_module(module_path: str) -> ModuleType:
+    """
+    Execute the Python file at `module_path` once per process and return the module.
+    The file is executed again only when its modification time or size changes.
+    """
+    path = os.path.abspath(module_path)
+    file_stat = os.stat(path)
+    stamp = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    with _loaded_modules_lock:
+        loaded = _loaded_modules.get(path)
+        if loaded is not None and loaded[0] == stamp:
+            return loaded[1]
+
+        module_name = module_name_for(path, stamp)
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        if spec is None:
+            raise ImportError(f"Cannot find module specification for the path: {module_path}")
+
+        module = importlib.util.module_from_spec(spec)
+        if spec.loader is None:
+            raise ImportError("Module loader is not available.")
+        # Registered before execution, like a regular import, so dataclasses and pickling can resolve the module.
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+
+        if loaded is not None:
+            sys.modules.pop(loaded[1].__name__, None)
+        _loaded_modules[path] = (stamp, module)
+        return module
+
+
 def load_function(module_path: str, function_name: str) -> Any:
     """
     Dynamically load a function from a given module.
@@ -22,14 +77,7 @@ def load_function(module_path: str, function_name: str) -> Any:
         raise ValueError("Invalid or empty function name.")
 
     try:
-        spec = importlib.util.spec_from_file_location("module", module_path)
-        if spec is None:
-            raise ImportError(f"Cannot find module specification for the path: {module_path}")
-
-        module = importlib.util.module_from_spec(spec)
-        if spec.loader is None:
-            raise ImportError("Module loader is not available.")
-        spec.loader.exec_module(module)
+        module = load_module(module_path)
 
         if not hasattr(module, function_name):
             raise AttributeError(f"Function '{function_name}' not found in module '{module_path}'")
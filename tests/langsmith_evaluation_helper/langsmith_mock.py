@@ -2,6 +2,8 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+from collections.abc import Iterator, Sequence
+
 from langsmith.schemas import Example
 
 
@@ -11,8 +13,19 @@ class MockClient:
         if response_examples is None:
             response_examples = []
         self.response_examples = response_examples
+        self.yielded_count = 0
 
-    def list_examples(self, dataset_name: str) -> list[Example]:
-        if self.response_examples is None:
-            return []
-        return self.response_examples
+    def list_examples(
+        self, dataset_name: str, splits: Sequence[str] | None = None, limit: int | None = None
+    ) -> Iterator[Example]:
+        count = 0
+        for example in self.response_examples:
+            if limit is not None and count >= limit:
+                return
+            if splits is not None and not (
+                example.metadata is not None and set(splits) & set(example.metadata.get("dataset_split", []))
+            ):
+                continue
+            count += 1
+            self.yielded_count += 1
+            yield example
@@ -0,0 +1,60 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from collections.abc import Iterator
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName, ChatModelPool, chat_model_pool
+
+
+@pytest.fixture(autouse=True)
+def clear_pool() -> Iterator[None]:
+    chat_model_pool.clear()
+    yield
+    chat_model_pool.clear()
+
+
+@mock.patch("langsmith_evaluation_helper.llm.model.get_chat_model", side_effect=lambda name, **kwargs: object())
+def test_pool_reuses_clients_with_same_settings(mock_get_chat_model: mock.MagicMock) -> None:
+    pool = ChatModelPool()
+
+    first = pool.get(ChatModelName.GPT4O, temperature=0.7)
+    second = pool.get(ChatModelName.GPT4O, temperature=0.7)
+    other_temperature = pool.get(ChatModelName.GPT4O, temperature=0.0)
+    other_model = pool.get(ChatModelName.TURBO, temperature=0.7)
+
+    assert first is second
+    assert first is not other_temperature
+    assert first is not other_model
+    assert mock_get_chat_model.call_count == 3
+    assert pool.stats() == {"hits": 1, "misses": 3, "size": 3}
+
+
+def test_pool_builds_clients_outside_the_lock_and_keeps_the_first_inserted() -> None:
+    pool = ChatModelPool()
+    racing_client = object()
+
+    def build(name: ChatModelName, **kwargs: Any) -> object:
+        assert not pool._lock.locked()
+        if not pool._models:
+            # Another thread inserts the same client while this one is being built.
+            pool._models[pool.make_key(name, **kwargs)] = racing_client  # type: ignore[assignment]
+        return object()
+
+    with mock.patch("langsmith_evaluation_helper.llm.model.get_chat_model", side_effect=build):
+        assert pool.get(ChatModelName.GPT4O, temperature=0.7) is racing_client
+
+    assert pool.stats() == {"hits": 1, "misses": 0, "size": 1}
+
+
+def test_chat_model_draws_from_shared_pool() -> None:
+    first = ChatModel(default_model_name=ChatModelName.GPT4O, temperature=0.7, verbose=True)
+    second = ChatModel(default_model_name=ChatModelName.GPT4O, temperature=0.7, verbose=True)
+
+    assert first.default_model is second.default_model
+    assert first.get_model(ChatModelName.GPT4O) is first.default_model
+    assert chat_model_pool.stats() == {"hits": 2, "misses": 1, "size": 1}
@@ -0,0 +1,170 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from unittest import mock
+
+import pytest
+
+from langsmith_evaluation_helper import cli
+
+
+@mock.patch("langsmith_evaluation_helper.loader.run_experiment")
+def test_evaluate_runs_in_process(mock_run_experiment: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("sys.argv", ["langsmith-evaluation-helper", "evaluate", "path/to/config.yml"])
+
+    cli.main()
+
+    mock_run_experiment.assert_called_once_with(
+        "path/to/config.yml",
+        refresh_dataset=False,
+        shard=None,
+        resume=False,
+        profile=None,
+        stall_threshold_ms=100,
+        shard_run_id=None,
+    )
+
+
+@mock.patch("langsmith_evaluation_helper.loader.run_experiment")
+def test_evaluate_refresh_dataset(mock_run_experiment: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("sys.argv", ["langsmith-evaluation-helper", "evaluate", "config.yml", "--refresh-dataset"])
+
+    cli.main()
+
+    mock_run_experiment.assert_called_once_with(
+        "config.yml",
+        refresh_dataset=True,
+        shard=None,
+        resume=False,
+        profile=None,
+        stall_threshold_ms=100,
+        shard_run_id=None,
+    )
+
+
+@mock.patch("langsmith_evaluation_helper.loader.run_experiment")
+def test_evaluate_shard(mock_run_experiment: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        "sys.argv",
+        ["langsmith-evaluation-helper", "evaluate", "config.yml", "--shard", "1/4", "--shard-run-id", "nightly-42"],
+    )
+
+    cli.main()
+
+    mock_run_experiment.assert_called_once_with(
+        "config.yml",
+        refresh_dataset=False,
+        shard="1/4",
+        resume=False,
+        profile=None,
+        stall_threshold_ms=100,
+        shard_run_id="nightly-42",
+    )
+
+
+@mock.patch("langsmith_evaluation_helper.loader.finalize_shards")
+def test_finalize(mock_finalize_shards: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        "sys.argv",
+        ["langsmith-evaluation-helper", "finalize", "config.yml", "--shard-count", "4", "--shard-run-id", "nightly-42"],
+    )
+
+    cli.main()
+
+    mock_finalize_shards.assert_called_once_with("config.yml", shard_count=4, shard_run_id="nightly-42")
+
+
+@mock.patch("langsmith_evaluation_helper.loader.run_experiment")
+def test_evaluate_resume(mock_run_experiment: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("sys.argv", ["langsmith-evaluation-helper", "evaluate", "config.yml", "--resume"])
+
+    cli.main()
+
+    mock_run_experiment.assert_called_once_with(
+        "config.yml",
+        refresh_dataset=False,
+        shard=None,
+        resume=True,
+        profile=None,
+        stall_threshold_ms=100,
+        shard_run_id=None,
+    )
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["langsmith-evaluation-helper"],
+        ["langsmith-evaluation-helper", "evaluate"],
+        ["langsmith-evaluation-helper", "unknown", "config.yml"],
+        ["langsmith-evaluation-helper", "reevaluate", "config.yml"],
+        ["langsmith-evaluation-helper", "evaluate", "config.yml", "--stall-threshold-ms", "50"],
+    ],
+)
+def test_invalid_arguments_exit(argv: list[str], monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("sys.argv", argv)
+
+    with pytest.raises(SystemExit):
+        cli.main()
+
+
+@mock.patch("langsmith_evaluation_helper.loader.reevaluate_experiments")
+def test_reevaluate(mock_reevaluate_experiments: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        "sys.argv", ["langsmith-evaluation-helper", "reevaluate", "config.yml", "experiment-a", "experiment-b"]
+    )
+
+    cli.main()
+
+    mock_reevaluate_experiments.assert_called_once_with("config.yml", ["experiment-a", "experiment-b"])
+
+
+@mock.patch("langsmith_evaluation_helper.local_langsmith.serve")
+def test_serve(mock_serve: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("sys.argv", ["langsmith-evaluation-helper", "serve", "--port", "8080"])
+
+    cli.main()
+
+    mock_serve.assert_called_once_with(
+        ".langsmith_evaluation_helper/langsmith.sqlite3", "127.0.0.1", 8080, verbose=False
+    )
+
+
+@mock.patch("langsmith_evaluation_helper.loader.run_experiment")
+def test_evaluate_profile(mock_run_experiment: mock.MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        "sys.argv",
+        ["langsmith-evaluation-helper", "evaluate", "config.yml", "--profile", "profile", "--stall-threshold-ms", "50"],
+    )
+
+    cli.main()
+
+    mock_run_experiment.assert_called_once_with(
+        "config.yml",
+        refresh_dataset=False,
+        shard=None,
+        resume=False,
+        profile="profile",
+        stall_threshold_ms=50,
+        shard_run_id=None,
+    )
+
+
+@mock.patch("langsmith_evaluation_helper.loader.run_experiment")
+def test_evaluate_profile_default_stall_threshold(
+    mock_run_experiment: mock.MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("sys.argv", ["langsmith-evaluation-helper", "evaluate", "config.yml", "--profile", "profile"])
+
+    cli.main()
+
+    mock_run_experiment.assert_called_once_with(
+        "config.yml",
+        refresh_dataset=False,
+        shard=None,
+        resume=False,
+        profile="profile",
+        stall_threshold_ms=100,
+        shard_run_id=None,
+    )
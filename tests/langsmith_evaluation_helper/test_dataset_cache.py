@@ -0,0 +1,165 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+from unittest import mock
+from uuid import uuid4
+
+from langsmith.schemas import Dataset, Example
+
+from tests.factory import example_factory
+
+from langsmith_evaluation_helper.dataset_cache import (
+    DatasetSnapshotCache,
+    dataset_version,
+    iter_dataset_snapshot,
+    load_dataset_cache,
+)
+from langsmith_evaluation_helper.loader import load_dataset
+
+examples: list[Example] = [
+    example_factory(outputs={"output": f"output {index}"}, metadata={"dataset_split": [split]})
+    for index, split in enumerate(["base", "test", "base", "other"])
+]
+
+
+def dataset_factory(modified_at: datetime, example_count: int = len(examples)) -> Dataset:
+    return Dataset(
+        id=uuid4(),
+        name="Toxic Queries",
+        data_type="kv",
+        created_at=datetime(2024, 1, 1),
+        modified_at=modified_at,
+        example_count=example_count,
+        _host_url=None,
+        _tenant_id=None,
+    )
+
+
+def create_client(dataset: Dataset) -> mock.MagicMock:
+    client = mock.MagicMock()
+    client.read_dataset.return_value = dataset
+    client.list_examples.side_effect = lambda **kwargs: iter(examples)
+    return client
+
+
+def test_snapshot_round_trip(tmp_path: Path) -> None:
+    cache = DatasetSnapshotCache(str(tmp_path))
+    dataset_id = uuid4()
+
+    assert cache.read(dataset_id, "v1") is None
+    assert cache.write(dataset_id, "v1", examples) == len(examples)
+
+    snapshot = cache.read(dataset_id, "v1")
+    assert snapshot is not None
+    assert list(snapshot) == examples
+
+
+def test_snapshot_replaces_older_versions(tmp_path: Path) -> None:
+    cache = DatasetSnapshotCache(str(tmp_path))
+    dataset_id = uuid4()
+
+    cache.write(dataset_id, "v1", examples)
+    cache.write(dataset_id, "v2", examples[:1])
+
+    assert not cache.has(dataset_id, "v1")
+    snapshot = cache.read(dataset_id, "v2")
+    assert snapshot is not None
+    assert list(snapshot) == examples[:1]
+
+
+def test_snapshot_write_leaves_other_writers_alone(tmp_path: Path) -> None:
+    cache = DatasetSnapshotCache(str(tmp_path))
+    dataset_id = uuid4()
+    cache.write(dataset_id, "v1", examples)
+    # The temporary directory of a concurrent writer.
+    other_temp_path = tmp_path / str(dataset_id) / ".tmp-v3-other"
+    other_temp_path.mkdir()
+
+    cache.write(dataset_id, "v2", examples[:1])
+    cache.write(dataset_id, "v2", examples[:2])
+
+    assert sorted(path.name for path in (tmp_path / str(dataset_id)).iterdir()) == [".tmp-v3-other", "v2"]
+    assert list(cache.read(dataset_id, "v2") or []) == examples[:2]
+
+
+def test_snapshot_keeps_versions_installed_later(tmp_path: Path) -> None:
+    cache = DatasetSnapshotCache(str(tmp_path))
+    dataset_id = uuid4()
+    cache.write(dataset_id, "v1", examples)
+    cache.write(dataset_id, "v2", examples)
+    # v1 is written again by a process that started before v2 was installed.
+    newer_index = tmp_path / str(dataset_id) / "v2" / "index.json"
+    os.utime(newer_index, ns=(newer_index.stat().st_atime_ns, newer_index.stat().st_mtime_ns + 10**9))
+
+    cache.write(dataset_id, "v1", examples[:1])
+
+    assert cache.has(dataset_id, "v1")
+    assert cache.has(dataset_id, "v2")
+
+
+def test_empty_snapshot(tmp_path: Path) -> None:
+    cache = DatasetSnapshotCache(str(tmp_path))
+    dataset_id = uuid4()
+    cache.write(dataset_id, "v1", [])
+
+    assert list(cache.read(dataset_id, "v1") or [None]) == []
+
+
+def test_dataset_version_changes_with_modification() -> None:
+    first = dataset_factory(datetime(2024, 1, 1))
+
+    assert dataset_version(first) == dataset_version(dataset_factory(datetime(2024, 1, 1)))
+    assert dataset_version(first) != dataset_version(dataset_factory(datetime(2024, 1, 2)))
+    assert dataset_version(first) != dataset_version(dataset_factory(datetime(2024, 1, 1), example_count=5))
+
+
+def test_iter_dataset_snapshot_downloads_once(tmp_path: Path) -> None:
+    cache = DatasetSnapshotCache(str(tmp_path))
+    client = create_client(dataset_factory(datetime(2024, 1, 1)))
+
+    assert list(iter_dataset_snapshot(client, "Toxic Queries", cache)) == examples
+    assert list(iter_dataset_snapshot(client, "Toxic Queries", cache)) == examples
+    assert client.list_examples.call_count == 1
+
+    assert list(iter_dataset_snapshot(client, "Toxic Queries", cache, refresh=True)) == examples
+    assert client.list_examples.call_count == 2
+
+
+def test_load_dataset_cache_config(tmp_path: Path) -> None:
+    assert load_dataset_cache(None) is None
+    assert load_dataset_cache(False) is None
+    assert load_dataset_cache({"enabled": False}) is None
+    assert isinstance(load_dataset_cache(True), DatasetSnapshotCache)
+
+    cache = load_dataset_cache({"path": str(tmp_path)})
+    assert cache is not None
+    assert cache.directory == str(tmp_path)
+
+
+def test_load_dataset_reads_from_snapshot(tmp_path: Path) -> None:
+    client = create_client(dataset_factory(datetime(2024, 1, 1)))
+    config: dict[str, Any] = {
+        "tests": {
+            "dataset_name": "Toxic Queries",
+            "experiment_prefix": "toxic",
+            "split": "base",
+            "limit": 1,
+            "dataset_cache": {"path": str(tmp_path)},
+        }
+    }
+
+    for _ in range(2):
+        dataset_examples, *_ = load_dataset(config, client=client)
+        assert dataset_examples == [examples[0]]
+    assert client.list_examples.call_count == 1
+
+    config["tests"] = {"dataset_name": "Toxic Queries", "experiment_prefix": "toxic", "dataset_cache": True}
+    with mock.patch("langsmith_evaluation_helper.dataset_cache.DEFAULT_DATASET_CACHE_DIR", str(tmp_path)):
+        dataset_examples, *_ = load_dataset(config, client=client, refresh_dataset=True)
+    assert dataset_examples == examples
+    assert client.list_examples.call_count == 2
@@ -0,0 +1,108 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from tests.factory import example_factory, run_factory
+
+from langsmith_evaluation_helper.builtin_evaluators import (
+    generate_builtin_evaluator_functions,
+    generate_builtin_summary_evaluator_functions,
+)
+from langsmith_evaluation_helper.deterministic_asserts import compile_assert, score_runs
+
+OUTPUTS: list[Any] = ["Toxic", " toxic ", "Not toxic", '{"label": "Toxic"}', "3.14", "42", None, 3.0]
+REFERENCES: list[Any] = ["Toxic", "Toxic", "Toxic", "Toxic", "3.1", "40", "Toxic", "3"]
+
+
+@pytest.mark.parametrize(
+    "config,expected",
+    [
+        ({"type": "length", "value": "<= 5"}, [True, False, False, False, True, True, False, False]),
+        ({"type": "length", "value": "> 5"}, [False, True, True, True, False, False, False, False]),
+        ({"type": "exact-match"}, [True, False, False, False, False, False, False, False]),
+        ({"type": "exact-match", "value": "toxic"}, [False, True, False, False, False, False, False, False]),
+        ({"type": "contains"}, [True, False, False, True, True, False, False, True]),
+        ({"type": "contains", "value": "oxic"}, [True, True, True, True, False, False, False, False]),
+        ({"type": "regex", "value": "(?i)^\\s*toxic\\s*$"}, [True, True, False, False, False, False, False, False]),
+        ({"type": "json-valid"}, [False, False, False, True, True, True, False, False]),
+        ({"type": "numeric-tolerance", "value": "0.05"}, [False, False, False, False, True, False, False, True]),
+        ({"type": "numeric-tolerance", "value": "2"}, [False, False, False, False, True, True, False, True]),
+    ],
+)
+def test_score_and_score_batch_agree(config: dict[str, Any], expected: list[bool]) -> None:
+    compiled = compile_assert(config)
+
+    assert [
+        compiled.score(output, reference) for output, reference in zip(OUTPUTS, REFERENCES, strict=True)
+    ] == expected
+    batch = compiled.score_batch(pd.Series(OUTPUTS, dtype=object), pd.Series(REFERENCES, dtype=object))
+    assert batch.tolist() == expected
+
+
+def test_invalid_values() -> None:
+    with pytest.raises(ValueError, match="Invalid regex"):
+        compile_assert({"type": "regex", "value": "("})
+    with pytest.raises(ValueError, match="Invalid tolerance"):
+        compile_assert({"type": "numeric-tolerance", "value": "abc"})
+    assert compile_assert({"type": "length", "value": "about 200"}).score("a", None) is False
+
+
+def test_length_value_is_parsed_once(capsys: pytest.CaptureFixture[str]) -> None:
+    (evaluator,) = generate_builtin_evaluator_functions([{"type": "length", "value": "200"}])  # type: ignore[typeddict-item]
+    for _ in range(3):
+        assert evaluator(run_factory(outputs={"output": "a"}), example_factory()) == {"key": "length", "score": False}
+
+    assert capsys.readouterr().out.count("[Warning]") == 1
+
+
+def test_evaluator_uses_label_and_reference_key() -> None:
+    (evaluator,) = generate_builtin_evaluator_functions(
+        [{"type": "exact-match", "label": "correct_label", "reference_key": "label"}]  # type: ignore[typeddict-item]
+    )
+    example = example_factory(outputs={"output": "long answer", "label": "Toxic"})
+
+    assert evaluator.__name__ == "exact_match_evaluator"
+    assert evaluator(run_factory(outputs={"output": "Toxic"}), example) == {"key": "correct_label", "score": True}
+
+
+def test_score_runs() -> None:
+    compiled_asserts = [
+        compile_assert({"type": "exact-match", "label": "correct"}),
+        compile_assert({"type": "length", "value": "< 6"}),
+    ]
+    runs = [run_factory(outputs={"output": output}) for output in ["Toxic", "Not toxic"]]
+    examples = [example_factory(outputs={"output": "Toxic"}), None]
+
+    scores = score_runs(compiled_asserts, runs, examples)
+
+    assert list(scores.columns) == ["correct", "length"]
+    assert list(scores.index) == [str(run.id) for run in runs]
+    assert scores["correct"].tolist() == [True, False]
+    assert scores["length"].tolist() == [True, False]
+
+
+def test_summary_evaluator_reports_pass_rates() -> None:
+    (summary_evaluator,) = generate_builtin_summary_evaluator_functions([
+        {"type": "exact-match", "label": "correct", "pass_rate": True},  # type: ignore[typeddict-item]
+        {"type": "length", "value": "< 6", "pass_rate": True},  # type: ignore[typeddict-item]
+        {"type": "contains", "value": "Toxic"},  # type: ignore[typeddict-item]
+        {"type": "llm-judge", "value": "toxicity", "pass_rate": True},  # type: ignore[typeddict-item]
+    ])
+    runs = [run_factory(outputs={"output": output}) for output in ["Toxic", "Not toxic", "Toxic", "No"]]
+    examples = [example_factory(outputs={"output": "Toxic"}) for _ in runs]
+
+    results = summary_evaluator(runs, examples)["results"]
+    assert [(result.key, result.score) for result in results] == [
+        ("correct_pass_rate", 0.5),
+        ("length_pass_rate", 0.75),
+    ]
+    assert summary_evaluator([], []) == {"results": []}
+
+
+def test_summary_evaluator_is_opt_in() -> None:
+    assert generate_builtin_summary_evaluator_functions([{"type": "length", "value": "< 6"}]) == []  # type: ignore[typeddict-item]
@@ -0,0 +1,111 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import random
+import statistics
+
+import pytest
+from langchain_core.prompts import PromptTemplate
+
+from langsmith_evaluation_helper.builtin_evaluators import create_judge_model
+from langsmith_evaluation_helper.llm.fake import FakeChatModel, FakeProviderError, FakeRateLimitError
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName, chat_model_pool, get_chat_model
+from langsmith_evaluation_helper.llm.rate_limit import RateLimiter, is_rate_limit_error, retry_after
+from langsmith_evaluation_helper.load_run_function import create_chat_model
+
+
+@pytest.fixture(autouse=True)
+def clear_pool() -> None:
+    # FAKE models count attempts per prompt, so tests must not share pooled instances.
+    chat_model_pool.clear()
+
+
+def test_echo_scripted_responses_and_usage() -> None:
+    echo = get_chat_model(ChatModelName.FAKE)
+    scripted = get_chat_model(ChatModelName.FAKE, fake={"responses": ["Toxic", "Not toxic"], "output_tokens": 7})
+
+    message = echo.invoke("User content : hello")
+    assert message.content == "User content : hello"
+    assert message.usage_metadata == {"input_tokens": 6, "output_tokens": 6, "total_tokens": 12}
+    answers = [scripted.invoke(f"query {index}").content for index in range(20)]
+    # The answer depends only on the prompt.
+    assert answers == [scripted.invoke(f"query {index}").content for index in range(20)]
+    assert set(answers) == {"Toxic", "Not toxic"}
+    assert scripted.invoke("query 0").usage_metadata["output_tokens"] == 7  # type: ignore[index]
+
+
+@pytest.mark.asyncio
+async def test_streaming_chunks() -> None:
+    model = get_chat_model(ChatModelName.FAKE, fake={"chunk_size": 4})
+
+    chunks = list(model.stream("hello world"))
+    async_chunks = [chunk async for chunk in model.astream("hello world")]
+
+    assert [chunk.content for chunk in chunks] == ["hell", "o wo", "rld"]
+    assert [chunk.content for chunk in async_chunks] == ["hell", "o wo", "rld"]
+    assert [chunk.usage_metadata is not None for chunk in chunks] == [False, False, True]
+
+
+def test_presets_are_overridden_by_config() -> None:
+    model = create_chat_model({"id": "FAKE_FLAKY", "config": {"fake": {"error_rate": 0, "seed": 3}}}).default_model
+
+    assert isinstance(model, FakeChatModel)
+    assert model.model_name == "fake-flaky"
+    assert model.rate_limit_rate == 0.1
+    assert model.error_rate == 0
+    assert model.seed == 3
+    with pytest.raises(ValueError, match="unknown_setting"):
+        get_chat_model(ChatModelName.FAKE, fake={"unknown_setting": 1})  # type: ignore[typeddict-unknown-key]
+
+
+def test_failures_are_deterministic_per_prompt_and_attempt() -> None:
+    def outcomes(seed: int) -> list[str]:
+        model = FakeChatModel(rate_limit_rate=0.3, error_rate=0.2, retry_after_seconds=2, seed=seed)
+        results = []
+        for index in range(40):
+            try:
+                model.invoke(f"query {index % 10}")
+                results.append("ok")
+            except FakeRateLimitError as error:
+                assert is_rate_limit_error(error)
+                assert retry_after(error) == 2
+                results.append("429")
+            except FakeProviderError as error:
+                assert not is_rate_limit_error(error)
+                results.append("500")
+        return results
+
+    assert outcomes(1) == outcomes(1)
+    assert outcomes(1) != outcomes(2)
+    assert set(outcomes(1)) == {"ok", "429", "500"}
+
+
+def test_rate_limiter_retries_fake_rate_limits() -> None:
+    limiter = RateLimiter(max_retries=20, initial_backoff=0)
+    model = ChatModel(ChatModelName.FAKE, fake={"rate_limit_rate": 0.5}, rate_limiter=limiter)
+    prompt = PromptTemplate.from_template("Is {text} toxic?")
+
+    assert [model.invoke(prompt, text=str(index)) for index in range(10)] == [
+        f"Is {index} toxic?" for index in range(10)
+    ]
+    assert limiter.rate_limited_count > 0
+
+
+@pytest.mark.parametrize("distribution", ["fixed", "uniform", "normal", "lognormal"])
+def test_latency_distributions(distribution: str) -> None:
+    model = FakeChatModel(latency_ms=100, latency_jitter_ms=30, latency_distribution=distribution)  # type: ignore[arg-type]
+    rng = random.Random(0)
+
+    samples = [model._sample_latency(rng) * 1000 for _ in range(2000)]
+
+    assert min(samples) >= 0
+    # latency_ms is the median of every distribution.
+    assert statistics.median(samples) == pytest.approx(100, rel=0.05)
+    assert (max(samples) - min(samples) > 0) == (distribution != "fixed")
+
+
+def test_fake_judge_model() -> None:
+    judge = create_judge_model({"id": "FAKE", "config": {"temperature": 0, "fake": {"responses": ["1"]}}})
+
+    assert judge.invoke(PromptTemplate.from_template("Score {output}"), output="answer") == "1"
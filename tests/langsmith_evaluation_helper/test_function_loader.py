@@ -2,16 +2,25 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import inspect
+import os
+import sys
+from pathlib import Path
 from typing import Any
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
+from langsmith_evaluation_helper.executors import call_worker_function, get_process_pool, shutdown_process_pools
 from langsmith_evaluation_helper.load_run_function import (
+    async_execute_prompt,
+    compile_prompt_template,
     load_prompt_function,
     load_prompt_template,
     load_run_function,
 )
+from langsmith_evaluation_helper.utils import load_function
 
 
 def create_mock_config(custom_run: bool = False) -> dict[str, Any]:
@@ -96,5 +105,222 @@ def test_load_run_function_error() -> None:
         load_run_function("/mock/path/config.yaml", mock_config, mock_provider)
 
 
+prompt_module_content = """
+TEMPLATE = "Is this toxic? {text}"
+
+
+def sync_prompt():
+    return TEMPLATE
+
+
+async def async_prompt():
+    return TEMPLATE
+"""
+
+
+def create_prompt_config(tmp_path: Path, entry_function: str, use_async: bool = False) -> tuple[str, dict[str, Any]]:
+    (tmp_path / "prompt.py").write_text(prompt_module_content)
+    config: dict[str, Any] = {"prompt": {"name": "prompt.py", "entry_function": entry_function}}
+    if use_async:
+        config["prompt"]["async"] = True
+    return str(tmp_path / "config.yml"), config
+
+
+@pytest.mark.parametrize(
+    "entry_function,use_async,expect_async",
+    [
+        ("sync_prompt", False, False),
+        ("sync_prompt", True, True),
+        ("async_prompt", False, True),
+    ],
+)
+def test_load_prompt_template_selects_execution_path(
+    tmp_path: Path, entry_function: str, use_async: bool, expect_async: bool
+) -> None:
+    config_path, config = create_prompt_config(tmp_path, entry_function, use_async)
+
+    run = load_prompt_template(config_path, config, {"id": "GPT4O"})
+
+    assert inspect.iscoroutinefunction(run) is expect_async
+
+
+@pytest.mark.asyncio
+async def test_async_prompt_uses_async_invoke(tmp_path: Path) -> None:
+    config_path, config = create_prompt_config(tmp_path, "sync_prompt", use_async=True)
+    run = load_prompt_template(config_path, config, {"id": "GPT4O", "config": {"temperature": 0}})
+
+    with (
+        patch("langsmith_evaluation_helper.llm.model.ChatModel.async_invoke", new_callable=AsyncMock) as mock_ainvoke,
+        patch("langsmith_evaluation_helper.llm.model.ChatModel.invoke") as mock_invoke,
+    ):
+        mock_ainvoke.return_value = "Toxic"
+        assert await run({"text": "I hate you"}) == "Toxic"
+
+    mock_ainvoke.assert_awaited_once()
+    assert mock_ainvoke.await_args is not None
+    assert mock_ainvoke.await_args.kwargs == {"text": "I hate you"}
+    mock_invoke.assert_not_called()
+
+
+counted_prompt_module_content = """
+CALLS = []
+
+
+def constant_prompt():
+    CALLS.append(1)
+    return "Is this toxic? {text}"
+
+
+async def async_constant_prompt():
+    CALLS.append(1)
+    return "Is this toxic? {text}"
+
+
+def input_prompt(inputs):
+    CALLS.append(1)
+    return "Is this toxic? {text}"
+"""
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "entry_function,expected_calls",
+    [("constant_prompt", 1), ("async_constant_prompt", 1), ("input_prompt", 3)],
+)
+async def test_prompt_function_without_inputs_is_called_once(
+    tmp_path: Path, entry_function: str, expected_calls: int
+) -> None:
+    (tmp_path / "prompt.py").write_text(counted_prompt_module_content)
+    config = {"prompt": {"name": "prompt.py", "entry_function": entry_function}}
+    provider = {"id": "GPT4O", "config": {"temperature": 0}}
+    run = load_prompt_template(str(tmp_path / "config.yml"), config, provider)
+    module = sys.modules[load_function(str(tmp_path / "prompt.py"), entry_function).__module__]
+    compile_prompt_template.cache_clear()
+
+    with (
+        patch("langsmith_evaluation_helper.llm.model.ChatModel.async_invoke", new_callable=AsyncMock) as mock_ainvoke,
+        patch("langsmith_evaluation_helper.llm.model.ChatModel.invoke") as mock_invoke,
+    ):
+        mock_ainvoke.return_value = mock_invoke.return_value = "Toxic"
+        texts = ["I hate you", "Hello", "I hate you"]
+        if inspect.iscoroutinefunction(run):
+            results = await asyncio.gather(*[run({"text": text}) for text in texts])
+        else:
+            results = [run({"text": text}) for text in texts]
+
+    assert results == ["Toxic"] * 3
+    assert len(module.CALLS) == expected_calls
+    assert compile_prompt_template.cache_info().misses == 1
+
+
+flaky_prompt_module_content = """
+CALLS = []
+
+
+async def flaky_prompt():
+    CALLS.append(1)
+    if len(CALLS) == 1:
+        raise RuntimeError("prompt store unavailable")
+    return "Is this toxic? {text}"
+"""
+
+
+@pytest.mark.asyncio
+async def test_failed_async_constant_prompt_is_not_cached(tmp_path: Path) -> None:
+    (tmp_path / "prompt.py").write_text(flaky_prompt_module_content)
+    config = {"prompt": {"name": "prompt.py", "entry_function": "flaky_prompt"}}
+    run = load_prompt_template(str(tmp_path / "config.yml"), config, {"id": "GPT4O", "config": {"temperature": 0}})
+    module = sys.modules[load_function(str(tmp_path / "prompt.py"), "flaky_prompt").__module__]
+
+    with patch("langsmith_evaluation_helper.llm.model.ChatModel.async_invoke", new_callable=AsyncMock) as mock_ainvoke:
+        mock_ainvoke.return_value = "Toxic"
+        with pytest.raises(RuntimeError, match="prompt store unavailable"):
+            await run({"text": "I hate you"})
+        assert await run({"text": "Hello"}) == "Toxic"
+        assert await run({"text": "Hello"}) == "Toxic"
+
+    assert len(module.CALLS) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_execute_prompt_invalid_model() -> None:
+    with pytest.raises(ValueError, match="Invalid model_id"):
+        await async_execute_prompt({"text": "hello"}, "{text}", {"id": "UNKNOWN"})
+
+
+custom_run_module_content = """
+import os
+
+
+def custom_run(inputs, provider):
+    return {"pid": os.getpid(), "text": inputs["text"].upper(), "provider": provider["id"]}
+
+
+async def async_custom_run(inputs):
+    return inputs
+"""
+
+
+def test_custom_run_process_executor(tmp_path: Path) -> None:
+    (tmp_path / "custom_run.py").write_text(custom_run_module_content)
+    config = {
+        "custom_run": {
+            "file_path": "custom_run.py",
+            "entry_function": "custom_run",
+            "executor": "process",
+            "max_workers": 1,
+        }
+    }
+
+    run = load_run_function(str(tmp_path / "config.yml"), config, mock_provider)
+    try:
+        results = [run({"text": "hello"}), run({"text": "bye"})]
+    finally:
+        shutdown_process_pools()
+
+    assert [result["text"] for result in results] == ["HELLO", "BYE"]
+    assert all(result["provider"] == "mock_provider" for result in results)
+    assert results[0]["pid"] == results[1]["pid"] != os.getpid()
+
+
+def test_process_pool_restarts_when_the_script_changes(tmp_path: Path) -> None:
+    script_path = tmp_path / "custom_run.py"
+    script_path.write_text(custom_run_module_content)
+    try:
+        pool = get_process_pool(str(script_path), "custom_run", 1)
+        assert get_process_pool(str(script_path), "custom_run", 1) is pool
+
+        script_path.write_text(custom_run_module_content.replace("upper()", "lower()"))
+        changed_pool = get_process_pool(str(script_path), "custom_run", 1)
+        assert changed_pool is not pool
+        assert (
+            changed_pool.submit(call_worker_function, {"inputs": {"text": "Hi"}, "provider": mock_provider}).result()[
+                "text"
+            ]
+            == "hi"
+        )
+        # Pools are retired only between runs, so a provider still holding the old pool can submit to it.
+        assert pool.submit(call_worker_function, {"inputs": {"text": "Hi"}, "provider": mock_provider}).result()
+    finally:
+        shutdown_process_pools()
+
+    assert get_process_pool(str(script_path), "custom_run", 1) is not changed_pool
+    shutdown_process_pools()
+
+
+@pytest.mark.parametrize(
+    "entry_function,executor,message",
+    [
+        ("async_custom_run", "process", "requires a synchronous entry_function"),
+        ("custom_run", "fork", "Invalid custom_run executor"),
+    ],
+)
+def test_custom_run_invalid_executor(tmp_path: Path, entry_function: str, executor: str, message: str) -> None:
+    (tmp_path / "custom_run.py").write_text(custom_run_module_content)
+
+    with pytest.raises(ValueError, match=message):
+        load_prompt_function(str(tmp_path / "config.yml"), "custom_run.py", entry_function, mock_provider, executor)
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -3,10 +3,14 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 from unittest import mock
 
+import numpy as np
 import pytest
+from langchain_core.embeddings import Embeddings
 from langsmith.evaluation import (
     EvaluationResult,
     EvaluationResults,
@@ -16,11 +20,19 @@ from tests.factory import example_factory, run_factory
 
 from .config_input import Configurations
 from langsmith_evaluation_helper.builtin_evaluators import (
+    JUDGE_PROMPT_TEMPLATE,
+    BuiltinEvaluatorConfig,
+    EmbeddingBatcher,
+    JudgeCache,
+    cosine_distances,
+    create_fused_llm_judge_evaluator,
+    create_judge_model,
     create_length_evaluator,
     create_llm_judge_evaluator,
     create_similar_evaluator,
     generate_builtin_evaluator_functions,
 )
+from langsmith_evaluation_helper.llm.cache import ResponseCache
 from langsmith_evaluation_helper.loader import (
     load_config,
 )
@@ -119,3 +131,155 @@ def test_similar_evaluator(
 
     assert isinstance(result, EvaluationResult | EvaluationResults)  # type: ignore
     mock_embed_documents.assert_called_once()
+
+
+JUDGE_PROVIDER = {"id": "TURBO", "config": {"temperature": 0}}
+FUSION_CONFIGS: list[BuiltinEvaluatorConfig] = [
+    {"type": "llm-judge", "value": "Is this toxic?", "label": "toxic", "judge_provider": JUDGE_PROVIDER},
+    {"type": "length", "value": "<= 200", "label": None, "judge_provider": None},
+    {"type": "llm-judge", "value": "Is this polite?", "label": "polite", "judge_provider": JUDGE_PROVIDER},
+    {
+        "type": "llm-judge",
+        "value": "Is this short?",
+        "label": "short",
+        "judge_provider": {"id": "GPT4O", "config": {"temperature": 0}},
+    },
+]
+
+
+def test_judge_fusion_groups_asserts_by_judge_provider() -> None:
+    assert len(generate_builtin_evaluator_functions(FUSION_CONFIGS)) == 4
+
+    evaluators = generate_builtin_evaluator_functions(FUSION_CONFIGS, judge_fusion=True)
+
+    assert [evaluator.__name__ for evaluator in evaluators] == [
+        "fused_llm_judge_evaluator",
+        "length_evaluator",
+        "llm_judge_evaluator",
+    ]
+
+
+@mock.patch("langsmith_evaluation_helper.llm.model.ChatModel.invoke", return_value='```json\n{"1": 0.1, "2": 1}\n```')
+def test_fused_llm_judge_evaluator_makes_one_call(mock_invoke: mock.MagicMock) -> None:
+    evaluator = create_fused_llm_judge_evaluator([FUSION_CONFIGS[0], FUSION_CONFIGS[2]])
+    run = run_factory(name="test_run", outputs={"output": "I hate you"})
+
+    result = evaluator(run, example_factory())
+
+    assert result == {"results": [{"key": "toxic", "score": 0.1}, {"key": "polite", "score": 1.0}]}
+    mock_invoke.assert_called_once()
+    assert "1. Is this toxic?\n2. Is this polite?" in mock_invoke.call_args.kwargs["evaluation_perspectives"]
+
+
+@mock.patch("langsmith_evaluation_helper.llm.model.ChatModel.invoke", side_effect=['{"1": 0.1}', "0.2", "0.8"])
+def test_fused_llm_judge_evaluator_falls_back_to_single_calls(mock_invoke: mock.MagicMock) -> None:
+    evaluator = create_fused_llm_judge_evaluator([FUSION_CONFIGS[0], FUSION_CONFIGS[2]])
+    run = run_factory(name="test_run", outputs={"output": "I hate you"})
+
+    result = evaluator(run, example_factory())
+
+    assert result == {"results": [{"key": "toxic", "score": 0.2}, {"key": "polite", "score": 0.8}]}
+    assert mock_invoke.call_count == 3
+
+
+@mock.patch("langsmith_evaluation_helper.llm.model.ChatModel.invoke", return_value="0.9")
+def test_llm_judge_evaluator_reuses_scores_of_identical_outputs(mock_invoke: mock.MagicMock, tmp_path: Path) -> None:
+    response_cache = ResponseCache(path=str(tmp_path / "judge.sqlite3"))
+    with mock.patch("langsmith_evaluation_helper.builtin_evaluators.create_judge_model", wraps=create_judge_model) as m:
+        evaluator = generate_builtin_evaluator_functions([FUSION_CONFIGS[0]], judge_response_cache=response_cache)[0]
+        for output in ["I hate you", "I hate you", "Hello"]:
+            evaluator(run_factory(name="test_run", outputs={"output": output}), example_factory())
+        assert m.call_count == 1
+
+    assert mock_invoke.call_count == 2
+
+    # A later run reads the scores back from the persistent cache.
+    rerun = generate_builtin_evaluator_functions([FUSION_CONFIGS[0]], judge_response_cache=response_cache)[0]
+    result = rerun(run_factory(name="test_run", outputs={"output": "Hello"}), example_factory())
+    assert result == {"key": "toxic", "score": 0.9}
+    assert mock_invoke.call_count == 2
+
+
+@mock.patch("langsmith_evaluation_helper.llm.model.ChatModel.invoke", side_effect=['{"1": 0.3}', '{"1": 0.7}'])
+def test_fused_llm_judge_evaluator_only_judges_uncached_perspectives(mock_invoke: mock.MagicMock) -> None:
+    judge_cache = JudgeCache()
+    run = run_factory(name="test_run", outputs={"output": "I hate you"})
+    create_fused_llm_judge_evaluator([FUSION_CONFIGS[0]], judge_cache)(run, example_factory())
+
+    evaluator = create_fused_llm_judge_evaluator([FUSION_CONFIGS[0], FUSION_CONFIGS[2]], judge_cache)
+    result = evaluator(run, example_factory())
+
+    assert result == {"results": [{"key": "toxic", "score": 0.3}, {"key": "polite", "score": 0.7}]}
+    assert mock_invoke.call_args.kwargs["evaluation_perspectives"] == "1. Is this polite?"
+
+
+def test_judge_cache_key_depends_on_mode_and_prompt() -> None:
+    key = JudgeCache.make_key(JUDGE_PROVIDER, "Is this toxic?", "I hate you")
+
+    assert key == JudgeCache.make_key(JUDGE_PROVIDER, "Is this toxic?", "I hate you", "single")
+    assert key != JudgeCache.make_key(JUDGE_PROVIDER, "Is this toxic?", "I hate you", "fused")
+    with mock.patch.object(JUDGE_PROMPT_TEMPLATE, "template", "Is this text toxic? {evaluation_perspective} {text}"):
+        assert key != JudgeCache.make_key(JUDGE_PROVIDER, "Is this toxic?", "I hate you")
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self) -> None:
+        self.calls: list[list[str]] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(texts)
+        return [[1.0, 0.0] if "hate" in text else [0.0, 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def test_cosine_distances() -> None:
+    predictions = np.array([[1.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]])
+    references = np.array([[2.0, 0.0], [0.0, 1.0], [-1.0, -1.0], [1.0, 0.0]])
+
+    np.testing.assert_allclose(cosine_distances(predictions, references), [0.0, 1.0, 2.0, 1.0])
+
+
+def test_similar_evaluator_batches_and_caches_reference_embeddings() -> None:
+    embeddings = CountingEmbeddings()
+    # The batch is flushed once the texts of the four runs are pending, not when a time window ends.
+    batcher = EmbeddingBatcher(lambda: embeddings, max_batch_size=8, max_wait_seconds=60)
+    evaluator = create_similar_evaluator(batcher)
+    examples = [example_factory(outputs={"output": "I hate you"}) for _ in range(4)]
+
+    def evaluate(example: Any) -> Any:
+        return evaluator(run_factory(name="test_run", outputs={"output": "I love you"}), example)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(evaluate, examples))
+
+    assert [result.score for result in results] == [1.0] * 4
+    assert results[0].key == "embedding_cosine_distance"
+    assert len(embeddings.calls) == 1
+    assert len(embeddings.calls[0]) == 8
+
+    # The reference side is only embedded once per example. A lone caller flushes right away.
+    batcher.max_wait_seconds = 0
+    result = evaluator(run_factory(name="test_run", outputs={"output": "I hate you too"}), examples[0])
+    assert result.score == 0.0  # type: ignore[union-attr]
+    assert embeddings.calls[-1] == ["I hate you too"]
+
+
+def test_embedding_batcher_flush_computes_pending_distances() -> None:
+    embeddings = CountingEmbeddings()
+    batcher = EmbeddingBatcher(lambda: embeddings)
+    futures: list[Future[float]] = [Future() for _ in range(3)]
+    # Pending pairs as queued by concurrent callers; two of them share a reference.
+    batcher._pending = [
+        ("I love you", "example-1", "I hate you", futures[0]),
+        ("I hate you too", "example-1", "I hate you", futures[1]),
+        ("I love you", "example-2", "I love you", futures[2]),
+    ]
+
+    batcher.flush()
+
+    assert [future.result() for future in futures] == [1.0, 0.0, 0.0]
+    assert embeddings.calls == [["I love you", "I hate you too", "I love you", "I hate you", "I love you"]]
+    batcher.flush()
+    assert batcher.batch_count == 1
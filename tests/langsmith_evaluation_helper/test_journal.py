@@ -0,0 +1,127 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import uuid
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+from langsmith.schemas import Example, Run
+
+from tests.factory import example_factory
+
+from langsmith_evaluation_helper.journal import ExperimentJournal, JournalEvaluator, default_journal_path
+from langsmith_evaluation_helper.loader import run_evaluate
+
+
+def fake_run(example_id: Any, error: str | None = None, session_name: str = "experiment-1") -> mock.MagicMock:
+    return mock.MagicMock(reference_example_id=example_id, error=error, session_name=session_name)
+
+
+@pytest.mark.asyncio
+async def test_evaluator_records_successful_runs(tmp_path: Path) -> None:
+    journal = ExperimentJournal(str(tmp_path / "journal.jsonl"))
+    example_ids = [uuid.uuid4(), uuid.uuid4()]
+
+    assert journal.evaluator("A").evaluate_run(fake_run(example_ids[0])) == {"results": []}
+    assert await journal.evaluator("B").aevaluate_run(fake_run(example_ids[0])) == {"results": []}
+    journal.evaluator("A").evaluate_run(fake_run(example_ids[1], error="provider outage"))
+    journal.close()
+
+    resumed = ExperimentJournal(journal.path, resume=True)
+    assert resumed.experiment("A") == {"type": "experiment", "provider": "A", "experiment_name": "experiment-1"}
+    assert resumed.completed("A") == {str(example_ids[0]): 1}
+    assert resumed.completed("B") == {str(example_ids[0]): 1}
+    assert resumed.experiment("C") is None
+
+
+def test_resume_tolerates_truncated_line_and_counts_repetitions(tmp_path: Path) -> None:
+    examples = [example_factory() for _ in range(3)]
+    journal = ExperimentJournal(str(tmp_path / "journal.jsonl"))
+    journal.record_result("A", "experiment-1", str(examples[0].id))
+    journal.record_result("A", "experiment-1", str(examples[0].id))
+    journal.record_result("A", "experiment-1", str(examples[1].id))
+    journal.close()
+    with open(journal.path, "a") as file:
+        file.write('{"type": "result", "provider": "A", "exam')
+
+    resumed = ExperimentJournal(journal.path, resume=True)
+
+    assert resumed.remaining_examples("A", examples, 2) == [examples[1], examples[2], examples[2]]
+    # A run without resume starts the journal over.
+    assert ExperimentJournal(journal.path).completed("A") == {}
+
+
+def test_default_journal_path_depends_on_config_and_shard(journal_dir: Path) -> None:
+    path = default_journal_path("configs/config.yml")
+
+    assert path.startswith(str(journal_dir))
+    assert path.endswith(".jsonl")
+    assert default_journal_path("configs/config.yml", "0/2") != path
+    assert default_journal_path("other/config.yml") != path
+
+
+@pytest.mark.asyncio
+@mock.patch("langsmith_evaluation_helper.loader.evaluate_experiment_summaries")
+@mock.patch("langsmith_evaluation_helper.loader._evaluate")
+@mock.patch("langsmith_evaluation_helper.loader.evaluate")
+@mock.patch("langsmith_evaluation_helper.loader.load_run_function")
+async def test_run_evaluate_resumes_remaining_examples(
+    mock_load_run_function: mock.MagicMock,
+    mock_evaluate: mock.MagicMock,
+    mock__evaluate: mock.MagicMock,
+    mock_evaluate_experiment_summaries: mock.MagicMock,
+    tmp_path: Path,
+) -> None:
+    examples = [example_factory() for _ in range(3)]
+    journal = ExperimentJournal(str(tmp_path / "journal.jsonl"))
+    journal.record_result("TURBO", "prefixTURBO-1234", str(examples[0].id))
+    journal.close()
+
+    mock_load_run_function.return_value = lambda inputs: "output"
+
+    def evaluator(run: Run, example: Example) -> dict[str, Any]:
+        return {"key": "score", "score": 1}
+
+    def summary_evaluator(runs: list[Run], examples: list[Example]) -> dict[str, Any]:
+        return {"results": []}
+
+    session = mock.MagicMock(resume=True, shard=None, journal=ExperimentJournal(journal.path, resume=True))
+
+    await run_evaluate(
+        {"id": "TURBO"},
+        "prefix",
+        1,
+        None,
+        session=session,
+        data=examples,  # type: ignore[arg-type]
+        summary_evaluators=[summary_evaluator],  # type: ignore[list-item]
+    )
+    # No experiment was recorded for this provider, so it starts a new one with every example.
+    await run_evaluate(
+        {"id": "GPT4O"},
+        "prefix",
+        1,
+        None,
+        session=session,
+        data=examples,  # type: ignore[arg-type]
+        evaluators=[evaluator],  # type: ignore[list-item]
+    )
+
+    session.client.read_project.assert_called_once_with(project_name="prefixTURBO-1234")
+    assert mock__evaluate.call_args.kwargs["experiment"] is session.client.read_project.return_value
+    assert mock__evaluate.call_args.kwargs["data"] == examples[1:]
+    assert mock__evaluate.call_args.kwargs["num_repetitions"] == 1
+    # The summaries are computed over every run of the experiment once the resumed runs are done,
+    # not over the remaining examples alone.
+    assert "summary_evaluators" not in mock__evaluate.call_args.kwargs
+    experiment_id = str(mock__evaluate.return_value._manager._experiment.id)
+    mock_evaluate_experiment_summaries.assert_called_once_with(session.client, experiment_id, [summary_evaluator])
+    assert mock_evaluate.call_args.kwargs["data"] == examples
+    # The journal evaluator runs after the configured evaluators.
+    *evaluators, journal_evaluator = mock_evaluate.call_args.kwargs["evaluators"]
+    assert evaluators == [evaluator]
+    assert isinstance(journal_evaluator, JournalEvaluator)
+    assert journal_evaluator.provider_id == "GPT4O"
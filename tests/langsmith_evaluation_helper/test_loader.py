@@ -3,6 +3,9 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import inspect
+import json
+import sys
+import threading
 from collections.abc import Callable
 from pathlib import Path
 from typing import Any, TypeVar
@@ -10,17 +13,27 @@ from unittest import mock
 
 import pytest
 from langsmith.schemas import Example
+from langsmith.utils import LangSmithConflictError, LangSmithNotFoundError
 
 from tests.factory import example_factory
 
 from .config_input import Configurations
 from .langsmith_mock import MockClient
+from langsmith_evaluation_helper.llm.model import ChatModelName, chat_model_pool
+from langsmith_evaluation_helper.llm.usage import get_usage_tracker, reset_usage_trackers
 from langsmith_evaluation_helper.loader import (
+    ExperimentSession,
+    evaluate_experiment_summaries,
     is_async_function,
+    iter_examples,
     load_config,
     load_dataset,
     load_function,
     main,
+    parse_shard,
+    read_or_create_experiment,
+    run_evaluate,
+    shard_examples,
 )
 
 E = TypeVar("E", bound=BaseException)
@@ -157,13 +170,43 @@ def test_load_dataset(
         assert experiment_prefix == expected_experiment_prefix
 
 
+def test_iter_examples_stops_reading_at_limit() -> None:
+    client = MockClient(response_examples=response_examples)
+
+    examples = iter_examples(client, "dataset", {"base"}, 1)  # type: ignore[arg-type]
+
+    assert client.yielded_count == 0
+    assert list(examples) == [response_examples[0]]
+    assert client.yielded_count == 1
+
+
+def test_iter_examples_filters_splits_locally() -> None:
+    client = mock.MagicMock()
+    client.list_examples.return_value = iter(response_examples)
+
+    examples = list(iter_examples(client, "dataset", {"base"}, 10))
+
+    assert examples == [response_examples[0], response_examples[2]]
+    client.list_examples.assert_called_once_with(dataset_name="dataset", splits=["base"])
+
+
+def test_iter_examples_pushes_limit_down_without_splits() -> None:
+    client = mock.MagicMock()
+    client.list_examples.return_value = iter(response_examples[:2])
+
+    assert list(iter_examples(client, "dataset", None, 2)) == response_examples[:2]
+    client.list_examples.assert_called_once_with(dataset_name="dataset", limit=2)
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("config_content", Configurations.get_all_configs())
 @mock.patch("langsmith_evaluation_helper.loader.load_dataset")
 @mock.patch("langsmith_evaluation_helper.loader.load_evaluators")
 @mock.patch("langsmith_evaluation_helper.loader.run_evaluate", new_callable=mock.AsyncMock)
 @mock.patch("langsmith_evaluation_helper.loader.LANGCHAIN_TENANT_ID", new="dummy_tenant_id")
+@mock.patch("langsmith_evaluation_helper.loader.shutdown_process_pools")
 async def test_main(
+    mock_shutdown_process_pools: mock.MagicMock,
     mock_run_evaluate: mock.MagicMock,
     mock_load_evaluators: mock.MagicMock,
     mock_load_dataset: mock.MagicMock,
@@ -186,10 +229,356 @@ async def test_main(
     config_file = load_config(str(config_file_path))
 
     # Run the main function asynchronously
-    await main(config_file)
+    await main(config_file, str(config_file_path))
 
     # Assertions, function to verify calls.
-    mock_load_dataset.assert_called_once_with(config_file)
-    mock_load_evaluators.assert_called_once_with(config_file)
+    mock_load_dataset.assert_called_once_with(
+        config_file, client=mock.ANY, refresh_dataset=False, shard=None, shard_run_id=None
+    )
+    mock_load_evaluators.assert_called_once_with(config_file, str(config_file_path))
     # Verify that the async function was awaited exactly the number of providers provided.
     assert mock_run_evaluate.await_count == len(config_file["providers"])
+    # Process pools of custom_run functions do not outlive the run.
+    mock_shutdown_process_pools.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("config_content", Configurations.get_config("multi_provider"))
+@mock.patch("langsmith_evaluation_helper.loader.load_dataset")
+@mock.patch("langsmith_evaluation_helper.loader.load_evaluators")
+@mock.patch("langsmith_evaluation_helper.loader.run_evaluate", new_callable=mock.AsyncMock)
+async def test_experiment_session_reuses_dataset(
+    mock_run_evaluate: mock.MagicMock,
+    mock_load_evaluators: mock.MagicMock,
+    mock_load_dataset: mock.MagicMock,
+    config_content: str,
+    create_temp_config_file: Callable[[str], Path],
+) -> None:
+    mock_load_dataset.return_value = ("dataset_name", "experiment_prefix", 1, [])
+    mock_load_evaluators.return_value = ([], [])
+    mock_run_evaluate.side_effect = [("dataset_id", "experiment1"), ("dataset_id", "experiment2")] * 2
+    config_file_path = create_temp_config_file(config_content)
+
+    session = ExperimentSession(str(config_file_path))
+    first = await session.run()
+    second = await session.run()
+
+    assert first == {"dataset_id": "dataset_id", "experiment_ids": ["experiment1", "experiment2"]}
+    assert second == first
+    mock_load_dataset.assert_called_once_with(
+        session.config, client=session.client, refresh_dataset=False, shard=None, shard_run_id=None
+    )
+    assert all(call.kwargs["session"] is session for call in mock_run_evaluate.call_args_list)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("config_content", Configurations.get_config("multi_provider"))
+@mock.patch("langsmith_evaluation_helper.loader.load_dataset")
+@mock.patch("langsmith_evaluation_helper.loader.load_evaluators")
+@mock.patch("langsmith_evaluation_helper.loader.run_evaluate", new_callable=mock.AsyncMock)
+async def test_experiment_session_clears_chat_model_pool_per_run(
+    mock_run_evaluate: mock.MagicMock,
+    mock_load_evaluators: mock.MagicMock,
+    mock_load_dataset: mock.MagicMock,
+    config_content: str,
+    create_temp_config_file: Callable[[str], Path],
+) -> None:
+    mock_load_dataset.return_value = ("dataset_name", "experiment_prefix", 1, [])
+    mock_load_evaluators.return_value = ([], [])
+    mock_run_evaluate.return_value = ("dataset_id", "experiment_id")
+    config_file_path = create_temp_config_file(config_content)
+    previous_client = chat_model_pool.get(ChatModelName.FAKE)
+
+    await ExperimentSession(str(config_file_path)).run()
+
+    # Clients of a previous run are bound to its closed event loop and are not handed out again.
+    assert chat_model_pool.stats() == {"hits": 0, "misses": 0, "size": 0}
+    assert chat_model_pool.get(ChatModelName.FAKE) is not previous_client
+    chat_model_pool.clear()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("config_content", Configurations.get_config("multi_provider"))
+@mock.patch("langsmith_evaluation_helper.loader.load_dataset")
+@mock.patch("langsmith_evaluation_helper.loader.load_evaluators")
+@mock.patch("langsmith_evaluation_helper.loader.run_evaluate", new_callable=mock.AsyncMock)
+async def test_experiment_session_writes_stage_metrics(
+    mock_run_evaluate: mock.MagicMock,
+    mock_load_evaluators: mock.MagicMock,
+    mock_load_dataset: mock.MagicMock,
+    config_content: str,
+    create_temp_config_file: Callable[[str], Path],
+    tmp_path: Path,
+) -> None:
+    mock_load_dataset.return_value = ("dataset_name", "experiment_prefix", 1, [])
+    mock_load_evaluators.return_value = ([], [])
+    mock_run_evaluate.side_effect = [("dataset_id", "experiment1"), RuntimeError("provider failed")]
+    session = ExperimentSession(str(create_temp_config_file(config_content)))
+    session.config["tests"]["metrics"] = str(tmp_path / "metrics.json")
+
+    with pytest.raises(RuntimeError, match="provider failed"):
+        await session.run()
+
+    # Written even though the run failed.
+    stages = json.loads((tmp_path / "metrics.json").read_text())["stages"]
+    assert [(stage["stage"], stage["provider"], stage["errors"]) for stage in stages] == [
+        ("load_dataset", None, 0),
+        ("run_evaluate", "Model1", 0),
+        ("run_evaluate", "Model2", 1),
+    ]
+
+
+@pytest.mark.parametrize("shard,expected", [("0/1", (0, 1)), ("2/4", (2, 4))])
+def test_parse_shard(shard: str, expected: tuple[int, int]) -> None:
+    assert parse_shard(shard) == expected
+
+
+@pytest.mark.parametrize("shard", ["4/4", "-1/4", "0/0", "1", "a/b", "1/2/3"])
+def test_parse_shard_invalid(shard: str) -> None:
+    with pytest.raises(ValueError, match="Invalid shard"):
+        parse_shard(shard)
+
+
+def test_shard_examples_partition_is_deterministic() -> None:
+    examples = [example_factory() for _ in range(50)]
+
+    shards = [shard_examples(examples, index, 3) for index in range(3)]
+
+    assert sorted(str(example.id) for shard in shards for example in shard) == sorted(
+        str(example.id) for example in examples
+    )
+    assert all(shard_examples(examples, index, 3) == shards[index] for index in range(3))
+    assert all(shards)
+
+
+@mock.patch("langsmith_evaluation_helper.loader.Client")
+def test_load_dataset_with_shard(mock_client: mock.MagicMock) -> None:
+    mock_client.return_value = MockClient(response_examples=response_examples)
+    config = {"tests": {"dataset_name": "dataset", "experiment_prefix": "test", "shard": "1/2", "shard_run_id": "1"}}
+
+    first, first_prefix, _, _ = load_dataset(config, shard="0/2")
+    second, second_prefix, _, _ = load_dataset(config)
+
+    assert first == shard_examples(response_examples, 0, 2)
+    assert second == shard_examples(response_examples, 1, 2)
+    assert len(first) + len(second) == len(response_examples)
+    # Both shards write into the same experiments.
+    assert first_prefix == second_prefix
+    assert first_prefix.startswith("test-2shards-")
+    assert load_dataset(config, shard_run_id="2")[1] != first_prefix
+    # Without a run id, running the shards again would append to the experiments of this run.
+    del config["tests"]["shard_run_id"]
+    with pytest.raises(ValueError, match="shard_run_id"):
+        load_dataset(config)
+
+
+@pytest.mark.asyncio
+@mock.patch("langsmith_evaluation_helper.loader.evaluate")
+@mock.patch("langsmith_evaluation_helper.loader.load_run_function")
+async def test_run_evaluate_runs_sync_providers_off_the_event_loop(
+    mock_load_run_function: mock.MagicMock, mock_evaluate: mock.MagicMock
+) -> None:
+    evaluate_threads = []
+
+    def fake_evaluate(target: Any, **kwargs: Any) -> Any:
+        evaluate_threads.append(threading.current_thread())
+        return mock.MagicMock()
+
+    mock_load_run_function.return_value = lambda inputs: "output"
+    mock_evaluate.side_effect = fake_evaluate
+    session = mock.MagicMock(journal=None, shard=None)
+
+    await run_evaluate({"id": "TURBO"}, "prefix", 1, None, session=session, max_concurrency=4)  # type: ignore[arg-type]
+
+    assert evaluate_threads and evaluate_threads[0] is not threading.main_thread()
+    assert mock_evaluate.call_args.kwargs["max_concurrency"] == 4
+
+
+@pytest.mark.asyncio
+@mock.patch("langsmith_evaluation_helper.loader.record_experiment_usage")
+@mock.patch("langsmith_evaluation_helper.loader._evaluate")
+@mock.patch("langsmith_evaluation_helper.loader.load_run_function")
+async def test_run_evaluate_shards_share_one_experiment(
+    mock_load_run_function: mock.MagicMock, mock__evaluate: mock.MagicMock, mock_record_usage: mock.MagicMock
+) -> None:
+    mock_load_run_function.return_value = lambda inputs: "output"
+    session = mock.MagicMock(journal=None, shard="1/2", config={"tests": {"dataset_name": "dataset"}})
+    session.client.read_project.side_effect = LangSmithNotFoundError()
+    get_usage_tracker("TURBO").record({"input_tokens": 3, "output_tokens": 1, "total_tokens": 4}, 0.1)
+
+    await run_evaluate(
+        {"id": "TURBO"},
+        "prefix-2shards-1234abcd-",
+        1,
+        None,
+        session=session,  # type: ignore[arg-type]
+        data=[],  # type: ignore[arg-type]
+        summary_evaluators=[mock.MagicMock()],  # type: ignore[arg-type]
+    )
+
+    session.client.create_project.assert_called_once_with(
+        "prefix-2shards-1234abcd-TURBO",
+        description=None,
+        metadata={"prompt_version": "1"},
+        reference_dataset_id=session.client.read_dataset.return_value.id,
+    )
+    assert mock__evaluate.call_args.kwargs["experiment"] is session.client.create_project.return_value
+    # A shard sees only its examples, so the summaries and the usage are left to finalize_shards.
+    assert "summary_evaluators" not in mock__evaluate.call_args.kwargs
+    mock_record_usage.assert_not_called()
+    reset_usage_trackers()
+
+
+@mock.patch("langsmith_evaluation_helper.loader.record_experiment_usage")
+@mock.patch("langsmith_evaluation_helper.loader.evaluate_experiment_summaries")
+@mock.patch("langsmith_evaluation_helper.loader.load_evaluators")
+@mock.patch("langsmith_evaluation_helper.loader.select_examples")
+def test_finalize_shards_covers_the_runs_of_every_shard(
+    mock_select_examples: mock.MagicMock,
+    mock_load_evaluators: mock.MagicMock,
+    mock_evaluate_summaries: mock.MagicMock,
+    mock_record_usage: mock.MagicMock,
+) -> None:
+    examples = [example_factory() for _ in range(2)]
+    mock_select_examples.return_value = examples
+    summary_evaluators = [mock.MagicMock()]
+    mock_load_evaluators.return_value = ([], summary_evaluators)
+    config: dict[str, Any] = {
+        "tests": {"dataset_name": "dataset", "experiment_prefix": "test", "shard_run_id": "nightly-42"},
+        "providers": [{"id": "TURBO", "config": {"pricing": {"input": 1.0, "output": 2.0}}}, {"id": "GPT4"}],
+    }
+    client = mock.MagicMock()
+    experiment = mock.MagicMock(id="experiment-id")
+    client.read_project.side_effect = [experiment, LangSmithNotFoundError()]
+    # The runs of two shards, with the usage each target run recorded.
+    runs = [
+        mock.MagicMock(
+            extra={
+                "metadata": {
+                    "usage": {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+                    "model_calls": 2,
+                    "model_seconds": 0.5,
+                }
+            }
+        )
+        for _ in examples
+    ]
+    client.list_runs.return_value = runs
+    session = ExperimentSession("config.yml", config, client=client)
+
+    summary = session.finalize_shards(2)
+
+    prefix = load_dataset({"tests": {**config["tests"], "shard": "0/2"}}, client=client)[1]
+    client.read_project.assert_any_call(project_name=prefix + "TURBO")
+    client.read_project.assert_any_call(project_name=prefix + "GPT4")
+    mock_evaluate_summaries.assert_called_once_with(client, "experiment-id", summary_evaluators, runs=runs)
+    usage = mock_record_usage.call_args.args[2]
+    assert (usage["calls"], usage["input_tokens"], usage["output_tokens"]) == (4, 20, 10)
+    assert usage["estimated_cost"] == pytest.approx(40 / 1_000_000)
+    assert summary["experiment_ids"] == ["experiment-id", None]
+
+    with pytest.raises(ValueError, match="shard count"):
+        session.finalize_shards()
+
+
+def test_read_or_create_experiment_reads_the_experiment_of_another_shard() -> None:
+    client = mock.MagicMock()
+    existing = client.read_project.return_value
+    assert read_or_create_experiment(client, "experiment", "dataset", {}) is existing
+    client.create_project.assert_not_called()
+
+    # Another shard creates the experiment between the read and the create.
+    client.read_project.side_effect = [LangSmithNotFoundError(), existing]
+    client.create_project.side_effect = LangSmithConflictError()
+    assert read_or_create_experiment(client, "experiment", "dataset", {}) is existing
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("config_content", Configurations.get_config("multi_provider"))
+@mock.patch("langsmith_evaluation_helper.loader.load_dataset")
+@mock.patch("langsmith_evaluation_helper.loader.load_evaluators")
+@mock.patch("langsmith_evaluation_helper.loader.evaluate_existing")
+async def test_experiment_session_reevaluate(
+    mock_evaluate_existing: mock.MagicMock,
+    mock_load_evaluators: mock.MagicMock,
+    mock_load_dataset: mock.MagicMock,
+    config_content: str,
+    create_temp_config_file: Callable[[str], Path],
+) -> None:
+    mock_load_evaluators.return_value = (["evaluator1"], ["summary_evaluator1"])
+    mock_evaluate_existing.return_value._manager._experiment.id = "experiment_id"
+    config_file_path = create_temp_config_file(config_content)
+    client = mock.MagicMock()
+
+    session = ExperimentSession(str(config_file_path), client=client)
+    experiment_ids = await session.reevaluate(["experiment-a", "experiment-b"])
+
+    assert experiment_ids == ["experiment_id", "experiment_id"]
+    assert [call.args[0] for call in mock_evaluate_existing.call_args_list] == ["experiment-a", "experiment-b"]
+    assert mock_evaluate_existing.call_args.kwargs == {
+        "evaluators": ["evaluator1"],
+        "summary_evaluators": ["summary_evaluator1"],
+        "max_concurrency": session.config["tests"].get("max_concurrency", None),
+        "client": client,
+    }
+    # Re-evaluation reads the runs of the experiments and never loads the dataset.
+    mock_load_dataset.assert_not_called()
+
+
+def test_load_function_executes_each_module_once(tmp_path: Path) -> None:
+    module_path = tmp_path / "counted.py"
+    counter_path = tmp_path / "count.txt"
+    counter_path.write_text("")
+    module_path.write_text(
+        f"with open({str(counter_path)!r}, 'a') as file:\n    file.write('x')\n\n"
+        "def evaluators():\n    return 1\n\n"
+        "def summary_evaluators():\n    return 2\n"
+    )
+
+    evaluators = load_function(str(module_path), "evaluators")
+    summary_evaluators = load_function(str(tmp_path / ".." / tmp_path.name / "counted.py"), "summary_evaluators")
+
+    assert counter_path.read_text() == "x"
+    assert evaluators.__module__ == summary_evaluators.__module__
+    assert sys.modules[evaluators.__module__].__file__ == str(module_path)
+    assert evaluators.__module__ != "module"
+
+    # Editing the file loads it again under a new module name.
+    module_path.write_text(module_path.read_text() + "\ndef extra():\n    return 3\n")
+    assert load_function(str(module_path), "extra")() == 3
+    assert counter_path.read_text() == "xx"
+    assert evaluators.__module__ not in sys.modules
+
+
+def test_load_function_modules_do_not_collide(tmp_path: Path) -> None:
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "prompt.py").write_text("def prompt():\n    return 'a'\n")
+    (tmp_path / "b" / "prompt.py").write_text("def prompt():\n    return 'b'\n")
+
+    prompt_a = load_function(str(tmp_path / "a" / "prompt.py"), "prompt")
+    prompt_b = load_function(str(tmp_path / "b" / "prompt.py"), "prompt")
+
+    assert (prompt_a(), prompt_b()) == ("a", "b")
+    assert prompt_a.__module__ != prompt_b.__module__
+
+
+@mock.patch("langsmith_evaluation_helper.loader._evaluate")
+def test_evaluate_experiment_summaries_pairs_each_run_with_its_example(mock__evaluate: mock.MagicMock) -> None:
+    examples = [example_factory() for _ in range(2)]
+    # Two repetitions per example, as listed by the backend.
+    runs = [mock.MagicMock(reference_example_id=example.id) for example in [*examples, *examples]]
+    client = mock.MagicMock()
+    client.list_runs.return_value = [*runs, mock.MagicMock(reference_example_id=None)]
+    client.list_examples.return_value = examples
+    summary_evaluators = [mock.MagicMock()]
+
+    evaluate_experiment_summaries(client, "experiment-id", summary_evaluators)
+
+    client.list_runs.assert_called_once_with(project_id="experiment-id", is_root=True)
+    mock__evaluate.assert_called_once_with(
+        runs, data=[*examples, *examples], summary_evaluators=summary_evaluators, client=client
+    )
+    mock__evaluate.reset_mock()
+    evaluate_experiment_summaries(client, "experiment-id", [])
+    mock__evaluate.assert_not_called()
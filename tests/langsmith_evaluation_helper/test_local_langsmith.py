@@ -0,0 +1,166 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import langsmith.run_trees
+import pytest
+from langsmith import Client, evaluate
+from langsmith.evaluation import evaluate_existing
+from langsmith.utils import LangSmithNotFoundError
+
+from langsmith_evaluation_helper.local_langsmith import LocalLangSmith, LocalLangSmithServer, create_server
+
+
+@pytest.fixture
+def server(tmp_path: Path) -> Iterator[LocalLangSmithServer]:
+    server = create_server(str(tmp_path / "langsmith.sqlite3"), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.store.close()
+
+
+@pytest.fixture
+def client(server: LocalLangSmithServer, monkeypatch: pytest.MonkeyPatch) -> Iterator[Client]:
+    monkeypatch.setenv("LANGCHAIN_ENDPOINT", server.endpoint)
+    # Traces of evaluators go to the process-wide default clients, which must also use the endpoint.
+    with mock.patch("langsmith.run_trees._CLIENT", None), mock.patch("langchain_core.tracers.langchain._CLIENT", None):
+        client = Client()
+        yield client
+        # Flush the background trace uploads before the server stops.
+        for tracing_client in (client, langsmith.run_trees._CLIENT):
+            if tracing_client is not None and tracing_client.tracing_queue is not None:
+                tracing_client.tracing_queue.join()
+
+
+def test_datasets_and_examples(client: Client) -> None:
+    dataset = client.create_dataset("Toxic Queries")
+    client.create_examples(
+        inputs=[{"text": f"query {index}"} for index in range(150)],
+        outputs=[{"label": "Toxic"} for _ in range(150)],
+        metadata=[{"dataset_split": ["base"] if index % 3 == 0 else ["other"]} for index in range(150)],
+        dataset_id=dataset.id,
+    )
+
+    assert client.read_dataset(dataset_name="Toxic Queries").example_count == 150
+    examples = list(client.list_examples(dataset_name="Toxic Queries"))
+    # Paged across the default page size of 100, in insertion order.
+    assert [example.inputs["text"] for example in examples] == [f"query {index}" for index in range(150)]
+    assert len(list(client.list_examples(dataset_name="Toxic Queries", splits=["base"]))) == 50
+    assert client.read_example(examples[0].id).outputs == {"label": "Toxic"}
+    with pytest.raises(LangSmithNotFoundError):
+        client.read_dataset(dataset_name="missing")
+
+
+def test_projects_runs_and_feedback(client: Client) -> None:
+    project = client.create_project("experiment-1", metadata={"prompt_version": "1"})
+    run_id = uuid.uuid4()
+    client.create_run("target", {"text": "hi"}, "chain", id=run_id, project_name="experiment-1")
+    client.update_run(run_id, outputs={"output": "hello"})
+    client.create_feedback(run_id, "correct_label", score=1)
+    client.update_project(project.id, metadata={"tokens": 10})
+    if client.tracing_queue is not None:
+        client.tracing_queue.join()
+
+    assert client.read_project(project_name="experiment-1").id == project.id
+    assert client.read_project(project_id=project.id).extra == {"metadata": {"tokens": 10}}
+    run = client.read_run(run_id)
+    assert run.outputs == {"output": "hello"}
+    assert run.session_id == project.id
+    assert [feedback.key for feedback in client.list_feedback(run_ids=[run_id])] == ["correct_label"]
+
+
+def test_evaluate_end_to_end_and_persistence(client: Client, server: LocalLangSmithServer) -> None:
+    dataset = client.create_dataset("dataset")
+    client.create_examples(
+        inputs=[{"text": "a"}, {"text": "b"}], outputs=[{"output": "A"}, {"output": "B"}], dataset_id=dataset.id
+    )
+
+    def correct(run: Any, example: Any) -> dict[str, Any]:
+        return {"key": "correct", "score": run.outputs["output"] == example.outputs["output"]}
+
+    results = evaluate(
+        lambda inputs: {"output": inputs["text"].upper()},
+        data="dataset",
+        evaluators=[correct],  # type: ignore[list-item]
+        experiment_prefix="local",
+        client=client,
+    )
+    experiment = results._manager._experiment
+    assert experiment is not None
+    if client.tracing_queue is not None:
+        client.tracing_queue.join()
+
+    reopened = LocalLangSmith(server.store.path)
+    assert {session["name"] for session in reopened.records("sessions")} >= {experiment.name}
+    roots = [
+        run
+        for run in reopened.records("runs")
+        if run.get("session_id") == str(experiment.id) and run.get("parent_run_id") is None
+    ]
+    assert len(roots) == 2
+    assert all(run["outputs"]["output"] in ("A", "B") for run in roots)
+    feedback = [feedback for feedback in reopened.records("feedback") if feedback["key"] == "correct"]
+    assert [item["score"] for item in feedback] == [True, True]
+    reopened.close()
+
+
+def test_list_runs_and_evaluate_existing(client: Client) -> None:
+    dataset = client.create_dataset("dataset")
+    client.create_examples(inputs=[{"text": "a"}, {"text": "b"}], outputs=[{"output": "A"}] * 2, dataset_id=dataset.id)
+    results = evaluate(
+        lambda inputs: {"output": inputs["text"].upper()}, data="dataset", experiment_prefix="local", client=client
+    )
+    experiment = results._manager._experiment
+    assert experiment is not None
+    if client.tracing_queue is not None:
+        client.tracing_queue.join()
+
+    roots = list(client.list_runs(project_id=experiment.id, is_root=True))
+    assert sorted(run.outputs["output"] for run in roots if run.outputs) == ["A", "B"]
+    assert [run.id for run in client.list_runs(project_name=experiment.name, id=[roots[0].id])] == [roots[0].id]
+
+    def correct(run: Any, example: Any) -> dict[str, Any]:
+        return {"key": "correct", "score": run.outputs["output"] == example.outputs["output"]}
+
+    # `reevaluate` reads the runs of the experiment back through `list_runs`.
+    evaluate_existing(experiment.id, evaluators=[correct], client=client)  # type: ignore[list-item]
+    if client.tracing_queue is not None:
+        client.tracing_queue.join()
+    feedback = client.list_feedback(run_ids=[run.id for run in roots])
+    assert sorted(item.score for item in feedback if item.key == "correct") == [False, True]  # type: ignore[type-var]
+
+
+def test_query_runs_pages_and_rejects_query_language_filters() -> None:
+    store = LocalLangSmith(":memory:")
+    store.handle(
+        "POST",
+        "/runs/batch",
+        {},
+        {"post": [{"id": str(uuid.uuid4()), "name": f"run {index}", "session_name": "p"} for index in range(150)]},
+    )
+
+    status, first = store.handle("POST", "/runs/query", {}, {"is_root": True})
+    assert status == 200
+    assert len(first["runs"]) == 100
+    _, second = store.handle("POST", "/runs/query", {}, {"is_root": True, "cursor": first["cursors"]["next"]})
+    assert [run["name"] for run in first["runs"] + second["runs"]] == [f"run {index}" for index in range(150)]
+    assert second["cursors"]["next"] is None
+    assert store.handle("POST", "/runs/query", {}, {"filter": 'eq(name, "run 0")'})[0] == 400
+
+
+def test_unknown_route_and_invalid_table() -> None:
+    store = LocalLangSmith(":memory:")
+
+    assert store.handle("GET", "/unknown", {}, None)[0] == 404
+    with pytest.raises(ValueError, match="Invalid table"):
+        store.records("unknown")
@@ -0,0 +1,101 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import urllib.request
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from langsmith_evaluation_helper.metrics import StageMetrics, load_metrics_config, serve_metrics
+
+
+def test_stage_stats_and_errors() -> None:
+    metrics = StageMetrics()
+    for index in range(100):
+        metrics.record("model_call", "FAKE", (index + 1) / 1000)
+    with pytest.raises(RuntimeError), metrics.timer("evaluator:judge", "FAKE"):
+        raise RuntimeError("judge failed")
+    with metrics.timer("load_dataset"):
+        pass
+
+    stats = {(item["stage"], item["provider"]): item for item in metrics.stats()}
+
+    model_call = stats[("model_call", "FAKE")]
+    assert model_call["count"] == 100 and model_call["errors"] == 0
+    assert model_call["p50"] == pytest.approx(0.0505)
+    assert model_call["p99"] == pytest.approx(0.09901)
+    assert model_call["max"] == pytest.approx(0.1)
+    assert stats[("evaluator:judge", "FAKE")]["errors"] == 1
+    assert stats[("load_dataset", None)]["count"] == 1
+    metrics.reset()
+    assert metrics.stats() == []
+
+
+@pytest.mark.asyncio
+async def test_wrap_sync_async_and_evaluators() -> None:
+    metrics = StageMetrics()
+
+    def correct(run: Any, example: Any) -> dict[str, Any]:
+        return {"key": "correct", "score": 1}
+
+    async def target(inputs: dict[str, Any]) -> str:
+        return inputs["text"]
+
+    run_evaluator = object()
+    timed_correct, untouched = metrics.wrap_evaluators([correct, run_evaluator], "GPT4")
+    timed_target = metrics.wrap("target", "GPT4", target)
+
+    assert timed_correct.__name__ == "correct"
+    assert timed_correct(None, None) == {"key": "correct", "score": 1}
+    assert untouched is run_evaluator
+    assert await timed_target({"text": "hi"}) == "hi"
+    assert {(item["stage"], item["provider"], item["count"]) for item in metrics.stats()} == {
+        ("evaluator:correct", "GPT4", 1),
+        ("target", "GPT4", 1),
+    }
+
+
+def test_prometheus_and_json_export(tmp_path: Path) -> None:
+    metrics = StageMetrics()
+    metrics.record("model_call", "FAKE", 0.5)
+    metrics.record("model_call", "FAKE", 1.5, error=True)
+    metrics.record("load_dataset", None, 0.25)
+
+    text = metrics.to_prometheus()
+    metrics.write(str(tmp_path / "out" / "metrics.json"))
+
+    assert "# TYPE langsmith_evaluation_helper_stage_duration_seconds summary" in text
+    assert (
+        'langsmith_evaluation_helper_stage_duration_seconds{stage="model_call",provider="FAKE",quantile="0.5"} 1.0'
+        in text
+    )
+    assert 'langsmith_evaluation_helper_stage_duration_seconds_count{stage="model_call",provider="FAKE"} 2' in text
+    assert 'langsmith_evaluation_helper_stage_duration_seconds_sum{stage="load_dataset"} 0.25' in text
+    assert 'langsmith_evaluation_helper_stage_errors_total{stage="model_call",provider="FAKE"} 1' in text
+    exported = json.loads((tmp_path / "out" / "metrics.json").read_text())
+    assert [(item["stage"], item["errors"]) for item in exported["stages"]] == [("load_dataset", 0), ("model_call", 1)]
+
+
+def test_scrape_endpoint() -> None:
+    metrics = StageMetrics()
+    metrics.record("target", "FAKE", 0.1)
+
+    with serve_metrics(metrics, "127.0.0.1", 0) as server:
+        with urllib.request.urlopen(server.endpoint) as response:
+            text = response.read().decode()
+        with urllib.request.urlopen(server.endpoint + ".json") as response:
+            exported = json.loads(response.read())
+
+    assert 'stage="target",provider="FAKE"' in text
+    assert exported["stages"][0]["count"] == 1
+
+
+def test_load_metrics_config() -> None:
+    assert load_metrics_config(None) is None
+    assert load_metrics_config("metrics.prom") == {"path": "metrics.prom"}
+    assert load_metrics_config({"port": 9464}) == {"port": 9464}
+    with pytest.raises(ValueError, match="Invalid metrics config"):
+        load_metrics_config({"file": "metrics.prom"})  # type: ignore[typeddict-unknown-key]
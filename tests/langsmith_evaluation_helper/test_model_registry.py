@@ -0,0 +1,85 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import sys
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from langsmith_evaluation_helper.llm import model
+from langsmith_evaluation_helper.llm.model import ChatModelName, get_chat_model, register_chat_model_provider
+
+PROVIDER_MODULES = ["langchain_openai", "langchain_anthropic", "langchain_google_vertexai"]
+
+# Cumulative import time budget of the CLI entry point in microseconds.
+CLI_IMPORT_TIME_BUDGET_US = 500_000
+
+
+def run_python(code: str, *args: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.run([sys.executable, *args, "-c", code], capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Return the cumulative import time in microseconds of each module from `python -X importtime` output."""
+    cumulative: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module_name = line.removeprefix("import time:").split("|")
+        cumulative[module_name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def test_cli_cold_start_import_time() -> None:
+    result = run_python("import langsmith_evaluation_helper.cli", "-X", "importtime")
+    import_times = parse_importtime(result.stderr)
+
+    assert "langsmith_evaluation_helper.cli" in import_times
+    assert import_times["langsmith_evaluation_helper.cli"] < CLI_IMPORT_TIME_BUDGET_US
+    assert not [module_name for module_name in PROVIDER_MODULES if module_name in import_times]
+
+
+@pytest.mark.parametrize("module_name", ["langsmith_evaluation_helper.llm.model", "langsmith_evaluation_helper.loader"])
+def test_provider_integrations_are_not_imported_eagerly(module_name: str) -> None:
+    result = run_python(
+        f"import sys, {module_name}; print(','.join(m for m in {PROVIDER_MODULES!r} if m in sys.modules))"
+    )
+
+    assert result.stdout.strip() == ""
+
+
+def test_provider_integration_is_imported_on_first_use() -> None:
+    result = run_python(
+        "import sys\n"
+        "from langsmith_evaluation_helper.llm.model import ChatModelName, get_chat_model\n"
+        "get_chat_model(ChatModelName.GPT4O, api_key='sk-unit-test')\n"
+        f"print(','.join(m for m in {PROVIDER_MODULES!r} if m in sys.modules))"
+    )
+
+    assert result.stdout.strip() == "langchain_openai"
+
+
+def test_register_chat_model_provider(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(model, "_chat_model_factories", dict(model._chat_model_factories))
+    created: list[Any] = []
+
+    def factory(name: ChatModelName, **kwargs: Any) -> Any:
+        created.append((name, kwargs))
+        return mock.sentinel.chat_model
+
+    register_chat_model_provider([ChatModelName.GPT4O], factory)
+
+    assert get_chat_model(ChatModelName.GPT4O, temperature=0.5) is mock.sentinel.chat_model
+    assert created == [(ChatModelName.GPT4O, {"temperature": 0.5})]
+
+
+def test_azure_models_require_deployment() -> None:
+    with pytest.raises(ValueError, match="Invalid model name"):
+        get_chat_model(ChatModelName.AZURE_GPT4_32K, temperature=0)
+
+
+def test_every_model_name_has_a_provider() -> None:
+    assert set(model._chat_model_factories) == set(ChatModelName)
@@ -0,0 +1,62 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import json
+import os
+import pstats
+import time
+from pathlib import Path
+
+from langsmith_evaluation_helper.metrics import stage_metrics
+from langsmith_evaluation_helper.profiling import RunProfiler
+
+
+def busy_in_worker_thread() -> int:
+    return sum(index * index for index in range(200_000))
+
+
+def block_event_loop() -> None:
+    time.sleep(0.3)
+
+
+async def run() -> int:
+    with stage_metrics.timer("load_dataset"):
+        allocations = [bytearray(1024) for _ in range(100)]
+    result = await asyncio.to_thread(busy_in_worker_thread)
+    block_event_loop()
+    await asyncio.sleep(0.05)
+    return result + len(allocations)
+
+
+def test_run_profiler_writes_cpu_memory_and_stall_profiles(tmp_path: Path) -> None:
+    directory = tmp_path / "profile"
+    stage_metrics.reset()
+
+    with RunProfiler(str(directory), stall_threshold_ms=100, sample_interval_ms=1) as profiler:
+        asyncio.run(profiler.watch(run()))
+
+    assert sorted(os.listdir(directory)) == [
+        "cpu.folded",
+        "cpu.pstats",
+        "memory",
+        "memory.txt",
+        "stages.json",
+        "stalls.json",
+    ]
+    # The profile covers the event loop thread and the worker threads started during the run.
+    functions = {function for _, _, function in pstats.Stats(str(directory / "cpu.pstats")).stats}  # type: ignore[attr-defined]
+    assert {"run", "busy_in_worker_thread", "block_event_loop"} <= functions
+    folded = (directory / "cpu.folded").read_text()
+    assert "block_event_loop" in folded
+    assert all(not line.startswith("langsmith-evaluation-helper-profiler-") for line in folded.splitlines())
+
+    stalls = json.loads((directory / "stalls.json").read_text())
+    assert len(stalls) == 1
+    assert stalls[0]["duration_ms"] >= 200
+    assert any(frame.startswith("block_event_loop ") for frame in stalls[0]["stack"])
+
+    assert sorted(os.listdir(directory / "memory")) == ["00-load_dataset.snapshot", "01-end.snapshot"]
+    assert "## 00 load_dataset" in (directory / "memory.txt").read_text()
+    assert json.loads((directory / "stages.json").read_text())["stages"][0]["stage"] == "load_dataset"
@@ -0,0 +1,290 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest import mock
+
+import pytest
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName
+from langsmith_evaluation_helper.llm.rate_limit import (
+    AdaptiveConcurrencyLimiter,
+    RateLimiter,
+    TokenBucket,
+    get_rate_limiter,
+    is_rate_limit_error,
+)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_over_time() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, capacity=2, clock=clock)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(1.0)
+
+    clock.now = 1.0
+    assert bucket.try_acquire() == 0
+
+
+def test_token_bucket_lets_oversized_request_through_when_full() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, capacity=10, clock=clock)
+
+    assert bucket.try_acquire(25) == 0
+    assert bucket.tokens == -15
+    assert bucket.try_acquire(1) == pytest.approx(16.0)
+
+
+def test_adaptive_concurrency_increases_and_decreases() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=3)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    limiter.release()
+    limiter.release()
+    assert limiter.limit == pytest.approx(2.5 + 1 / 2.5)
+
+    for _ in range(10):
+        limiter.try_acquire()
+        limiter.release()
+    assert limiter.limit == 3
+
+    limiter.try_acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 1.5
+    limiter.try_acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 1
+
+
+def test_acquire_waits_for_a_released_slot() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=1, maximum=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def acquire() -> None:
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limiter.release()
+    assert acquired.wait(1)
+    thread.join()
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_acquire_async_is_woken_by_a_release_from_another_thread() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=1, maximum=1)
+    limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire_async())
+    await asyncio.sleep(0.05)
+    assert not waiter.done()
+
+    await asyncio.to_thread(limiter.release)
+    await asyncio.wait_for(waiter, 1)
+    assert limiter.in_flight == 1
+
+
+def test_rate_limiter_starts_at_max_concurrency() -> None:
+    assert RateLimiter(max_concurrency=16).concurrency.limit == 16
+    assert RateLimiter(initial_concurrency=4, max_concurrency=16).concurrency.limit == 4
+
+
+def test_is_rate_limit_error() -> None:
+    class StatusError(Exception):
+        status_code = 429
+
+    class Response:
+        status_code = 529
+
+    class ResponseError(Exception):
+        response = Response()
+
+    assert is_rate_limit_error(RateLimitError())
+    assert is_rate_limit_error(StatusError())
+    assert is_rate_limit_error(ResponseError())
+    # Messages are not matched: a prompt or an unrelated error can quote "429" or "rate limit".
+    assert not is_rate_limit_error(Exception("Error code: 429 - too many requests"))
+    assert not is_rate_limit_error(ValueError("invalid prompt"))
+
+
+def test_call_retries_rate_limit_errors() -> None:
+    limiter = RateLimiter(initial_concurrency=4, max_retries=3, initial_backoff=0)
+    calls = []
+
+    def func() -> str:
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimitError()
+        return "ok"
+
+    assert limiter.call(func) == "ok"
+    assert len(calls) == 3
+    assert limiter.rate_limited_count == 2
+    assert limiter.concurrency.limit < 4
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_call_gives_up_after_max_retries_and_does_not_retry_other_errors() -> None:
+    limiter = RateLimiter(max_retries=1, initial_backoff=0)
+
+    def rate_limited() -> None:
+        raise RateLimitError()
+
+    with pytest.raises(RateLimitError):
+        limiter.call(rate_limited)
+
+    calls = []
+
+    def failing() -> None:
+        calls.append(1)
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        limiter.call(failing)
+    assert len(calls) == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_call_caps_concurrency_across_threads() -> None:
+    limiter = RateLimiter(initial_concurrency=2, max_concurrency=2)
+    lock = threading.Lock()
+    state = {"current": 0, "peak": 0}
+
+    def func() -> None:
+        with lock:
+            state["current"] += 1
+            state["peak"] = max(state["peak"], state["current"])
+        time.sleep(0.01)
+        with lock:
+            state["current"] -= 1
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda _: limiter.call(func), range(12)))
+
+    assert state["peak"] == 2
+
+
+@pytest.mark.asyncio
+async def test_acall_paces_requests_per_minute() -> None:
+    limiter = RateLimiter(requests_per_minute=6000)
+    limiter.request_bucket = TokenBucket(rate_per_minute=6000, capacity=1)
+
+    async def func() -> str:
+        return "ok"
+
+    started = time.monotonic()
+    results = await asyncio.gather(*[limiter.acall(func) for _ in range(4)])
+
+    assert results == ["ok"] * 4
+    # One request is allowed immediately and the bucket refills one request every 10ms.
+    assert time.monotonic() - started >= 0.025
+
+
+@pytest.mark.asyncio
+async def test_acall_releases_the_slot_of_a_cancelled_call() -> None:
+    limiter = RateLimiter(max_concurrency=1)
+    started = asyncio.Event()
+
+    async def hang() -> str:
+        started.set()
+        await asyncio.sleep(60)
+        return "late"
+
+    async def func() -> str:
+        return "ok"
+
+    task = asyncio.ensure_future(limiter.acall(hang))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert limiter.concurrency.in_flight == 0
+    assert await asyncio.wait_for(limiter.acall(func), 1) == "ok"
+
+
+def test_call_releases_the_slot_on_keyboard_interrupt() -> None:
+    limiter = RateLimiter(max_concurrency=1)
+
+    def interrupted() -> None:
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        limiter.call(interrupted)
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_chat_model_disables_sdk_retries_with_a_rate_limiter() -> None:
+    with mock.patch("langsmith_evaluation_helper.llm.model.chat_model_pool") as pool:
+        limited = ChatModel(ChatModelName.GPT4O, rate_limiter=RateLimiter(), temperature=0)
+        ChatModel(ChatModelName.GPT4O, temperature=0)
+
+    assert pool.get.call_args_list == [
+        mock.call(ChatModelName.GPT4O, temperature=0, max_retries=0),
+        mock.call(ChatModelName.GPT4O, temperature=0),
+    ]
+    # The response cache key does not change with the client settings.
+    assert limited.kwargs == {"temperature": 0}
+
+
+def test_get_rate_limiter_is_shared_per_provider() -> None:
+    config: Any = {"requests_per_minute": 60}
+
+    assert get_rate_limiter("TEST_PROVIDER", None) is None
+    limiter = get_rate_limiter("TEST_PROVIDER", config)
+    assert limiter is not None
+    assert get_rate_limiter("TEST_PROVIDER", config) is limiter
+    assert get_rate_limiter("OTHER_TEST_PROVIDER", config) is not limiter
+
+
+@pytest.mark.asyncio
+async def test_chat_model_retries_through_rate_limiter() -> None:
+    fake_model = FakeListChatModel(responses=["sync", "async"])
+    prompt = PromptTemplate.from_template("Is this toxic? {text}")
+    limiter = RateLimiter(tokens_per_minute=100_000, initial_backoff=0)
+    original_invoke = FakeListChatModel.invoke
+    failures = [RateLimitError()]
+
+    def flaky_invoke(self: FakeListChatModel, *args: Any, **kwargs: Any) -> Any:
+        if failures:
+            raise failures.pop()
+        return original_invoke(self, *args, **kwargs)
+
+    with (
+        mock.patch.object(ChatModel, "get_model", return_value=fake_model),
+        mock.patch.object(FakeListChatModel, "invoke", flaky_invoke),
+    ):
+        llm = ChatModel(default_model_name=ChatModelName.GPT4O, temperature=0, rate_limiter=limiter)
+        assert llm.invoke(prompt, text="hello") == "sync"
+        assert await llm.async_invoke(prompt, text="hello") == "async"
+
+    assert limiter.rate_limited_count == 1
+    assert limiter.token_bucket is not None
+    assert limiter.token_bucket.tokens < 100_000
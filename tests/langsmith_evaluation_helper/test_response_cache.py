@@ -0,0 +1,108 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from langsmith_evaluation_helper.llm.cache import ResponseCache, ResponseCacheMissError, load_response_cache
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName
+
+
+@pytest.fixture
+def cache_path(tmp_path: Path) -> str:
+    return str(tmp_path / "cache.sqlite3")
+
+
+def test_cache_round_trip(cache_path: str) -> None:
+    cache = ResponseCache(path=cache_path)
+    key = ResponseCache.make_key("gpt-4o", {"temperature": 0}, "hello")
+
+    assert cache.get(key) is None
+    cache.put(key, "world")
+    assert cache.get(key) == "world"
+
+    # Persisted across connections
+    assert ResponseCache(path=cache_path).get(key) == "world"
+
+
+def test_cache_key_depends_on_model_settings() -> None:
+    assert ResponseCache.make_key("gpt-4o", {"temperature": 0}, "hello") != ResponseCache.make_key(
+        "gpt-4o", {"temperature": 0.7}, "hello"
+    )
+
+
+def test_cache_ttl_expiry(cache_path: str) -> None:
+    cache = ResponseCache(path=cache_path, ttl_seconds=10)
+    with mock.patch("langsmith_evaluation_helper.llm.cache.time.time", return_value=1000.0):
+        cache.put("key", "value")
+    with mock.patch("langsmith_evaluation_helper.llm.cache.time.time", return_value=1005.0):
+        assert cache.get("key") == "value"
+    with mock.patch("langsmith_evaluation_helper.llm.cache.time.time", return_value=1011.0):
+        assert cache.get("key") is None
+
+
+def test_cache_max_entries_eviction(cache_path: str) -> None:
+    cache = ResponseCache(path=cache_path, max_entries=2)
+    for index in range(3):
+        with mock.patch("langsmith_evaluation_helper.llm.cache.time.time", return_value=float(index)):
+            cache.put(f"key{index}", f"value{index}")
+
+    assert len(cache) == 2
+    assert cache.get("key0") is None
+    assert cache.get("key2") == "value2"
+
+
+def test_replay_mode_is_read_only(cache_path: str) -> None:
+    ResponseCache(path=cache_path).put("key", "value")
+    cache = ResponseCache(path=cache_path, mode="replay")
+
+    assert cache.lookup("key") == "value"
+    cache.put("other", "value")
+    assert cache.get("other") is None
+    with pytest.raises(ResponseCacheMissError):
+        cache.lookup("other")
+
+
+def test_load_response_cache(cache_path: str) -> None:
+    assert load_response_cache(None) is None
+    assert load_response_cache({"enabled": False, "path": cache_path}) is None
+
+    cache = load_response_cache({"path": cache_path, "mode": "replay"})
+    assert cache is not None
+    assert cache.read_only
+    assert load_response_cache({"path": cache_path, "mode": "replay"}) is cache
+
+    # Each config keeps its own eviction settings for the same file.
+    expiring = load_response_cache({"path": cache_path, "mode": "replay", "ttl_seconds": 60, "max_entries": 10})
+    assert expiring is not None and expiring is not cache
+    assert (expiring.ttl_seconds, expiring.max_entries) == (60, 10)
+    assert (cache.ttl_seconds, cache.max_entries) == (None, None)
+
+    with pytest.raises(ValueError, match="Invalid cache mode"):
+        load_response_cache({"path": cache_path, "mode": "write_only"})  # type: ignore[typeddict-item]
+
+
+@pytest.mark.asyncio
+async def test_chat_model_uses_cache(cache_path: str) -> None:
+    cache = ResponseCache(path=cache_path)
+    fake_model = FakeListChatModel(responses=["first", "second", "third"])
+    prompt = PromptTemplate.from_template("Is this toxic? {text}")
+
+    with mock.patch.object(ChatModel, "get_model", return_value=fake_model):
+        llm = ChatModel(default_model_name=ChatModelName.GPT4O, temperature=0, cache=cache)
+        assert llm.invoke(prompt, text="hello") == "first"
+        assert llm.invoke(prompt, text="hello") == "first"
+        assert await llm.async_invoke(prompt, text="hello") == "first"
+        assert await llm.async_invoke(prompt, text="bye") == "second"
+
+    replay = ChatModel(
+        default_model_name=ChatModelName.GPT4O, temperature=0, cache=ResponseCache(path=cache_path, mode="replay")
+    )
+    assert replay.invoke(prompt, text="bye") == "second"
+    with pytest.raises(ResponseCacheMissError):
+        replay.invoke(prompt, text="unseen")
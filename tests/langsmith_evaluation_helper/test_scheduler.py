@@ -0,0 +1,132 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+
+from langsmith_evaluation_helper.scheduler import ConcurrencyScheduler
+
+
+class InFlightCounter:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def enter(self) -> None:
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def exit(self) -> None:
+        with self.lock:
+            self.current -= 1
+
+
+@pytest.mark.asyncio
+async def test_global_budget_across_async_providers() -> None:
+    scheduler = ConcurrencyScheduler(asyncio.get_running_loop(), max_concurrency=3)
+    counter = InFlightCounter()
+
+    async def target(inputs: dict[str, Any]) -> dict[str, Any]:
+        counter.enter()
+        await asyncio.sleep(0.01)
+        counter.exit()
+        return inputs
+
+    wrapped = [scheduler.wrap(provider_id, target) for provider_id in ("A", "B", "C")]
+    results = await asyncio.gather(*[func({"index": index}) for func in wrapped for index in range(10)])
+
+    assert len(results) == 30
+    assert counter.peak == 3
+    assert scheduler.peak_in_flight == 3
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_provider_limit() -> None:
+    scheduler = ConcurrencyScheduler(asyncio.get_running_loop(), max_concurrency=10, provider_limits={"A": 1})
+    counters = {"A": InFlightCounter(), "B": InFlightCounter()}
+
+    def make_target(provider_id: str) -> Any:
+        async def target(inputs: dict[str, Any]) -> None:
+            counters[provider_id].enter()
+            await asyncio.sleep(0.01)
+            counters[provider_id].exit()
+
+        return target
+
+    await asyncio.gather(*[
+        scheduler.wrap(provider_id, make_target(provider_id))({}) for provider_id in ("A", "B") for _ in range(5)
+    ])
+
+    assert counters["A"].peak == 1
+    assert counters["B"].peak == 5
+
+
+@pytest.mark.asyncio
+async def test_sync_and_async_targets_share_budget() -> None:
+    scheduler = ConcurrencyScheduler(asyncio.get_running_loop(), max_concurrency=2)
+    counter = InFlightCounter()
+
+    def sync_target(inputs: dict[str, Any]) -> str:
+        counter.enter()
+        time.sleep(0.01)
+        counter.exit()
+        return "sync"
+
+    async def async_target(inputs: dict[str, Any]) -> str:
+        counter.enter()
+        await asyncio.sleep(0.01)
+        counter.exit()
+        return "async"
+
+    wrapped_sync = scheduler.wrap("sync", sync_target)
+    wrapped_async = scheduler.wrap("async", async_target)
+
+    def run_sync_provider() -> list[str]:
+        # Mimics `evaluate`, which calls the target from its own worker threads.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return list(executor.map(wrapped_sync, [{}] * 8))
+
+    sync_results, *async_results = await asyncio.gather(
+        asyncio.to_thread(run_sync_provider), *[wrapped_async({}) for _ in range(8)]
+    )
+
+    assert sync_results == ["sync"] * 8
+    assert async_results == ["async"] * 8
+    assert counter.peak <= 2
+    assert scheduler.in_flight == 0
+    assert wrapped_sync.__name__ == "sync_target"
+
+
+@pytest.mark.asyncio
+async def test_release_on_error() -> None:
+    scheduler = ConcurrencyScheduler(asyncio.get_running_loop(), max_concurrency=1)
+
+    async def failing(inputs: dict[str, Any]) -> None:
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await scheduler.wrap("A", failing)({})
+    assert scheduler.in_flight == 0
+    await asyncio.wait_for(scheduler.acquire("A"), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_from_config() -> None:
+    config = {
+        "providers": [{"id": "A", "config": {"max_concurrency": 2}}, {"id": "B"}],
+        "tests": {"max_total_concurrency": 3},
+    }
+
+    scheduler = ConcurrencyScheduler.from_config(config, asyncio.get_running_loop())
+
+    assert scheduler.max_concurrency == 3
+    assert scheduler.provider_limits == {"A": 2, "B": None}
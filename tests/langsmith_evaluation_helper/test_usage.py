@@ -0,0 +1,139 @@
+# Copyright 2024 Gaudiy Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from unittest import mock
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.prompts import PromptTemplate
+from langsmith.run_helpers import tracing_context
+from langsmith.run_trees import RunTree
+
+from langsmith_evaluation_helper.llm.model import ChatModel, ChatModelName, chat_model_pool
+from langsmith_evaluation_helper.llm.rate_limit import RateLimiter
+from langsmith_evaluation_helper.llm.usage import (
+    UsageTracker,
+    get_usage_tracker,
+    reset_usage_trackers,
+    result_usage,
+    runs_usage,
+)
+from langsmith_evaluation_helper.load_run_function import create_chat_model
+from langsmith_evaluation_helper.loader import record_experiment_usage
+
+PROMPT = PromptTemplate.from_template("Is {text} toxic?")
+
+
+@pytest.fixture(autouse=True)
+def clear_state() -> None:
+    chat_model_pool.clear()
+    reset_usage_trackers()
+
+
+def test_result_usage_shapes() -> None:
+    def result(message: AIMessage, llm_output: dict | None = None) -> LLMResult:  # type: ignore[type-arg]
+        return LLMResult(generations=[[ChatGeneration(message=message)]], llm_output=llm_output)
+
+    usage_metadata = AIMessage(content="a", usage_metadata={"input_tokens": 3, "output_tokens": 2, "total_tokens": 5})
+    openai_metadata = AIMessage(
+        content="a", response_metadata={"token_usage": {"prompt_tokens": 4, "completion_tokens": 1}}
+    )
+
+    assert result_usage(result(usage_metadata)) == {"input_tokens": 3, "output_tokens": 2, "total_tokens": 5}
+    assert result_usage(result(openai_metadata)) == {"input_tokens": 4, "output_tokens": 1, "total_tokens": 5}
+    assert result_usage(result(AIMessage(content="a"), {"usage": {"input_tokens": 7, "output_tokens": 3}})) == {
+        "input_tokens": 7,
+        "output_tokens": 3,
+        "total_tokens": 10,
+    }
+    assert result_usage(result(AIMessage(content="a"))) is None
+
+
+@pytest.mark.asyncio
+async def test_chat_model_records_usage_without_changing_the_output() -> None:
+    tracker = UsageTracker(pricing={"input": 3.0, "output": 15.0})
+    model = ChatModel(
+        ChatModelName.FAKE, fake={"input_tokens": 100, "output_tokens": 20, "latency_ms": 10}, usage_tracker=tracker
+    )
+
+    assert model.invoke(PROMPT, text="a") == "Is a toxic?"
+    assert await model.async_invoke(PROMPT, text="b") == "Is b toxic?"
+
+    summary = tracker.summary()
+    assert (summary["calls"], summary["input_tokens"], summary["output_tokens"], summary["total_tokens"]) == (
+        2,
+        200,
+        40,
+        240,
+    )
+    assert summary["estimated_cost"] == pytest.approx((200 * 3.0 + 40 * 15.0) / 1_000_000)
+    # About 20 output tokens per 10 ms call.
+    assert 500 < summary["output_tokens_per_second"] < 2000  # type: ignore[operator]
+
+
+def test_failed_attempts_are_not_counted() -> None:
+    tracker = UsageTracker()
+    model = ChatModel(
+        ChatModelName.FAKE,
+        fake={"rate_limit_rate": 0.5, "output_tokens": 1},
+        rate_limiter=RateLimiter(max_retries=20, initial_backoff=0),
+        usage_tracker=tracker,
+    )
+
+    for index in range(10):
+        model.invoke(PROMPT, text=str(index))
+
+    assert tracker.summary()["calls"] == 10
+    assert tracker.summary()["output_tokens"] == 10
+
+
+def test_usage_is_added_to_the_target_run() -> None:
+    model = create_chat_model({"id": "FAKE", "config": {"fake": {"input_tokens": 5, "output_tokens": 2}}})
+    root = RunTree(name="target", run_type="chain")
+    child = root.create_child(name="execute_prompt", run_type="chain")
+
+    # Tracing is disabled so nothing is sent; the parent run tree is still current.
+    with tracing_context(parent=child, enabled=False):
+        model.invoke(PROMPT, text="a")
+        model.invoke(PROMPT, text="b")
+
+    assert root.extra["metadata"]["usage"] == {"input_tokens": 10, "output_tokens": 4, "total_tokens": 14}
+    assert root.extra["metadata"]["model_calls"] == 2
+    assert get_usage_tracker("FAKE").summary()["calls"] == 2
+
+
+def test_runs_usage_sums_the_usage_of_the_target_runs() -> None:
+    metadata = {"usage": {"input_tokens": 10, "output_tokens": 4, "total_tokens": 14}, "model_calls": 2}
+    runs = [
+        mock.MagicMock(extra={"metadata": {**metadata, "model_seconds": 1.0}}),
+        mock.MagicMock(extra={"metadata": {**metadata, "model_seconds": 1.0}}),
+        # Custom runs and cached responses do not record usage.
+        mock.MagicMock(extra={"metadata": {}}),
+        mock.MagicMock(extra=None),
+    ]
+
+    usage = runs_usage(runs, {"input": 1.0, "output": 2.0})
+
+    assert (usage["calls"], usage["input_tokens"], usage["output_tokens"], usage["total_tokens"]) == (4, 20, 8, 28)
+    assert usage["output_tokens_per_second"] == 4.0
+    assert usage["estimated_cost"] == pytest.approx(36 / 1_000_000)
+
+
+def test_record_experiment_usage_keeps_metadata() -> None:
+    client = mock.MagicMock()
+    experiment = client.read_project.return_value
+    experiment.description = "Toxicity prompts"
+    experiment.extra = {"metadata": {"prompt_version": "1"}, "tags": ["nightly"]}
+    usage = UsageTracker().summary()
+
+    record_experiment_usage(client, "experiment-id", usage)
+
+    client.update_project.assert_called_once_with(
+        "experiment-id",
+        description="Toxicity prompts",
+        metadata={"prompt_version": "1", "usage": usage},
+        project_extra={"metadata": {"prompt_version": "1"}, "tags": ["nightly"]},
+        end_time=experiment.end_time,
+    )